@@ -0,0 +1,158 @@
+"""Benchmark of the memory allocated per frame by the frame analysis."""
+import argparse
+import json
+import tracemalloc
+from time import perf_counter
+from typing import Final
+import numpy as np
+from app.benchmarks.backend_validation import load_reference_set
+from app.emotions_measurer.face_detectors import (
+    get_face_detector,
+    DEFAULT_FACE_DETECTOR,
+)
+from app.emotions_measurer.frame_analyzer import FrameAnalyzer
+from app.emotions_measurer.inference_backends import (
+    get_inference_backend,
+    DEFAULT_INFERENCE_BACKEND,
+)
+from app.emotions_measurer.preprocessing import PreprocessingContext
+
+
+WARM_UP_FRAMES: Final[int] = 3
+
+
+def run_analysis(
+        detector_name: str,
+        backend_name: str,
+        frames: list[np.ndarray],
+        reuse_buffers: bool,
+) -> dict:
+    """
+    Analyze every frame and measure the allocations of each one.
+
+    With reused buffers, one preprocessing context is kept for all frames,
+    as the workers do, otherwise a new context is made for every frame,
+    so that its allocations are those of the preprocessing without reuse.
+    Buffer allocations are counted exactly by the contexts, allocated bytes
+    are the peak of the memory traced by tracemalloc above the memory
+    in use before the frame, which includes the detector and the backend.
+    """
+    detector = get_face_detector(detector_name)
+    backend = get_inference_backend(backend_name)
+    context = PreprocessingContext()
+    for frame in frames[:WARM_UP_FRAMES]:
+        FrameAnalyzer.analyze_frame(frame, detector, None, backend, context)
+    buffer_allocations = list()
+    allocated_bytes = list()
+    seconds = 0.0
+    tracemalloc.start()
+    try:
+        for frame in frames:
+            if not reuse_buffers:
+                context = PreprocessingContext()
+            allocations = context.allocations
+            tracemalloc.reset_peak()
+            in_use, _ = tracemalloc.get_traced_memory()
+            start = perf_counter()
+            FrameAnalyzer.analyze_frame(frame, detector, None, backend, context)
+            seconds += perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            buffer_allocations.append(context.allocations - allocations)
+            allocated_bytes.append(peak - in_use)
+    finally:
+        tracemalloc.stop()
+    return {
+        'detector': detector_name,
+        'backend': backend_name,
+        'reuse_buffers': reuse_buffers,
+        'frames_per_second': len(frames) / seconds if seconds > 0 else 0.0,
+        'buffer_allocations_per_frame': float(np.mean(buffer_allocations))
+        if frames else 0.0,
+        'max_buffer_allocations': int(max(buffer_allocations, default=0)),
+        'mean_allocated_bytes': float(np.mean(allocated_bytes))
+        if frames else 0.0,
+        'max_allocated_bytes': int(max(allocated_bytes, default=0)),
+    }
+
+
+def run_allocation_benchmarks(
+        frames: list[np.ndarray],
+        detector_name: str = DEFAULT_FACE_DETECTOR,
+        backend_name: str = DEFAULT_INFERENCE_BACKEND,
+) -> dict:
+    """
+    Run the analysis with and without reused buffers.
+
+    The buffers are verified to be reused if, after the warm-up,
+    no frame of the same size allocates a buffer of the context.
+    Buffers may still grow if later crops are larger than all before.
+    """
+    same_size = [
+        frame for frame in frames
+        if frame.shape == frames[0].shape
+    ]
+    runs = [
+        run_analysis(detector_name, backend_name, same_size, True),
+        run_analysis(detector_name, backend_name, same_size, False),
+    ]
+    return {
+        'frames': len(same_size),
+        'buffers_reused': runs[0]['max_buffer_allocations'] == 0,
+        'runs': runs,
+    }
+
+
+class CommandLine:
+    def __init__(self) -> None:
+        parser = argparse.ArgumentParser(description='Frame allocation benchmark')
+        parser.add_argument(
+            '-i',
+            '--input',
+            help = 'Provide a video or a folder of images as reference set',
+            required = True,
+        )
+        parser.add_argument(
+            '-d',
+            '--detector',
+            help = 'Provide the face detector to benchmark',
+            required = False,
+            default = DEFAULT_FACE_DETECTOR,
+        )
+        parser.add_argument(
+            '-b',
+            '--backend',
+            help = 'Provide the inference backend to benchmark',
+            required = False,
+            default = DEFAULT_INFERENCE_BACKEND,
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help = 'Provide the file to save the results to',
+            required = False,
+            default = 'allocation_benchmark.json',
+        )
+        argument = parser.parse_args()
+        frames = load_reference_set(argument.input)
+        print(f'[INFO] Loaded {len(frames)} reference frames.')
+        results = run_allocation_benchmarks(
+            frames,
+            argument.detector,
+            argument.backend,
+        )
+        with open(argument.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        for run in results['runs']:
+            print(
+                f'[INFO] {"Reused" if run["reuse_buffers"] else "New"} buffers: '
+                f'{run["buffer_allocations_per_frame"]:.2f} buffer allocations '
+                f'and {run["mean_allocated_bytes"] / 1024:.1f} KiB per frame, '
+                f'{run["frames_per_second"]:.2f} frames/s.'
+            )
+        if not results['buffers_reused']:
+            print('[INFO] Buffers grew after the warm-up for larger crops.')
+        print(f'[INFO] Results are saved to {argument.output}.')
+
+
+if __name__ == '__main__':
+    app = CommandLine()
@@ -0,0 +1,367 @@
+"""Load test of the FastAPI service against local stand-ins of its dependencies."""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from typing import Final, Optional, Tuple
+import numpy as np
+from app.data_models.models import Emotions
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.analysis_artifact import AnalysisArtifact
+from app.utils.instrumentation import StageTimings
+from app.utils.temporal_smoothing import emotion_occurances
+
+
+SERVICE_DIRECTORY: Final[str] = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'fast_api_addin',
+)
+BUCKET: Final[str] = 'load-test'
+VIDEO_KEY: Final[str] = 'video.mp4'
+API_PORT: Final[int] = 8765
+S3_PORT: Final[int] = 5765
+CONCURRENCY: Final[int] = 16
+DURATION_SECONDS: Final[float] = 30.0
+WRITE_RATIO: Final[float] = 0.1
+ANALYSIS_SECONDS: Final[float] = 0.05
+ANALYSIS_FRAMES: Final[int] = 250
+SEED_REPORTS: Final[int] = 20
+REQUEST_TIMEOUT: Final[float] = 60.0
+PERCENTILES: Final[Tuple[float, ...]] = (50.0, 90.0, 99.0)
+
+
+class StubMeasurer:
+    """
+    Stand-in of EmotionsMeasurer for the load test.
+
+    The analysis sleeps for the given time and produces random scores,
+    so the service is measured without the models and the video.
+    """
+
+    analysis_seconds: float = ANALYSIS_SECONDS
+
+    def __init__(self, input_path: str, thread_amount, mode, **kwargs) -> None:
+        self._frames_amount = ANALYSIS_FRAMES
+        self._emotions_occurances: dict[Emotions, int] = dict()
+        self._looked_away = 0
+        self._coordinates: list[Tuple[int, float]] = list()
+        self._best_performance: dict[Emotions, list[bytes]] = dict()
+        self._scores = np.full(
+            (self._frames_amount, len(EMOTION_LABELS)),
+            np.nan,
+            dtype=np.float32,
+        )
+        self._stage_timings = StageTimings()
+
+    def analyse_prepared_video(self) -> None:
+        sleep(self.analysis_seconds)
+        generator = np.random.default_rng()
+        faces = generator.random(self._frames_amount) > 0.2
+        self._scores[faces] = generator.dirichlet(
+            np.ones(len(EMOTION_LABELS)),
+            int(faces.sum()),
+        ) * 100
+        self._emotions_occurances = emotion_occurances(self._scores)
+        self._looked_away = int((~faces).sum())
+        self._stage_timings.increment('frames', self._frames_amount)
+
+    def analysis_artifact(self) -> AnalysisArtifact:
+        return AnalysisArtifact(
+            self._emotions_occurances,
+            self._looked_away,
+            self._frames_amount,
+            self._coordinates,
+            self._best_performance,
+            self._scores,
+        )
+
+
+def start_service(
+        directory: str,
+        api_port: int = API_PORT,
+        s3_port: int = S3_PORT,
+        database_url: Optional[str] = None,
+):
+    """
+    Start the S3 stand-in and the service in this process, return the S3 server.
+
+    S3 is served by moto, the database is SQLite in the directory unless
+    another URL is given, and the analyzer is StubMeasurer. The service
+    works in the directory, where it keeps the videos and the reports.
+    """
+    from moto.server import ThreadedMotoServer
+    import uvicorn
+    s3_server = ThreadedMotoServer(ip_address='127.0.0.1', port=s3_port)
+    s3_server.start()
+    os.chdir(directory)
+    os.environ['DATABASE_URL'] = database_url or \
+        f'sqlite:///{os.path.join(directory, "load_test.db")}'
+    sys.path.insert(0, SERVICE_DIRECTORY)
+    import main
+    main.EmotionsMeasurer = StubMeasurer
+    server = uvicorn.Server(uvicorn.Config(
+        main.app,
+        host='127.0.0.1',
+        port=api_port,
+        log_level='warning',
+    ))
+    Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        sleep(0.05)
+    return s3_server
+
+
+def s3_credentials(s3_port: int = S3_PORT) -> dict:
+    return {
+        'region': 'us-east-1',
+        'endpoint_url': f'http://127.0.0.1:{s3_port}',
+        'aws_access_key_id': 'load-test',
+        'aws_secret_access_key': 'load-test',
+        'bucket_name': BUCKET,
+        'key_name': VIDEO_KEY,
+        'report_format': 'html',
+    }
+
+
+def upload_video(credentials: dict) -> None:
+    """Put a small object in place of the video, the stub does not decode it."""
+    import boto3
+    client = boto3.client(
+        's3',
+        region_name=credentials['region'],
+        endpoint_url=credentials['endpoint_url'],
+        aws_access_key_id=credentials['aws_access_key_id'],
+        aws_secret_access_key=credentials['aws_secret_access_key'],
+    )
+    client.create_bucket(Bucket=BUCKET)
+    client.put_object(Bucket=BUCKET, Key=VIDEO_KEY, Body=os.urandom(1024 * 1024))
+
+
+def call(base_url: str, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, bytes]:
+    """Send the request, return the status and the content, status 0 if it failed."""
+    request = urllib.request.Request(
+        base_url + path,
+        data=json.dumps(body).encode('utf-8') if body is not None else None,
+        headers={'Content-Type': 'application/json'},
+        method=method,
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as ex:
+        return ex.code, ex.read()
+    except OSError as ex:
+        return 0, str(ex).encode('utf-8')
+
+
+def failed(status: int) -> bool:
+    return not 200 <= status < 300
+
+
+class LoadRecorder:
+    """Latencies and errors of the requests per endpoint."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._latencies: dict[str, list[float]] = dict()
+        self._errors: dict[str, int] = dict()
+        self.report_ids: list[int] = list()
+
+    def record(self, endpoint: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            self._latencies.setdefault(endpoint, list()).append(seconds)
+            self._errors[endpoint] = self._errors.get(endpoint, 0) + int(error)
+
+    def reset(self) -> None:
+        """Forget the requests, keep the known reports."""
+        with self._lock:
+            self._latencies.clear()
+            self._errors.clear()
+
+    def add_report(self, report_id: int) -> None:
+        with self._lock:
+            self.report_ids.append(report_id)
+
+    def summary(self, seconds: float) -> dict:
+        """Throughput, latency percentiles in milliseconds and error rates."""
+        endpoints = dict()
+        with self._lock:
+            every = [latency for latencies in self._latencies.values() for latency in latencies]
+            for endpoint, latencies in sorted(self._latencies.items()):
+                endpoints[endpoint] = self._statistics(
+                    latencies,
+                    self._errors[endpoint],
+                    seconds,
+                )
+            overall = self._statistics(every, sum(self._errors.values()), seconds)
+        return {'seconds': seconds, 'overall': overall, 'endpoints': endpoints}
+
+    @staticmethod
+    def _statistics(latencies: list[float], errors: int, seconds: float) -> dict:
+        milliseconds = np.array(latencies) * 1000
+        statistics = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': errors / len(latencies) if latencies else 0.0,
+            'requests_per_second': len(latencies) / seconds if seconds > 0 else 0.0,
+            'max_ms': float(milliseconds.max()) if latencies else 0.0,
+        }
+        for percentile in PERCENTILES:
+            statistics[f'p{percentile:g}_ms'] = float(
+                np.percentile(milliseconds, percentile)
+            ) if latencies else 0.0
+        return statistics
+
+
+def request_report(base_url: str, credentials: dict, recorder: LoadRecorder) -> None:
+    start = perf_counter()
+    status, content = call(base_url, 'POST', '/requestReport/', credentials)
+    recorder.record('requestReport', perf_counter() - start, failed(status))
+    if status == 200:
+        recorder.add_report(int(content))
+
+
+def read_report(base_url: str, recorder: LoadRecorder, generator: random.Random) -> None:
+    if recorder.report_ids and generator.random() < 0.5:
+        report_id = generator.choice(recorder.report_ids)
+        start = perf_counter()
+        status, _ = call(base_url, 'GET', f'/getReportResult/{report_id}/')
+        recorder.record('getReportResult', perf_counter() - start, failed(status))
+        return
+    start = perf_counter()
+    status, _ = call(base_url, 'GET', '/getReportResults/')
+    recorder.record('getReportResults', perf_counter() - start, failed(status))
+
+
+def run_load(
+        base_url: str,
+        credentials: dict,
+        concurrency: int = CONCURRENCY,
+        duration: float = DURATION_SECONDS,
+        write_ratio: float = WRITE_RATIO,
+        seed_reports: int = SEED_REPORTS,
+) -> dict:
+    """
+    Drive the mixed workload and summarize it.
+
+    Reports are requested first, so that the reads find rows.
+    Then each of the concurrent clients sends requests one after another
+    until the duration passes, requesting a report with the write ratio
+    and reading the results otherwise.
+    """
+    recorder = LoadRecorder()
+    for _ in range(seed_reports):
+        request_report(base_url, credentials, recorder)
+    recorder.reset()
+    deadline = perf_counter() + duration
+
+    def client(number: int) -> None:
+        generator = random.Random(number)
+        while perf_counter() < deadline:
+            if generator.random() < write_ratio:
+                request_report(base_url, credentials, recorder)
+            else:
+                read_report(base_url, recorder, generator)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    return recorder.summary(perf_counter() - start)
+
+
+class CommandLine:
+    def __init__(self) -> None:
+        parser = argparse.ArgumentParser(description='API load test')
+        parser.add_argument(
+            '-c',
+            '--concurrency',
+            help = f'Provide the amount of concurrent clients, {CONCURRENCY} by default',
+            required = False,
+            type = int,
+            default = CONCURRENCY,
+        )
+        parser.add_argument(
+            '-d',
+            '--duration',
+            help = f'Provide the duration of the load in seconds, {DURATION_SECONDS:g} by default',
+            required = False,
+            type = float,
+            default = DURATION_SECONDS,
+        )
+        parser.add_argument(
+            '-r',
+            '--writeRatio',
+            help = f'Provide the share of report requests among all requests, {WRITE_RATIO:g} by default',
+            required = False,
+            type = float,
+            default = WRITE_RATIO,
+        )
+        parser.add_argument(
+            '-a',
+            '--analysisSeconds',
+            help = f'Provide the time the stub analysis takes, {ANALYSIS_SECONDS:g} by default',
+            required = False,
+            type = float,
+            default = ANALYSIS_SECONDS,
+        )
+        parser.add_argument(
+            '-D',
+            '--database',
+            help = 'Provide the database URL, SQLite in a temporary folder by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help = 'Provide the file to save the results to',
+            required = False,
+            default = 'api_load_test.json',
+        )
+        argument = parser.parse_args()
+        output = os.path.abspath(argument.output)
+        StubMeasurer.analysis_seconds = argument.analysisSeconds
+        directory = tempfile.mkdtemp(prefix='api_load_test')
+        s3_server = start_service(directory, database_url=argument.database or None)
+        try:
+            credentials = s3_credentials()
+            upload_video(credentials)
+            print(
+                f'[INFO] Running {argument.concurrency} clients '
+                f'for {argument.duration:g} s.'
+            )
+            results = run_load(
+                f'http://127.0.0.1:{API_PORT}',
+                credentials,
+                argument.concurrency,
+                argument.duration,
+                argument.writeRatio,
+            )
+        finally:
+            s3_server.stop()
+        results['configuration'] = {
+            'concurrency': argument.concurrency,
+            'duration': argument.duration,
+            'write_ratio': argument.writeRatio,
+            'analysis_seconds': argument.analysisSeconds,
+        }
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+        for endpoint, statistics in results['endpoints'].items():
+            print(
+                f'[INFO] {endpoint}: {statistics["requests_per_second"]:.1f} requests/s, '
+                f'p50 {statistics["p50_ms"]:.1f} ms, p99 {statistics["p99_ms"]:.1f} ms, '
+                f'{statistics["error_rate"] * 100:.2f}% errors.'
+            )
+        print(f'[INFO] Results are saved to {output}.')
+
+
+if __name__ == '__main__':
+    app = CommandLine()
@@ -0,0 +1,169 @@
+"""Validation of inference backends against DeepFace on a reference set."""
+import argparse
+import json
+import os
+from multiprocessing.pool import Pool
+from time import perf_counter
+from typing import Final
+import cv2
+import numpy as np
+from app.emotions_measurer.inference_backends import (
+    get_inference_backend,
+    export_deepface_emotion_model,
+    EMOTION_LABELS,
+    ONNX_MODEL_ENVIRONMENT_VARIABLE,
+    INFERENCE_BACKENDS,
+)
+from app.utils.resources import get_process_peak_rss_bytes
+
+
+REFERENCE_FRAMES: Final[int] = 200
+WARM_UP_FRAMES: Final[int] = 3
+IMAGE_EXTENSIONS: Final[tuple[str, ...]] = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_reference_set(path: str, amount: int = REFERENCE_FRAMES) -> list[np.ndarray]:
+    """Read the images of the folder, or evenly spaced frames of the video."""
+    if os.path.isdir(path):
+        return [
+            cv2.imread(os.path.join(path, filename))
+            for filename in sorted(os.listdir(path))
+            if filename.lower().endswith(IMAGE_EXTENSIONS)
+        ][:amount]
+    capture = cv2.VideoCapture(path)
+    frames_amount = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = max(1, frames_amount // amount)
+    frames = list()
+    for i in range(0, frames_amount, step):
+        capture.set(cv2.CAP_PROP_POS_FRAMES, i)
+        return_code, frame = capture.read()
+        if not return_code:
+            break
+        frames.append(frame)
+        if len(frames) == amount:
+            break
+    capture.release()
+    return frames
+
+
+def run_backend(backend_name: str, frames: list[np.ndarray]) -> dict:
+    """
+    Classify the reference set with the backend in the current process.
+
+    The function is run in a fresh process per backend,
+    so the peak memory reflects only that backend.
+    """
+    load_start = perf_counter()
+    backend = get_inference_backend(backend_name)
+    load_seconds = perf_counter() - load_start
+    for frame in frames[:WARM_UP_FRAMES]:
+        backend.analyze(frame, enforce_detection=False)
+    scores = np.zeros((len(frames), len(EMOTION_LABELS)), dtype=np.float32)
+    start = perf_counter()
+    for i, frame in enumerate(frames):
+        reports = backend.analyze(frame, enforce_detection=False)
+        if reports:
+            scores[i] = [
+                reports[0]['emotion'][str(label)] for label in EMOTION_LABELS
+            ]
+    seconds = perf_counter() - start
+    return {
+        'backend': backend_name,
+        'load_seconds': load_seconds,
+        'frames_per_second': len(frames) / seconds if seconds > 0 else 0.0,
+        'peak_rss_bytes': get_process_peak_rss_bytes(),
+        'scores': scores,
+    }
+
+
+def validate_backend(
+        frames: list[np.ndarray],
+        backend_name: str,
+        reference_name: str = 'deepface',
+) -> dict:
+    """
+    Compare the backend with the reference backend.
+
+    Agreement of the dominant emotions and the difference of the
+    emotion percentages are reported along with the speed and memory
+    of both backends, each measured in its own process.
+    """
+    measurements = dict()
+    for name in (reference_name, backend_name):
+        with Pool(processes=1) as pool:
+            measurements[name] = pool.apply(run_backend, (name, frames))
+    reference = measurements[reference_name].pop('scores')
+    candidate = measurements[backend_name].pop('scores')
+    difference = np.abs(reference - candidate)
+    return {
+        'frames': len(frames),
+        'dominant_agreement': float(
+            np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1))
+        ) if len(frames) else 0.0,
+        'mean_absolute_difference': float(difference.mean()) if len(frames) else 0.0,
+        'max_absolute_difference': float(difference.max()) if len(frames) else 0.0,
+        'backends': measurements,
+    }
+
+
+class CommandLine:
+    def __init__(self) -> None:
+        parser = argparse.ArgumentParser(description='Inference backend validation')
+        parser.add_argument(
+            '-i',
+            '--input',
+            help = 'Provide a video or a folder of images as reference set',
+            required = True,
+        )
+        parser.add_argument(
+            '-e',
+            '--export',
+            help = 'Export the DeepFace emotion model to the given ONNX file first',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-q',
+            '--quantize',
+            help = 'Quantize the exported model to int8 and validate that one',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-b',
+            '--backend',
+            help = 'Provide the backend to validate',
+            required = False,
+            default = 'onnx',
+            choices = INFERENCE_BACKENDS,
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help = 'Provide the file to save the results to',
+            required = False,
+            default = 'backend_validation.json',
+        )
+        argument = parser.parse_args()
+        if argument.export:
+            model_path = export_deepface_emotion_model(
+                argument.export,
+                argument.quantize,
+            )
+            os.environ[ONNX_MODEL_ENVIRONMENT_VARIABLE] = model_path
+            print(f'[INFO] Exported the emotion model to {model_path}.')
+        frames = load_reference_set(argument.input)
+        print(f'[INFO] Loaded {len(frames)} reference frames.')
+        results = validate_backend(frames, argument.backend)
+        with open(argument.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(
+            f'[INFO] Dominant emotion agreement: '
+            f'{round(results["dominant_agreement"] * 100, 2)}%, mean difference: '
+            f'{round(results["mean_absolute_difference"], 2)} percentage points.'
+        )
+        print(f'[INFO] Results are saved to {argument.output}.')
+
+
+if __name__ == '__main__':
+    app = CommandLine()
@@ -0,0 +1,125 @@
+"""Benchmark of the face detectors on a reference set."""
+import argparse
+import json
+import os
+from time import perf_counter
+from typing import Final
+import numpy as np
+from app.benchmarks.backend_validation import load_reference_set
+from app.emotions_measurer.face_detectors import (
+    get_face_detector,
+    DETECTION_MAX_SIDE_ENVIRONMENT_VARIABLE,
+    FACE_DETECTORS,
+)
+from app.utils.instrumentation import StageTimings
+
+
+WARM_UP_FRAMES: Final[int] = 3
+MAX_SIDES: Final[tuple[int, ...]] = (320, 640, 1280)
+
+
+def run_detector(detector_name: str, frames: list[np.ndarray]) -> dict:
+    """Detect the region of interest on every frame and collect timings."""
+    detector = get_face_detector(detector_name)
+    for frame in frames[:WARM_UP_FRAMES]:
+        detector.detect(frame)
+    timings = StageTimings()
+    detected = np.zeros(len(frames), dtype=bool)
+    areas = list()
+    start = perf_counter()
+    for i, frame in enumerate(frames):
+        detection = detector.detect(frame, timings)
+        if detection.region is not None:
+            detected[i] = True
+            _, _, width, height = detection.region
+            areas.append(width * height / (frame.shape[0] * frame.shape[1]))
+    seconds = perf_counter() - start
+    return {
+        'detector': detector_name,
+        'frames_per_second': len(frames) / seconds if seconds > 0 else 0.0,
+        'detection_rate': float(detected.mean()) if len(frames) else 0.0,
+        'mean_region_fraction': float(np.mean(areas)) if areas else 0.0,
+        'stages': timings.as_dict(),
+        'detected': detected,
+    }
+
+
+def run_detector_benchmarks(
+        frames: list[np.ndarray],
+        detector_names: tuple[str, ...] = FACE_DETECTORS,
+        max_sides: tuple[int, ...] = MAX_SIDES,
+) -> dict:
+    """
+    Run every detector on the frames.
+
+    YuNet is run once per maximal side of the frame, so that
+    the accuracy lost by downscaling can be weighed against the speed.
+    Agreement is the share of frames on which the detector found
+    a region whenever the first detector did and vice versa.
+    """
+    runs = list()
+    for name in detector_names:
+        if name != 'yunet':
+            runs.append(run_detector(name, frames))
+            continue
+        for max_side in max_sides:
+            os.environ[DETECTION_MAX_SIDE_ENVIRONMENT_VARIABLE] = str(max_side)
+            run = run_detector(name, frames)
+            run['max_side'] = max_side
+            runs.append(run)
+        os.environ.pop(DETECTION_MAX_SIDE_ENVIRONMENT_VARIABLE)
+    if runs:
+        reference = runs[0]['detected']
+        for run in runs:
+            run['agreement'] = float(
+                np.mean(run['detected'] == reference)
+            ) if len(frames) else 0.0
+    for run in runs:
+        run.pop('detected')
+    return {'frames': len(frames), 'runs': runs}
+
+
+class CommandLine:
+    def __init__(self) -> None:
+        parser = argparse.ArgumentParser(description='Face detector benchmark')
+        parser.add_argument(
+            '-i',
+            '--input',
+            help = 'Provide a video or a folder of images as reference set',
+            required = True,
+        )
+        parser.add_argument(
+            '-d',
+            '--detectors',
+            help = 'Provide comma separated detectors to benchmark',
+            required = False,
+            default = ','.join(FACE_DETECTORS),
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help = 'Provide the file to save the results to',
+            required = False,
+            default = 'detector_benchmark.json',
+        )
+        argument = parser.parse_args()
+        frames = load_reference_set(argument.input)
+        print(f'[INFO] Loaded {len(frames)} reference frames.')
+        results = run_detector_benchmarks(
+            frames,
+            tuple(argument.detectors.split(',')),
+        )
+        with open(argument.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        for run in results['runs']:
+            print(
+                f'[INFO] {run["detector"]}'
+                f'{" at " + str(run["max_side"]) if "max_side" in run else ""}: '
+                f'{run["frames_per_second"]:.2f} frames/s, '
+                f'detected on {round(run["detection_rate"] * 100, 2)}% of frames.'
+            )
+        print(f'[INFO] Results are saved to {argument.output}.')
+
+
+if __name__ == '__main__':
+    app = CommandLine()
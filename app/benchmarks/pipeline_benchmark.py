@@ -0,0 +1,262 @@
+"""Reproducible benchmark of the video analysis pipeline."""
+import argparse
+import json
+import os
+import platform
+import tempfile
+from datetime import datetime
+from time import perf_counter
+from typing import Final, Optional, Tuple
+import cv2
+import numpy as np
+from app.emotions_measurer.measurer import EmotionsMeasurer
+from app.utils.resources import get_process_peak_rss_bytes
+from app.utils.utility_functions import (
+    generate_report_from_result_dictionary,
+    REPORT_FORMATS,
+)
+
+
+RESOLUTIONS: Final[Tuple[Tuple[int, int], ...]] = ((640, 360), (1280, 720), (1920, 1080))
+DURATIONS: Final[Tuple[int, ...]] = (5, 20)
+WORKER_COUNTS: Final[Tuple[int, ...]] = (1, 2, 4)
+FPS: Final[int] = 25
+SEED: Final[int] = 2024
+REGRESSION_TOLERANCE: Final[float] = 0.1
+
+
+def generate_synthetic_video(
+        path: str,
+        width: int,
+        height: int,
+        seconds: int,
+        fps: int = FPS,
+) -> str:
+    """
+    Write a deterministic test video with a moving cartoon face.
+
+    The face is drawn with eyes and brows, so that the cascades detect
+    features on part of the frames, and disappears from time to time
+    to exercise the looked away path as well.
+    """
+    generator = np.random.default_rng(SEED)
+    background = generator.integers(
+        0, 60, size=(height, width, 3), dtype=np.uint8
+    )
+    writer = cv2.VideoWriter(
+        path,
+        cv2.VideoWriter_fourcc(*'mp4v'),
+        fps,
+        (width, height),
+    )
+    radius = min(width, height) // 4
+    for i in range(seconds * fps):
+        frame = background.copy()
+        if (i // fps) % 4 != 3:
+            center_x = width // 2 + int(radius * 0.5 * np.sin(i / fps))
+            center_y = height // 2
+            cv2.ellipse(
+                frame, (center_x, center_y), (radius, int(radius * 1.3)),
+                0, 0, 360, (150, 180, 220), -1,
+            )
+            for side in (-1, 1):
+                eye = (center_x + side * radius // 2, center_y - radius // 4)
+                cv2.circle(frame, eye, radius // 6, (255, 255, 255), -1)
+                cv2.circle(frame, eye, radius // 14, (30, 30, 30), -1)
+                cv2.line(
+                    frame,
+                    (eye[0] - radius // 5, eye[1] - radius // 4),
+                    (eye[0] + radius // 5, eye[1] - radius // 4),
+                    (40, 40, 60), max(2, radius // 20),
+                )
+            mouth_curve = int(radius * 0.3 * np.sin(i / (2 * fps)))
+            cv2.ellipse(
+                frame, (center_x, center_y + radius // 2),
+                (radius // 2, max(1, abs(mouth_curve))),
+                0, 0 if mouth_curve >= 0 else 180, 180 if mouth_curve >= 0 else 360,
+                (40, 40, 120), max(2, radius // 25),
+            )
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def get_peak_rss_bytes() -> Optional[int]:
+    """Peak resident memory of this process and of its finished children."""
+    own = get_process_peak_rss_bytes()
+    if own is None:
+        return None
+    return max(own, get_process_peak_rss_bytes(children=True))
+
+
+def run_single_benchmark(
+        video_path: str,
+        workers: int,
+        report_format: str,
+        output_directory: str,
+) -> dict:
+    """Analyze the video once and collect timing of every stage."""
+    measurer = EmotionsMeasurer(video_path, workers, '')
+    frames_amount = measurer._frames_amount
+    start = perf_counter()
+    measurer.analyse_prepared_video()
+    analysis_seconds = perf_counter() - start
+    with measurer._stage_timings.measure('report'):
+        try:
+            generate_report_from_result_dictionary(
+                measurer._emotions_occurances,
+                measurer._looked_away,
+                measurer._frames_amount,
+                measurer._coordinates,
+                measurer._best_performance,
+                os.path.join(output_directory, f'report-{workers}'),
+                report_format,
+            )
+        except Exception as ex:
+            print(f'[WARNING] Report generation failed: {ex}.')
+    return {
+        'workers': workers,
+        'frames': frames_amount,
+        'analysis_seconds': analysis_seconds,
+        'frames_per_second': frames_amount / analysis_seconds
+            if analysis_seconds > 0 else 0.0,
+        'stages': measurer._stage_timings.as_dict(),
+        'peak_rss_bytes': get_peak_rss_bytes(),
+    }
+
+
+def run_benchmarks(
+        resolutions: Tuple[Tuple[int, int], ...] = RESOLUTIONS,
+        durations: Tuple[int, ...] = DURATIONS,
+        worker_counts: Tuple[int, ...] = WORKER_COUNTS,
+        report_format: str = 'html',
+) -> dict:
+    """
+    Run the whole benchmark matrix.
+
+    The following steps are taken:
+    1. Synthetic videos are generated for each resolution and duration.
+    2. Each video is analyzed with each amount of workers.
+    3. The results are gathered together with the machine description.
+    """
+    runs = list()
+    with tempfile.TemporaryDirectory() as directory:
+        for width, height in resolutions:
+            for seconds in durations:
+                video_path = generate_synthetic_video(
+                    os.path.join(directory, f'synthetic-{width}x{height}-{seconds}s.mp4'),
+                    width,
+                    height,
+                    seconds,
+                )
+                for workers in worker_counts:
+                    print(
+                        f'[INFO] Benchmarking {width}x{height}, '
+                        f'{seconds}s with {workers} workers.'
+                    )
+                    run = run_single_benchmark(
+                        video_path,
+                        workers,
+                        report_format,
+                        directory,
+                    )
+                    run['resolution'] = f'{width}x{height}'
+                    run['seconds'] = seconds
+                    runs.append(run)
+    return {
+        'created': datetime.now().isoformat(),
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+        },
+        'runs': runs,
+    }
+
+
+def compare_with_baseline(current: dict, baseline: dict) -> list[str]:
+    """Find runs which became slower than the baseline by the tolerance."""
+    baseline_runs = {
+        (run['resolution'], run['seconds'], run['workers']): run
+        for run in baseline['runs']
+    }
+    regressions = list()
+    for run in current['runs']:
+        key = (run['resolution'], run['seconds'], run['workers'])
+        if key not in baseline_runs:
+            continue
+        previous = baseline_runs[key]['frames_per_second']
+        if previous > 0 and \
+                run['frames_per_second'] < previous * (1 - REGRESSION_TOLERANCE):
+            regressions.append(
+                f'{key[0]}, {key[1]}s, {key[2]} workers: '
+                f'{previous:.2f} -> {run["frames_per_second"]:.2f} frames/s'
+            )
+    return regressions
+
+
+class CommandLine:
+    def __init__(self) -> None:
+        parser = argparse.ArgumentParser(description='Pipeline benchmark')
+        parser.add_argument(
+            '-o',
+            '--output',
+            help = 'Provide the file to save the results to',
+            required = False,
+            default = 'benchmark_results.json',
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            help = 'Provide comma separated amounts of workers',
+            required = False,
+            default = ','.join(str(workers) for workers in WORKER_COUNTS),
+        )
+        parser.add_argument(
+            '-q',
+            '--quick',
+            help = 'Run only the smallest video',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-f',
+            '--format',
+            help = 'Provide the report format to benchmark',
+            required = False,
+            default = 'html',
+            choices = REPORT_FORMATS,
+        )
+        parser.add_argument(
+            '-b',
+            '--baseline',
+            help = 'Provide previous results to compare against',
+            required = False,
+            default = '',
+        )
+        argument = parser.parse_args()
+        worker_counts = tuple(
+            int(workers) for workers in argument.workers.split(',')
+        )
+        results = run_benchmarks(
+            RESOLUTIONS[:1] if argument.quick else RESOLUTIONS,
+            DURATIONS[:1] if argument.quick else DURATIONS,
+            worker_counts,
+            argument.format,
+        )
+        with open(argument.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'[INFO] Results are saved to {argument.output}.')
+        if argument.baseline:
+            with open(argument.baseline, 'r') as file:
+                baseline = json.load(file)
+            regressions = compare_with_baseline(results, baseline)
+            for regression in regressions:
+                print(f'[WARNING] Regression: {regression}')
+            if not regressions:
+                print('[INFO] No regressions found.')
+
+
+if __name__ == '__main__':
+    app = CommandLine()
@@ -0,0 +1,188 @@
+"""Benchmark of the S3 transfer settings against a local object storage."""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Final, Optional, Tuple
+import boto3
+from app.utils.s3_transfer import (
+    ensure_bucket,
+    transfer_config,
+    upload_file,
+    upload_folder,
+    download_fileobj,
+    MEBIBYTE,
+)
+
+
+BUCKET: Final[str] = 'transfer-benchmark'
+FILE_MEGABYTES: Final[int] = 256
+FOLDER_FILES: Final[int] = 20
+FOLDER_FILE_MEGABYTES: Final[int] = 8
+CONCURRENCIES: Final[Tuple[int, ...]] = (1, 4, 10)
+CHUNK_MEGABYTES: Final[Tuple[int, ...]] = (8, 16, 64)
+
+
+def write_random_file(path: str, megabytes: int) -> str:
+    """Write the file of random bytes, which do not compress on the way."""
+    with open(path, 'wb') as file:
+        for _ in range(megabytes):
+            file.write(os.urandom(MEBIBYTE))
+    return path
+
+
+def local_storage(endpoint_url: Optional[str]):
+    """
+    Context of the storage to benchmark against.
+
+    Without the endpoint of a local MinIO, the storage is mocked
+    in the process by moto, which measures the overhead of the client
+    and the parallelism of the transfers rather than the network.
+    """
+    if endpoint_url:
+        return nullcontext()
+    try:
+        from moto import mock_aws
+    except ImportError:
+        from moto import mock_s3 as mock_aws
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    return mock_aws()
+
+
+def run_transfer_benchmarks(
+        client,
+        directory: str,
+        file_megabytes: int = FILE_MEGABYTES,
+        concurrencies: Tuple[int, ...] = CONCURRENCIES,
+        chunk_megabytes: Tuple[int, ...] = CHUNK_MEGABYTES,
+) -> dict:
+    """
+    Upload and download one large file with every setting, then a folder.
+
+    The folder is uploaded twice, the second upload is expected
+    to skip every file, as the objects have the same checksums.
+    """
+    ensure_bucket(client, BUCKET)
+    path = write_random_file(os.path.join(directory, 'large.bin'), file_megabytes)
+    runs = list()
+    for concurrency in concurrencies:
+        for chunk in chunk_megabytes:
+            config = transfer_config(concurrency, chunk * MEBIBYTE)
+            key = f'large-{concurrency}-{chunk}.bin'
+            start = perf_counter()
+            upload_file(client, path, BUCKET, key, config, False, False)
+            upload_seconds = perf_counter() - start
+            start = perf_counter()
+            with open(os.path.join(directory, 'downloaded.bin'), 'wb') as file:
+                download_fileobj(client, BUCKET, key, file, config, False)
+            download_seconds = perf_counter() - start
+            runs.append({
+                'concurrency': concurrency,
+                'chunk_megabytes': chunk,
+                'upload_megabytes_per_second': file_megabytes / upload_seconds
+                if upload_seconds > 0 else 0.0,
+                'download_megabytes_per_second': file_megabytes / download_seconds
+                if download_seconds > 0 else 0.0,
+            })
+            client.delete_object(Bucket=BUCKET, Key=key)
+    folder = os.path.join(directory, 'folder')
+    os.makedirs(folder)
+    for i in range(FOLDER_FILES):
+        write_random_file(os.path.join(folder, f'clip{i:03d}.bin'), FOLDER_FILE_MEGABYTES)
+    start = perf_counter()
+    first = upload_folder(client, folder, BUCKET, 'folder/')
+    first_seconds = perf_counter() - start
+    start = perf_counter()
+    second = upload_folder(client, folder, BUCKET, 'folder/')
+    second_seconds = perf_counter() - start
+    return {
+        'file_megabytes': file_megabytes,
+        'runs': runs,
+        'folder': {
+            'files': FOLDER_FILES,
+            'upload_seconds': first_seconds,
+            'upload': first,
+            'repeated_upload_seconds': second_seconds,
+            'repeated_upload': second,
+        },
+    }
+
+
+class CommandLine:
+    def __init__(self) -> None:
+        parser = argparse.ArgumentParser(description='S3 transfer benchmark')
+        parser.add_argument(
+            '-u',
+            '--endpointUrl',
+            help = 'Provide the endpoint of a local MinIO, moto is used by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-ac',
+            '--awsAccessKeyId',
+            help = 'Provide the access key id of the local storage',
+            required = False,
+            default = 'minioadmin',
+        )
+        parser.add_argument(
+            '-sc',
+            '--awsSecretAccessKey',
+            help = 'Provide the secret access key of the local storage',
+            required = False,
+            default = 'minioadmin',
+        )
+        parser.add_argument(
+            '-s',
+            '--size',
+            help = f'Provide the size of the large file in MiB, {FILE_MEGABYTES} by default',
+            required = False,
+            type = int,
+            default = FILE_MEGABYTES,
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help = 'Provide the file to save the results to',
+            required = False,
+            default = 's3_transfer_benchmark.json',
+        )
+        argument = parser.parse_args()
+        directory = tempfile.mkdtemp(prefix='s3_transfer_benchmark')
+        try:
+            with local_storage(argument.endpointUrl):
+                client = boto3.client(
+                    's3',
+                    region_name='us-east-1',
+                    endpoint_url=argument.endpointUrl or None,
+                    aws_access_key_id=argument.awsAccessKeyId,
+                    aws_secret_access_key=argument.awsSecretAccessKey,
+                )
+                results = run_transfer_benchmarks(client, directory, argument.size)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        with open(argument.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        for run in results['runs']:
+            print(
+                f'[INFO] {run["concurrency"]} threads, '
+                f'{run["chunk_megabytes"]} MiB parts: '
+                f'upload {run["upload_megabytes_per_second"]:.1f} MiB/s, '
+                f'download {run["download_megabytes_per_second"]:.1f} MiB/s.'
+            )
+        folder = results['folder']
+        print(
+            f'[INFO] Folder of {folder["files"]} files uploaded in '
+            f'{folder["upload_seconds"]:.2f} s, repeated upload skipped '
+            f'{folder["repeated_upload"]["skipped"]} files in '
+            f'{folder["repeated_upload_seconds"]:.2f} s.'
+        )
+        print(f'[INFO] Results are saved to {argument.output}.')
+
+
+if __name__ == '__main__':
+    app = CommandLine()
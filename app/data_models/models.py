@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import Optional, Tuple
 from pydantic import BaseModel
 from enum import StrEnum
 
@@ -39,8 +39,8 @@ class RegionOfEvaluation(BaseModel):
     y: int
     w: int
     h: int
-    left_eye: Tuple[int, int]
-    right_eye: Tuple[int, int]
+    left_eye: Optional[Tuple[int, int]] = None
+    right_eye: Optional[Tuple[int, int]] = None
 
 
 class EmotionalReport(BaseModel):
@@ -49,3 +49,15 @@ class EmotionalReport(BaseModel):
     dominant_emotion: str
     region: RegionOfEvaluation
     face_confidence: float
+
+
+class ReportThresholds(BaseModel):
+    """Thresholds of the takeaways, in percents of frames."""
+    looked_away: float = 7.5
+    happy_to_angry_difference: float = 10.0
+    happy_to_sad_difference: float = 10.0
+    neutral_to_surprised: float = 10.0
+    fear: float = 5.0
+    happy: float = 20.0
+    disgust_angry: float = 12.5
+    sad: float = 15.0
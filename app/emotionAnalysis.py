@@ -3,10 +3,30 @@ from time import sleep
 from app.utils.utility_functions import (
     validate_input,
     generate_textual_report_from_result_dictionary,
-    generate_latex_report_from_result_dictionary,
+    validate_report_format,
+    validate_inference_backend,
+    validate_face_detector,
+    default_face_detector,
+    validate_video_decoder,
+    validate_smoothing,
+    parse_segments,
+    validate_estimation,
+    read_report_thresholds,
+    DEFAULT_REPORT_FORMAT,
+    DEFAULT_REPORT_THRESHOLDS,
+    EMOTIONS_GRAPH_INTERPRETATION,
 )
 import pylatex.errors
 from app.emotions_measurer.measurer import EmotionsMeasurer
+from app.emotions_measurer.inference_backends import DEFAULT_INFERENCE_BACKEND
+from app.emotions_measurer.video_decoders import DEFAULT_VIDEO_DECODER
+from app.utils.temporal_smoothing import (
+    DEFAULT_SMOOTHING_METHOD,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+from app.utils.analysis_artifact import AnalysisArtifact
+from app.utils.estimation import DEFAULT_ESTIMATION_CONFIDENCE
+from app.utils.report_queue import ReportQueue, generate_report_artifact
 
 
 class CommandLine:
@@ -29,10 +49,87 @@ class CommandLine:
         parser.add_argument(
             '-t',
             '--threads',
-            help = 'Provide the amount of threads to run the analysis on',
+            help = 'Provide the amount of threads to run the analysis on, or auto (default)',
             required = False,
             default='',
         )
+        parser.add_argument(
+            '-b',
+            '--backend',
+            help = 'Provide the inference backend: deepface (default) or onnx',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-d',
+            '--detector',
+            help = 'Provide the face detector: cascade (default) or yunet (default for the onnx backend)',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-D',
+            '--decoder',
+            help = 'Provide the video decoder: opencv (default) or pyav',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-g',
+            '--grayscale',
+            help = 'Decode the video straight to grayscale',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-a',
+            '--annotate',
+            help = 'Draw the detected features on the frames and the thumbnails of the report',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-x',
+            '--maxSide',
+            help = 'Provide the maximal side of decoded frames in pixels, frames are not reduced by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-s',
+            '--smoothing',
+            help = 'Provide the smoothing of emotions over time: none (default), mean, ema or median',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-w',
+            '--smoothingWindow',
+            help = f'Provide the smoothing window in frames, {DEFAULT_SMOOTHING_WINDOW} by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-f',
+            '--format',
+            help = 'Provide the report format: latex (default) or html',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-p',
+            '--profile',
+            help = 'Provide the file to write Chrome trace of the analysis to',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-c',
+            '--cpuProfile',
+            help = 'Save CPU profile of each thread next to the trace',
+            required = False,
+            action = 'store_true',
+        )
         parser.add_argument(
             '-m',
             '--mode',
@@ -40,15 +137,60 @@ class CommandLine:
             required = False,
             default = '',
         )
+        parser.add_argument(
+            '-R',
+            '--restart',
+            help = 'Analyze from the start instead of resuming from saved chunks',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-r',
+            '--rerender',
+            help = 'Provide the saved analysis (.npz) to render the reports from without analysis',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-S',
+            '--segments',
+            help = 'Provide the comma separated segments to analyze in seconds, e.g. 30-95.5,600-',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-T',
+            '--thresholds',
+            help = 'Provide the JSON file with thresholds of the takeaways',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-e',
+            '--estimate',
+            help = 'Estimate the percentages from a sample of frames within the given percentage points',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-l',
+            '--confidenceLevel',
+            help = f'Provide the confidence level of the estimate, {DEFAULT_ESTIMATION_CONFIDENCE} by default',
+            required = False,
+            default = '',
+        )
         argument = parser.parse_args()
         matched_argument = False
         filename = ''
         threads_amount = ''
         mode = ''
+        report_format = ''
         if argument.Help:
             print('''
 [INFO] Instruction for emotions analyzer:
-python emotionsAnalysis.py -i <file_destination> -t <threads_amount> -m <mode>
+python emotionsAnalysis.py -i <file_destination> -t <threads_amount> -m <mode> -f <report_format> -d <detector> -s <smoothing> -w <smoothing_window> -S <segments> -T <thresholds>
+python emotionsAnalysis.py -i <file_destination> -e <tolerance> -l <confidence_level>
+python emotionsAnalysis.py -r <saved_analysis> -f <report_format> -s <smoothing> -T <thresholds>
 '''
             )
             return
@@ -61,12 +203,105 @@ python emotionsAnalysis.py -i <file_destination> -t <threads_amount> -m <mode>
         if argument.mode:
             mode = argument.mode
             matched_argument = True
+        if argument.format:
+            report_format = argument.format
+        backend_name = argument.backend
+        detector_name = argument.detector
+        smoothing = argument.smoothing
+        smoothing_window = argument.smoothingWindow
+        thresholds = DEFAULT_REPORT_THRESHOLDS
+        if argument.thresholds:
+            try:
+                thresholds = read_report_thresholds(argument.thresholds)
+            except (OSError, ValueError) as ex:
+                print(
+                    '[ERROR] Provided invalid thresholds. Try again. '
+                    f'Details: {ex}'
+                )
+                return
+        segments = None
+        if argument.segments:
+            try:
+                segments = parse_segments(argument.segments)
+            except ValueError as ex:
+                print(
+                    '[ERROR] Provided invalid segments. Try again. '
+                    f'Details: {ex}'
+                )
+                return
+        if argument.rerender:
+            input_valid, message = validate_report_format(report_format)
+            if input_valid:
+                input_valid, message = validate_smoothing(
+                    smoothing,
+                    smoothing_window,
+                )
+            if not input_valid:
+                print(
+                    '[ERROR] Provided invalid input. Try again. '
+                    f'Details: {message}'
+                )
+                return
+            artifact = AnalysisArtifact.load(argument.rerender)
+            artifact.apply_smoothing(
+                smoothing or DEFAULT_SMOOTHING_METHOD,
+                int(smoothing_window or DEFAULT_SMOOTHING_WINDOW),
+                EMOTIONS_GRAPH_INTERPRETATION,
+            )
+            generate_textual_report_from_result_dictionary(
+                artifact.emotions_occurances,
+                artifact.looked_away,
+                artifact.frames_amount,
+                thresholds,
+            )
+            report_path = generate_report_artifact(
+                'emotional_report',
+                '.',
+                report_format or DEFAULT_REPORT_FORMAT,
+                artifact.emotions_occurances,
+                artifact.looked_away,
+                artifact.frames_amount,
+                artifact.coordinates,
+                artifact.best_performance,
+                thresholds,
+            )
+            print(f'[INFO] Report is saved to {report_path}.')
+            return
         if matched_argument:
             input_valid, message = validate_input(
                 filename,
                 threads_amount,
                 mode
             )
+            if input_valid:
+                input_valid, message = validate_report_format(report_format)
+            if input_valid:
+                input_valid, message = validate_inference_backend(backend_name)
+            if input_valid:
+                input_valid, message = validate_face_detector(detector_name, backend_name)
+            if input_valid:
+                input_valid, message = validate_video_decoder(
+                    argument.decoder,
+                    argument.maxSide,
+                )
+            if input_valid:
+                input_valid, message = validate_smoothing(
+                    smoothing,
+                    smoothing_window,
+                )
+            if input_valid:
+                input_valid, message = validate_estimation(
+                    argument.estimate,
+                    argument.confidenceLevel,
+                )
+            if input_valid and argument.estimate and \
+                    (mode == 'realtime' or smoothing not in ('', 'none')
+                     or segments is not None):
+                input_valid, message = (
+                    False,
+                    'Estimation samples frames of the whole video, '
+                    'it is not combined with realtime mode, smoothing or segments.'
+                )
             if not input_valid:
                 print(
                     '[ERROR] Provided invalid input. Try again. '
@@ -75,13 +310,28 @@ python emotionsAnalysis.py -i <file_destination> -t <threads_amount> -m <mode>
                 return
             print('[INFO] Valid input provided.')
             threads_numeric = int(threads_amount) \
-                if threads_amount != '' else None
+                if threads_amount not in ('', 'auto') else None
             frame_analyzer = EmotionsMeasurer(
                 filename,
                 threads_numeric,
-                mode
+                mode,
+                argument.profile or None,
+                argument.cpuProfile,
+                backend_name or DEFAULT_INFERENCE_BACKEND,
+                default_face_detector(backend_name, detector_name),
+                resume=not argument.restart,
+                segments=segments,
+                video_decoder=argument.decoder or DEFAULT_VIDEO_DECODER,
+                decode_grayscale=argument.grayscale,
+                decode_max_side=int(argument.maxSide) if argument.maxSide else None,
+                annotate_frames=argument.annotate,
             )
-            if mode != 'realtime':
+            if argument.estimate:
+                frame_analyzer.estimate_video(
+                    float(argument.estimate),
+                    float(argument.confidenceLevel or DEFAULT_ESTIMATION_CONFIDENCE),
+                )
+            elif mode != 'realtime':
                 frame_analyzer.analyse_prepared_video()
             else:
                 print('[INFO] Some ground info before realtime analysis starts:')
@@ -94,28 +344,39 @@ python emotionsAnalysis.py -i <file_destination> -t <threads_amount> -m <mode>
                     print(i)
                     sleep(1)
                 frame_analyzer.analyze_realtime()
+            report_queue = ReportQueue(directory='.', workers=1)
+            artifact_path = report_queue.save_artifact(
+                'emotional_report',
+                frame_analyzer.analysis_artifact(),
+            )
+            print(f'[INFO] Analysis is saved to {artifact_path}.')
+            frame_analyzer.apply_smoothing(
+                smoothing or DEFAULT_SMOOTHING_METHOD,
+                int(smoothing_window or DEFAULT_SMOOTHING_WINDOW),
+            )
             generate_textual_report_from_result_dictionary(
                 frame_analyzer._emotions_occurances,
                 frame_analyzer._looked_away,
                 frame_analyzer._frames_amount,
+                thresholds,
             )
-            try:
-                generate_latex_report_from_result_dictionary(
-                    frame_analyzer._emotions_occurances,
-                    frame_analyzer._looked_away,
-                    frame_analyzer._frames_amount,
-                    frame_analyzer._coordinates,
-                    frame_analyzer._best_performance,
-                )
-            except Exception as ex:
-                print(
-                    '[WARNING] Exception raised while generating latex report: '
-                    f'{ex}.'
-                )
+            report_queue.submit(
+                'emotional_report',
+                frame_analyzer._emotions_occurances,
+                frame_analyzer._looked_away,
+                frame_analyzer._frames_amount,
+                frame_analyzer._coordinates,
+                frame_analyzer._best_performance,
+                report_format or DEFAULT_REPORT_FORMAT,
+                thresholds,
+            )
+            report_queue.shutdown()
         else:
             print('''
 [INFO] Instruction for emotions analyzer:
-python emotionsAnalysis.py -i <file_destination> -t <threads_amount> -m <mode>
+python emotionsAnalysis.py -i <file_destination> -t <threads_amount> -m <mode> -f <report_format> -d <detector> -s <smoothing> -w <smoothing_window> -S <segments> -T <thresholds>
+python emotionsAnalysis.py -i <file_destination> -e <tolerance> -l <confidence_level>
+python emotionsAnalysis.py -r <saved_analysis> -f <report_format> -s <smoothing> -T <thresholds>
 '''
             )
 
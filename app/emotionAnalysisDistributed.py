@@ -0,0 +1,300 @@
+import argparse
+from typing import Final
+from multiprocessing import Process
+from app.utils.utility_functions import (
+    validate_input,
+    validate_file_input,
+    generate_textual_report_from_result_dictionary,
+    validate_report_format,
+    validate_inference_backend,
+    validate_face_detector,
+    default_face_detector,
+    validate_video_decoder,
+    validate_smoothing,
+    validate_distributed_input,
+    read_report_thresholds,
+    DEFAULT_REPORT_FORMAT,
+    DEFAULT_REPORT_THRESHOLDS,
+)
+from app.emotions_measurer.measurer import EmotionsMeasurer
+from app.emotions_measurer.chunk_worker import run_worker
+from app.emotions_measurer.inference_backends import DEFAULT_INFERENCE_BACKEND
+from app.emotions_measurer.video_decoders import DEFAULT_VIDEO_DECODER
+from app.utils.chunk_queue import ChunkQueue, CHUNK_QUEUE_DATABASE
+from app.utils.checkpoints import CHUNK_FRAMES
+from app.utils.resources import available_cpu_count
+from app.utils.temporal_smoothing import (
+    DEFAULT_SMOOTHING_METHOD,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+from app.utils.report_queue import ReportQueue
+
+
+WORKER_STOP_SECONDS: Final[float] = 10.0
+INSTRUCTION = '''
+[INFO] Instruction for distributed emotions analyzer:
+python emotionAnalysisDistributed.py -i <file_destination> -q <queue_database> -n <local_workers> -k <chunk_frames> -f <report_format> -d <detector> -D <decoder> -g -x <max_side> -s <smoothing> -T <thresholds>
+python emotionAnalysisDistributed.py -W -q <queue_database> -t <threads_amount>
+'''
+
+
+def stop_workers(workers: list[Process]) -> None:
+    """
+    Stop the local workers when the coordinator fails.
+
+    The chunks they held are leased again once their leases expire.
+    """
+    print('[WARNING] Stopping the local workers.')
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+    for worker in workers:
+        if worker.pid is None:
+            continue
+        worker.join(WORKER_STOP_SECONDS)
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+
+
+class CommandLine:
+    def __init__(self) -> None:
+        parser = argparse.ArgumentParser(description='Parser description')
+        parser.add_argument(
+            '-i',
+            '--input',
+            help = 'Provide input file to publish for the distributed analysis',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-W',
+            '--worker',
+            help = 'Run as a worker analyzing the chunks of the queue',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-q',
+            '--queue',
+            help = f'Provide the database URL of the chunk queue, {CHUNK_QUEUE_DATABASE} by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-n',
+            '--localWorkers',
+            help = 'Provide the amount of workers to start on this host along with the coordinator, 0 by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-k',
+            '--chunkFrames',
+            help = f'Provide the amount of frames in one chunk, {CHUNK_FRAMES} by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-t',
+            '--threads',
+            help = 'Provide the amount of threads of each worker, or auto (default)',
+            required = False,
+            default='',
+        )
+        parser.add_argument(
+            '-b',
+            '--backend',
+            help = 'Provide the inference backend: deepface (default) or onnx',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-d',
+            '--detector',
+            help = 'Provide the face detector: cascade (default) or yunet (default for the onnx backend)',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-D',
+            '--decoder',
+            help = 'Provide the video decoder of the workers: opencv (default) or pyav',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-g',
+            '--grayscale',
+            help = 'Decode the video straight to grayscale on the workers',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-x',
+            '--maxSide',
+            help = 'Provide the maximal side of decoded frames in pixels, frames are not reduced by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-s',
+            '--smoothing',
+            help = 'Provide the smoothing of emotions over time: none (default), mean, ema or median',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-w',
+            '--smoothingWindow',
+            help = f'Provide the smoothing window in frames, {DEFAULT_SMOOTHING_WINDOW} by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-f',
+            '--format',
+            help = 'Provide the report format: latex (default) or html',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-T',
+            '--thresholds',
+            help = 'Provide the JSON file with thresholds of the takeaways',
+            required = False,
+            default = '',
+        )
+        argument = parser.parse_args()
+        database_url = argument.queue or CHUNK_QUEUE_DATABASE
+        threads_amount = argument.threads
+        if argument.worker:
+            input_valid, message = validate_file_input('', threads_amount)
+            if not input_valid:
+                print(
+                    '[ERROR] Provided invalid input. Try again. '
+                    f'Details: {message}'
+                )
+                return
+            run_worker(
+                database_url,
+                int(threads_amount) if threads_amount not in ('', 'auto') else None,
+            )
+            return
+        if not argument.input:
+            print(INSTRUCTION)
+            return
+        filename = argument.input
+        report_format = argument.format
+        backend_name = argument.backend
+        detector_name = argument.detector
+        smoothing = argument.smoothing
+        smoothing_window = argument.smoothingWindow
+        thresholds = DEFAULT_REPORT_THRESHOLDS
+        if argument.thresholds:
+            try:
+                thresholds = read_report_thresholds(argument.thresholds)
+            except (OSError, ValueError) as ex:
+                print(
+                    '[ERROR] Provided invalid thresholds. Try again. '
+                    f'Details: {ex}'
+                )
+                return
+        input_valid, message = validate_input(filename, threads_amount, '')
+        if input_valid:
+            input_valid, message = validate_distributed_input(
+                argument.localWorkers,
+                argument.chunkFrames,
+            )
+        if input_valid:
+            input_valid, message = validate_report_format(report_format)
+        if input_valid:
+            input_valid, message = validate_inference_backend(backend_name)
+        if input_valid:
+            input_valid, message = validate_face_detector(detector_name, backend_name)
+        if input_valid:
+            input_valid, message = validate_video_decoder(
+                argument.decoder,
+                argument.maxSide,
+            )
+        if input_valid:
+            input_valid, message = validate_smoothing(
+                smoothing,
+                smoothing_window,
+            )
+        if not input_valid:
+            print(
+                '[ERROR] Provided invalid input. Try again. '
+                f'Details: {message}'
+            )
+            return
+        print('[INFO] Valid input provided.')
+        local_workers = int(argument.localWorkers or 0)
+        threads_numeric = int(threads_amount) \
+            if threads_amount not in ('', 'auto') else None
+        if threads_numeric is None and local_workers > 0:
+            threads_numeric = max(1, available_cpu_count() // local_workers)
+        frame_analyzer = EmotionsMeasurer(
+            filename,
+            None,
+            '',
+            inference_backend=backend_name or DEFAULT_INFERENCE_BACKEND,
+            face_detector=default_face_detector(backend_name, detector_name),
+            chunk_frames=int(argument.chunkFrames or CHUNK_FRAMES),
+            video_decoder=argument.decoder or DEFAULT_VIDEO_DECODER,
+            decode_grayscale=argument.grayscale,
+            decode_max_side=int(argument.maxSide) if argument.maxSide else None,
+        )
+        queue = ChunkQueue(database_url)
+        workers = [
+            Process(
+                target=run_worker,
+                kwargs={
+                    'database_url': database_url,
+                    'thread_amount': threads_numeric,
+                    'exit_when_idle': True,
+                },
+            )
+            for _ in range(local_workers)
+        ]
+        frame_analyzer.publish_chunks(queue)
+        try:
+            for worker in workers:
+                worker.start()
+            frame_analyzer.analyse_distributed(queue)
+        except BaseException:
+            stop_workers(workers)
+            raise
+        for worker in workers:
+            worker.join()
+        report_queue = ReportQueue(directory='.', workers=1)
+        artifact_path = report_queue.save_artifact(
+            'emotional_report',
+            frame_analyzer.analysis_artifact(),
+        )
+        print(f'[INFO] Analysis is saved to {artifact_path}.')
+        frame_analyzer.apply_smoothing(
+            smoothing or DEFAULT_SMOOTHING_METHOD,
+            int(smoothing_window or DEFAULT_SMOOTHING_WINDOW),
+        )
+        generate_textual_report_from_result_dictionary(
+            frame_analyzer._emotions_occurances,
+            frame_analyzer._looked_away,
+            frame_analyzer._frames_amount,
+            thresholds,
+        )
+        report_queue.submit(
+            'emotional_report',
+            frame_analyzer._emotions_occurances,
+            frame_analyzer._looked_away,
+            frame_analyzer._frames_amount,
+            frame_analyzer._coordinates,
+            frame_analyzer._best_performance,
+            report_format or DEFAULT_REPORT_FORMAT,
+            thresholds,
+        )
+        report_queue.shutdown()
+
+
+if __name__ == '__main__':
+    app = CommandLine()
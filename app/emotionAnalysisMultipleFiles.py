@@ -6,10 +6,27 @@ from app.utils.utility_functions import (
     validate_input,
     validate_file_input,
     generate_textual_report_from_result_dictionary,
-    generate_latex_report_from_result_dictionary,
+    validate_report_format,
+    validate_inference_backend,
+    validate_face_detector,
+    default_face_detector,
+    validate_video_decoder,
+    validate_smoothing,
+    parse_segments,
+    read_report_thresholds,
+    DEFAULT_REPORT_FORMAT,
+    DEFAULT_REPORT_THRESHOLDS,
 )
 import pylatex.errors
 from app.emotions_measurer.measurer import EmotionsMeasurer
+from app.emotions_measurer.batch_measurer import BatchEmotionsMeasurer, BATCH_FRAMES
+from app.emotions_measurer.inference_backends import DEFAULT_INFERENCE_BACKEND
+from app.emotions_measurer.video_decoders import DEFAULT_VIDEO_DECODER
+from app.utils.temporal_smoothing import (
+    DEFAULT_SMOOTHING_METHOD,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+from app.utils.report_queue import ReportQueue
 
 
 class CommandLine:
@@ -25,25 +42,179 @@ class CommandLine:
         parser.add_argument(
             '-t',
             '--threads',
-            help = 'Provide the amount of threads to run the analysis on',
+            help = 'Provide the amount of threads to run the analysis on, or auto (default)',
             required = False,
             default='',
         )
+        parser.add_argument(
+            '-b',
+            '--backend',
+            help = 'Provide the inference backend: deepface (default) or onnx',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-d',
+            '--detector',
+            help = 'Provide the face detector: cascade (default) or yunet (default for the onnx backend)',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-D',
+            '--decoder',
+            help = 'Provide the video decoder: opencv (default) or pyav',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-g',
+            '--grayscale',
+            help = 'Decode the video straight to grayscale',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-x',
+            '--maxSide',
+            help = 'Provide the maximal side of decoded frames in pixels, frames are not reduced by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-s',
+            '--smoothing',
+            help = 'Provide the smoothing of emotions over time: none (default), mean, ema or median',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-w',
+            '--smoothingWindow',
+            help = f'Provide the smoothing window in frames, {DEFAULT_SMOOTHING_WINDOW} by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-f',
+            '--format',
+            help = 'Provide the report format: latex (default) or html',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-a',
+            '--annotate',
+            help = 'Draw the detected features on the frames and the thumbnails of the report',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-R',
+            '--restart',
+            help = 'Analyze from the start instead of resuming from saved chunks',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-S',
+            '--segments',
+            help = 'Provide the comma separated segments to analyze in seconds, e.g. 30-95.5,600-',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-B',
+            '--batch',
+            help = 'Analyze frames of all files on one pool of threads, for many short files',
+            required = False,
+            action = 'store_true',
+        )
+        parser.add_argument(
+            '-k',
+            '--batchFrames',
+            help = f'Provide the amount of frames in one round of the batch, {BATCH_FRAMES} by default',
+            required = False,
+            default = '',
+        )
+        parser.add_argument(
+            '-T',
+            '--thresholds',
+            help = 'Provide the JSON file with thresholds of the takeaways',
+            required = False,
+            default = '',
+        )
         argument = parser.parse_args()
         matched_argument = False
         folder = ''
         threads_amount = ''
+        report_format = ''
         if argument.input:
             folder = argument.input
             matched_argument = True
         if argument.threads:
             threads_amount = argument.threads
             matched_argument = True
+        if argument.format:
+            report_format = argument.format
+        backend_name = argument.backend
+        detector_name = argument.detector
+        smoothing = argument.smoothing
+        smoothing_window = argument.smoothingWindow
+        thresholds = DEFAULT_REPORT_THRESHOLDS
+        if argument.thresholds:
+            try:
+                thresholds = read_report_thresholds(argument.thresholds)
+            except (OSError, ValueError) as ex:
+                print(
+                    '[ERROR] Provided invalid thresholds. Try again. '
+                    f'Details: {ex}'
+                )
+                return
+        segments = None
+        if argument.segments:
+            try:
+                segments = parse_segments(argument.segments)
+            except ValueError as ex:
+                print(
+                    '[ERROR] Provided invalid segments. Try again. '
+                    f'Details: {ex}'
+                )
+                return
         if matched_argument:
             input_valid, message = validate_file_input(
                 folder,
                 threads_amount,
             )
+            if input_valid:
+                input_valid, message = validate_report_format(report_format)
+            if input_valid:
+                input_valid, message = validate_inference_backend(backend_name)
+            if input_valid:
+                input_valid, message = validate_face_detector(detector_name, backend_name)
+            if input_valid:
+                input_valid, message = validate_video_decoder(
+                    argument.decoder,
+                    argument.maxSide,
+                )
+            if input_valid:
+                input_valid, message = validate_smoothing(
+                    smoothing,
+                    smoothing_window,
+                )
+            if input_valid and argument.batchFrames != '' and \
+                    (not argument.batchFrames.isdigit() or int(argument.batchFrames) == 0):
+                input_valid, message = (
+                    False,
+                    'Amount of frames in one round of the batch '
+                    'is expected to be a positive integer.'
+                )
+            if input_valid and argument.batch and segments is not None:
+                input_valid, message = (
+                    False,
+                    'Batch analysis covers whole files, '
+                    'it is not combined with segments.'
+                )
             if not input_valid:
                 print(
                     '[ERROR] Provided invalid input. Try again. '
@@ -52,39 +223,72 @@ class CommandLine:
                 return
             print('[INFO] Valid input provided.')
             threads_numeric = int(threads_amount) \
-                if threads_amount != '' else None
+                if threads_amount not in ('', 'auto') else None
             onlyfiles = [
                 f for f in listdir(folder) \
                     if isfile(join(folder, f))
             ]
+            report_queue = ReportQueue(directory='.')
+
+            def submit_report(filename: str, frame_analyzer: EmotionsMeasurer) -> None:
+                report_queue.save_artifact(
+                    filename,
+                    frame_analyzer.analysis_artifact(),
+                )
+                frame_analyzer.apply_smoothing(
+                    smoothing or DEFAULT_SMOOTHING_METHOD,
+                    int(smoothing_window or DEFAULT_SMOOTHING_WINDOW),
+                )
+                generate_textual_report_from_result_dictionary(
+                    frame_analyzer._emotions_occurances,
+                    frame_analyzer._looked_away,
+                    frame_analyzer._frames_amount,
+                    thresholds,
+                )
+                report_queue.submit(
+                    filename,
+                    frame_analyzer._emotions_occurances,
+                    frame_analyzer._looked_away,
+                    frame_analyzer._frames_amount,
+                    frame_analyzer._coordinates,
+                    frame_analyzer._best_performance,
+                    report_format or DEFAULT_REPORT_FORMAT,
+                    thresholds,
+                )
+
+            batch = BatchEmotionsMeasurer(
+                threads_numeric,
+                backend_name or DEFAULT_INFERENCE_BACKEND,
+                default_face_detector(backend_name, detector_name),
+                int(argument.batchFrames or BATCH_FRAMES),
+                argument.annotate,
+            ) if argument.batch else None
             for filename in onlyfiles:
                 if filename.lower().endswith('mp4'):
-                    print(f'[INFO] Starting to analyze emotions in file: {filename}')
+                    if batch is None:
+                        print(f'[INFO] Starting to analyze emotions in file: {filename}')
                     frame_analyzer = EmotionsMeasurer(
                         join(folder, filename),
                         threads_numeric,
                         None,
+                        inference_backend=backend_name or DEFAULT_INFERENCE_BACKEND,
+                        face_detector=default_face_detector(backend_name, detector_name),
+                        resume=not argument.restart,
+                        segments=segments,
+                        video_decoder=argument.decoder or DEFAULT_VIDEO_DECODER,
+                        decode_grayscale=argument.grayscale,
+                        decode_max_side=int(argument.maxSide) if argument.maxSide else None,
+                        annotate_frames=argument.annotate,
                     )
+                    if batch is not None:
+                        batch.add(filename, frame_analyzer)
+                        continue
                     frame_analyzer.analyse_prepared_video()
-                    generate_textual_report_from_result_dictionary(
-                        frame_analyzer._emotions_occurances,
-                        frame_analyzer._looked_away,
-                        frame_analyzer._frames_amount,
-                    )
-                    try:
-                        generate_latex_report_from_result_dictionary(
-                            frame_analyzer._emotions_occurances,
-                            frame_analyzer._looked_away,
-                            frame_analyzer._frames_amount,
-                            frame_analyzer._coordinates,
-                            frame_analyzer._best_performance,
-                            filename,
-                        )
-                    except Exception as ex:
-                        print(
-                            '[WARNING] Exception raised while generating latex report: '
-                            f'{ex}.'
-                        )
+                    submit_report(filename, frame_analyzer)
+            if batch is not None:
+                batch.analyse(submit_report)
+            print('[INFO] Waiting for the remaining reports to be generated.')
+            report_queue.shutdown()
 
 
 if __name__ == '__main__':
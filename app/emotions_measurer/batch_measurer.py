@@ -0,0 +1,236 @@
+from time import perf_counter
+from typing import Callable, Final, Optional, Tuple
+import numpy as np
+from app.emotions_measurer.measurer import EmotionsMeasurer
+from app.emotions_measurer.frame_pool import SharedFramePool
+from app.emotions_measurer.frame_transport import SLOTS_PER_WORKER
+from app.utils.checkpoints import ChunkResult, CHUNK_FRAMES
+from app.utils.resources import plan_workers
+from app.utils.utility_functions import analyze_shared_batch
+
+
+BATCH_FRAMES: Final[int] = CHUNK_FRAMES
+
+
+class BatchPart:
+    """One chunk of one video of the batch."""
+
+    __slots__ = ('video', 'chunk', 'start', 'end')
+
+    def __init__(self, video: int, chunk: int, start: int, end: int) -> None:
+        self.video = video
+        self.chunk = chunk
+        self.start = start
+        self.end = end
+
+
+class BatchEmotionsMeasurer:
+    """
+    Analysis of many videos on one pool of threads.
+
+    The chunks of all videos are packed into rounds of at least
+    batch frames, so the threads are started and load the models once,
+    and the rounds stay full even when the videos are shorter than
+    a chunk. Frames of the videos of a round go through one shared
+    frame ring, its slots sized for the largest frame of the videos
+    as their decoders give them.
+    Each chunk is analyzed as a part of its own, its result is saved
+    and routed to the measurer of its video, which is merged
+    and handed over as soon as all its chunks are done. Only the videos
+    of the current round are kept open. The videos are expected to be
+    analyzed with the inference backend and face detector of the batch.
+    """
+
+    def __init__(
+            self,
+            thread_amount: Optional[int],
+            inference_backend: str,
+            face_detector: str,
+            batch_frames: int = BATCH_FRAMES,
+            annotate_frames: bool = False,
+    ) -> None:
+        self._thread_amount = thread_amount
+        self._slots_amount = thread_amount * SLOTS_PER_WORKER \
+            if thread_amount is not None else None
+        self._inference_backend = inference_backend
+        self._face_detector = face_detector
+        self._batch_frames = batch_frames
+        self._annotate_frames = annotate_frames
+        self._names: list[str] = list()
+        self._measurers: list[Optional[EmotionsMeasurer]] = list()
+        self._frame_formats: list[Tuple[Tuple[int, ...], np.dtype]] = list()
+
+    def add(self, name: str, measurer: EmotionsMeasurer) -> None:
+        """Add the video to the batch, its file is closed until its round comes."""
+        frame_format = measurer.frame_format()
+        measurer.release_video()
+        self._names.append(name)
+        self._measurers.append(measurer)
+        self._frame_formats.append(frame_format)
+
+    def analyse(
+            self,
+            on_analyzed: Callable[[str, EmotionsMeasurer], None],
+    ) -> None:
+        """
+        Analyze the videos of the batch.
+
+        The following steps are taken:
+        1. Load the saved chunks of each video, the videos
+        which are already done are handed over at once.
+        2. Split the missing chunks into rounds.
+        3. Start the threads once for all rounds.
+        4. Decode the frames of each round video after video
+        and send them to the threads with their part of the round.
+        5. Save the result of each part as the chunk of its video.
+        6. Merge each video as soon as its last chunk is done,
+        and hand it over with its name.
+        If the memory runs out, the missing chunks are retried
+        with half of the threads, as for a single video.
+        """
+        chunk_results: dict[int, dict[int, ChunkResult]] = dict()
+        parts: list[BatchPart] = list()
+        for video, measurer in enumerate(self._measurers):
+            chunks, chunk_results[video] = measurer.plan_chunks()
+            missing = [
+                BatchPart(video, chunk, frames.start, frames.stop)
+                for chunk, frames in chunks.items()
+                if chunk not in chunk_results[video]
+            ]
+            if missing:
+                parts.extend(missing)
+            else:
+                self._hand_over(video, chunk_results.pop(video), on_analyzed)
+        if not parts:
+            return
+        print(
+            f'[INFO] Analysing {len(parts)} chunks of '
+            f'{len(chunk_results)} videos in batches.'
+        )
+        start = perf_counter()
+        frames_amount = sum(part.end - part.start for part in parts)
+        while True:
+            try:
+                self._analyse_parts(
+                    [
+                        part for part in parts
+                        if part.video in chunk_results
+                        and part.chunk not in chunk_results[part.video]
+                    ],
+                    chunk_results,
+                    on_analyzed,
+                )
+                break
+            except MemoryError:
+                if self._thread_amount == 1:
+                    print(
+                        '[WARNING] MemoryError was raised '
+                        'while executing the analysis on a single thread.'
+                    )
+                    break
+                self._thread_amount = max(1, self._thread_amount // 2)
+                self._slots_amount = self._thread_amount * SLOTS_PER_WORKER
+                print(
+                    '[WARNING] MemoryError was raised '
+                    'while executing the analysis. '
+                    f'Retrying with {self._thread_amount} threads.'
+                )
+        seconds = perf_counter() - start
+        print(
+            f'[INFO] Analysed {frames_amount} frames in {seconds:.1f} s, '
+            f'{frames_amount / seconds if seconds > 0 else 0.0:.2f} frames/s.'
+        )
+
+    def _rounds(self, parts: list[BatchPart]) -> list[list[BatchPart]]:
+        """Pack the parts in order into rounds of at least batch frames."""
+        rounds: list[list[BatchPart]] = list()
+        frames = self._batch_frames
+        for part in parts:
+            if frames >= self._batch_frames:
+                rounds.append(list())
+                frames = 0
+            rounds[-1].append(part)
+            frames += part.end - part.start
+        return rounds
+
+    def _analyse_parts(
+            self,
+            parts: list[BatchPart],
+            chunk_results: dict[int, dict[int, ChunkResult]],
+            on_analyzed: Callable[[str, EmotionsMeasurer], None],
+    ) -> None:
+        """
+        Analyze the parts round by round on one pool of threads.
+
+        Parts are numbered within their round, the number is sent
+        with every frame, so the threads return a result per part.
+        """
+        if not parts:
+            return
+        frame_shape = max(
+            {self._frame_formats[part.video][0] for part in parts},
+            key=lambda shape: int(np.prod(shape)),
+        )
+        dtype = np.result_type(*{self._frame_formats[part.video][1] for part in parts})
+        if self._slots_amount is None:
+            self._thread_amount, self._slots_amount = plan_workers(
+                frame_shape,
+                dtype.itemsize,
+                footprint_key=self._inference_backend,
+            )
+            print(
+                f'[INFO] Using {self._thread_amount} threads and '
+                f'{self._slots_amount} frame slots.'
+            )
+        last_parts = {part.video: part for part in parts}
+        with SharedFramePool(
+                frame_shape,
+                dtype,
+                self._thread_amount,
+                self._slots_amount,
+                inference_backend=self._inference_backend,
+                face_detector=self._face_detector,
+                annotate_frames=self._annotate_frames,
+        ) as pool:
+            for round_parts in self._rounds(parts):
+                pool.start_round(analyze_shared_batch)
+                for number, part in enumerate(round_parts):
+                    measurer = self._measurers[part.video]
+                    measurer.open_video()
+                    measurer.send_frames(pool, range(part.start, part.end), number)
+                    if last_parts[part.video] is part:
+                        measurer.release_video()
+                part_results: dict[int, list[tuple]] = {
+                    number: list() for number in range(len(round_parts))
+                }
+                for thread_results in pool.finish_round():
+                    for number, result in thread_results:
+                        part_results[number].append(result)
+                for number, part in enumerate(round_parts):
+                    chunk_results[part.video][part.chunk] = \
+                        self._measurers[part.video].chunk_result(
+                            part.chunk,
+                            part_results[number],
+                        )
+                    if last_parts[part.video] is part:
+                        self._hand_over(
+                            part.video,
+                            chunk_results.pop(part.video),
+                            on_analyzed,
+                        )
+                print(
+                    f'[INFO] Chunks of {len({part.video for part in round_parts})} '
+                    'videos are done.'
+                )
+
+    def _hand_over(
+            self,
+            video: int,
+            video_results: dict[int, ChunkResult],
+            on_analyzed: Callable[[str, EmotionsMeasurer], None],
+    ) -> None:
+        """Merge the chunks of the video and pass it on, the batch forgets it."""
+        measurer = self._measurers[video]
+        measurer.merge_chunk_results(video_results)
+        self._measurers[video] = None
+        on_analyzed(self._names[video], measurer)
@@ -0,0 +1,125 @@
+import os
+import socket
+from threading import Event, Thread
+from time import sleep
+from typing import Final, Optional
+from app.emotions_measurer.measurer import EmotionsMeasurer, POLL_INTERVAL
+from app.utils.chunk_queue import (
+    ChunkLease,
+    ChunkQueue,
+    CHUNK_QUEUE_DATABASE,
+    LEASE_SECONDS,
+)
+
+
+RENEWALS_PER_LEASE: Final[int] = 3
+
+
+def default_worker_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class LeaseHeartbeat:
+    """Renews the lease in the background while the chunk is analyzed."""
+
+    def __init__(self, queue: ChunkQueue, lease: ChunkLease) -> None:
+        self._queue = queue
+        self._lease = lease
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        interval = self._queue.lease_seconds / RENEWALS_PER_LEASE
+        while not self._stopped.wait(interval):
+            if not self._queue.renew(self._lease):
+                return
+
+    def __enter__(self) -> 'LeaseHeartbeat':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+def run_worker(
+        database_url: str = CHUNK_QUEUE_DATABASE,
+        thread_amount: Optional[int] = None,
+        worker_name: Optional[str] = None,
+        lease_seconds: float = LEASE_SECONDS,
+        poll_interval: float = POLL_INTERVAL,
+        exit_when_idle: bool = False,
+) -> int:
+    """
+    Analyze the chunks of the queue until stopped, return the amount done.
+
+    The measurer of the last job is kept between the chunks,
+    so the video is not reopened for every chunk of the same job.
+    A chunk which fails is given back to the queue. A chunk whose lease
+    was taken over meanwhile is dropped, the other worker stores it.
+    If exit when idle is set, the worker stops when no chunks
+    are left to analyze, otherwise it waits for new jobs.
+    """
+    queue = ChunkQueue(database_url, lease_seconds)
+    worker_name = worker_name or default_worker_name()
+    measurer: Optional[EmotionsMeasurer] = None
+    measurer_job: Optional[str] = None
+    done = 0
+    print(f'[INFO] Worker {worker_name} is waiting for chunks.')
+    try:
+        while True:
+            lease = queue.lease(worker_name)
+            if lease is None:
+                if exit_when_idle and queue.unfinished_amount() == 0:
+                    break
+                sleep(poll_interval)
+                continue
+            if measurer_job != lease.job_id:
+                if measurer is not None:
+                    measurer.release_video()
+                job = queue.job(lease.job_id)
+                measurer = EmotionsMeasurer(
+                    job.video_path,
+                    thread_amount,
+                    '',
+                    inference_backend=job.inference_backend,
+                    face_detector=job.face_detector,
+                    checkpoint_key=job.id,
+                    chunk_frames=job.chunk_frames,
+                    video_decoder=job.video_decoder,
+                    decode_grayscale=job.decode_grayscale,
+                    decode_max_side=job.decode_max_side,
+                )
+                measurer_job = job.id
+            print(
+                f'[INFO] Worker {worker_name} took chunk {lease.chunk + 1} '
+                f'(frames {lease.start}-{lease.end}) of job {lease.job_id}.'
+            )
+            with LeaseHeartbeat(queue, lease):
+                try:
+                    chunk_results = measurer.analyse_chunks(
+                        {lease.chunk: (lease.start, lease.end)}
+                    )
+                except Exception as ex:
+                    print(
+                        f'[WARNING] Chunk {lease.chunk + 1} of job '
+                        f'{lease.job_id} failed: {ex}.'
+                    )
+                    queue.release(lease)
+                    continue
+            if lease.chunk not in chunk_results:
+                queue.release(lease)
+                continue
+            if not queue.complete(lease, chunk_results[lease.chunk]):
+                print(
+                    f'[WARNING] Lease of chunk {lease.chunk + 1} of job '
+                    f'{lease.job_id} was taken over, dropping the result.'
+                )
+                continue
+            done += 1
+    finally:
+        if measurer is not None:
+            measurer.release_video()
+    print(f'[INFO] Worker {worker_name} analyzed {done} chunks.')
+    return done
@@ -0,0 +1,220 @@
+import os
+from time import perf_counter
+from typing import Final, Optional, Tuple
+import cv2
+import numpy as np
+from app.emotions_measurer.preprocessing import (
+    PreprocessingContext,
+    get_preprocessing_context,
+)
+from app.utils.instrumentation import StageTimings
+
+
+FACE_DETECTORS: Final[tuple[str, ...]] = ('cascade', 'yunet')
+DEFAULT_FACE_DETECTOR: Final[str] = 'cascade'
+FACE_BOX_DETECTORS: Final[tuple[str, ...]] = ('yunet',)
+SCALE_FACTOR: Final[float] = 1.1
+MIN_NEIGHBORS: Final[int] = 5
+YUNET_MODEL_ENVIRONMENT_VARIABLE: Final[str] = 'YUNET_MODEL'
+DEFAULT_YUNET_MODEL_PATH: Final[str] = os.path.join(
+    'models',
+    'face_detection_yunet_2023mar.onnx',
+)
+YUNET_SCORE_THRESHOLD: Final[float] = 0.7
+YUNET_NMS_THRESHOLD: Final[float] = 0.3
+DETECTION_MAX_SIDE: Final[int] = 640
+DETECTION_MAX_SIDE_ENVIRONMENT_VARIABLE: Final[str] = 'FACE_DETECTION_MAX_SIDE'
+
+
+class Detection:
+    """
+    Result of the detection on one frame.
+
+    The region is (x, y, width, height) of the area to analyze
+    or None if nothing was found, which means the person looked away.
+    Features are the boxes which were detected to build the region.
+    Face is set when the region is the box of the whole face,
+    which can be given to the classifier as is, and not the box
+    of some of its features.
+    """
+
+    __slots__ = ('region', 'features', 'confidence', 'face')
+
+    def __init__(
+            self,
+            region: Optional[Tuple[int, int, int, int]],
+            features: list[Tuple[int, int, int, int]],
+            confidence: float = 0.0,
+            face: bool = False,
+    ) -> None:
+        self.region = region
+        self.features = features
+        self.confidence = confidence
+        self.face = face
+
+
+class FaceDetector:
+    """
+    Detector of the region of interest used by FrameAnalyzer.
+
+    If the preprocessing context is given, intermediate images
+    of the detection are written into its buffers.
+    """
+
+    name: str = ''
+
+    def detect(
+            self,
+            frame: np.ndarray,
+            timings: Optional[StageTimings] = None,
+            context: Optional[PreprocessingContext] = None,
+    ) -> Detection:
+        raise NotImplementedError
+
+
+class CascadeEyeDetector(FaceDetector):
+    """
+    Haar cascade detector of brows and eyes.
+
+    The region is the bounding box of all the detected features,
+    which is not a face, so the classifier is given the whole frame.
+    If no eyes are detected, the person is considered looking away.
+    """
+
+    name = 'cascade'
+
+    def __init__(
+            self,
+            scale_factor: float = SCALE_FACTOR,
+            min_neighbors: int = MIN_NEIGHBORS,
+    ) -> None:
+        self._brows_predictor = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_eye_tree_eyeglasses.xml'
+        )
+        self._eye_predictor = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_eye_tree_eyeglasses.xml'
+        )
+        self._scale_factor = scale_factor
+        self._min_neighbors = min_neighbors
+
+    def detect(
+            self,
+            frame: np.ndarray,
+            timings: Optional[StageTimings] = None,
+            context: Optional[PreprocessingContext] = None,
+    ) -> Detection:
+        start = perf_counter()
+        gray_frame = get_preprocessing_context(context).grayscale(frame)
+        if timings is not None:
+            timings.add('grayscale', perf_counter() - start)
+            start = perf_counter()
+        brows = self._brows_predictor.detectMultiScale(
+            image=gray_frame,
+            scaleFactor=self._scale_factor,
+            minNeighbors=self._min_neighbors,
+        )
+        eyes = self._eye_predictor.detectMultiScale(
+            image=gray_frame,
+            scaleFactor=self._scale_factor,
+            minNeighbors=self._min_neighbors,
+        )
+        if timings is not None:
+            timings.add('detection', perf_counter() - start)
+        features = [tuple(int(value) for value in box) for box in brows]
+        if len(eyes) == 0:
+            return Detection(None, features)
+        features.extend(tuple(int(value) for value in box) for box in eyes)
+        left = min(x for x, _, _, _ in features)
+        right = max(x + width for x, _, width, _ in features)
+        bottom = min(y for _, y, _, _ in features)
+        top = max(y + height for _, y, _, height in features)
+        return Detection((left, bottom, right - left, top - bottom), features, 1.0)
+
+
+class YuNetFaceDetector(FaceDetector):
+    """
+    OpenCV DNN face detector (YuNet) running on CPU.
+
+    The frame is downscaled so that its longest side does not exceed
+    max_side before the detection, which trades accuracy on small faces
+    for throughput. If not given, max_side is read from the environment.
+    The most confident face is used as the region.
+    """
+
+    name = 'yunet'
+
+    def __init__(
+            self,
+            model_path: str = None,
+            max_side: int = None,
+            score_threshold: float = YUNET_SCORE_THRESHOLD,
+    ) -> None:
+        model_path = model_path or os.environ.get(
+            YUNET_MODEL_ENVIRONMENT_VARIABLE,
+            DEFAULT_YUNET_MODEL_PATH,
+        )
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(
+                f'YuNet model is not found at {model_path}. Download '
+                'face_detection_yunet_2023mar.onnx from the OpenCV model zoo.'
+            )
+        self._detector = cv2.FaceDetectorYN.create(
+            model=model_path,
+            config='',
+            input_size=(320, 320),
+            score_threshold=score_threshold,
+            nms_threshold=YUNET_NMS_THRESHOLD,
+        )
+        self._max_side = max_side or int(os.environ.get(
+            DETECTION_MAX_SIDE_ENVIRONMENT_VARIABLE,
+            DETECTION_MAX_SIDE,
+        ))
+        self._input_size: Tuple[int, int] = (320, 320)
+
+    def detect(
+            self,
+            frame: np.ndarray,
+            timings: Optional[StageTimings] = None,
+            context: Optional[PreprocessingContext] = None,
+    ) -> Detection:
+        start = perf_counter()
+        context = get_preprocessing_context(context)
+        frame = context.bgr(frame)
+        height, width = frame.shape[:2]
+        scale = min(1.0, self._max_side / max(height, width))
+        resized = frame if scale == 1.0 else context.resize(
+            frame,
+            (int(width * scale), int(height * scale)),
+            cv2.INTER_AREA,
+            'detection',
+        )
+        input_size = (resized.shape[1], resized.shape[0])
+        if input_size != self._input_size:
+            self._detector.setInputSize(input_size)
+            self._input_size = input_size
+        _, faces = self._detector.detect(resized)
+        if timings is not None:
+            timings.add('detection', perf_counter() - start)
+        if faces is None or len(faces) == 0:
+            return Detection(None, list())
+        best = faces[int(np.argmax(faces[:, -1]))]
+        x, y, face_width, face_height = (float(value) / scale for value in best[:4])
+        left, bottom = max(0, int(x)), max(0, int(y))
+        right = min(int(x + face_width), width)
+        top = min(int(y + face_height), height)
+        if right <= left or top <= bottom:
+            return Detection(None, list())
+        region = (left, bottom, right - left, top - bottom)
+        return Detection(region, [region], float(best[-1]), face=True)
+
+
+def get_face_detector(name: str = DEFAULT_FACE_DETECTOR) -> FaceDetector:
+    """Create the detector by its name."""
+    if name == 'yunet':
+        return YuNetFaceDetector()
+    if name == 'cascade':
+        return CascadeEyeDetector()
+    raise ValueError(
+        f'Unknown face detector "{name}", '
+        f'expected one of: {", ".join(FACE_DETECTORS)}.'
+    )
@@ -1,12 +1,105 @@
+from time import perf_counter
 import cv2
-from deepface import DeepFace
-from typing import Final, Any
+from enum import StrEnum
+from typing import Any, Final, Optional, Tuple
+from app.data_models.models import Emotions
+from app.emotions_measurer.face_detectors import (
+    FaceDetector,
+    get_face_detector,
+)
+from app.emotions_measurer.inference_backends import (
+    InferenceBackend,
+    get_inference_backend,
+    EMOTION_INPUT_SIZE,
+    EMOTION_LABELS,
+)
+from app.emotions_measurer.preprocessing import PreprocessingContext
+from app.utils.instrumentation import StageTimings
 
 
-SCALE_FACTOR: Final[float] = 1.1
-MIN_NEIGHBORS: Final[int] = 5
+MIN_CROP_SIDE: Final[int] = EMOTION_INPUT_SIZE
 
 
+_default_backend: dict[str, InferenceBackend] = dict()
+_default_detector: dict[str, FaceDetector] = dict()
+
+
+class FrameStatus(StrEnum):
+    """Enumeration to outline outcomes of the frame analysis."""
+    ANALYZED = 'analyzed'
+    LOOKED_AWAY = 'looked_away'
+    NO_FACE = 'no_face'
+
+
+class FrameResult:
+    """
+    Emotions detected on one face of the frame.
+
+    Scores are the emotion percentages in the order of EMOTION_LABELS.
+    Scores and face confidence are None if the backend report
+    contained only the dominant emotion.
+    """
+
+    __slots__ = ('dominant_emotion', 'scores', 'face_confidence')
+
+    def __init__(
+            self,
+            dominant_emotion: Emotions,
+            scores: Optional[Tuple[float, ...]] = None,
+            face_confidence: Optional[float] = None,
+    ) -> None:
+        self.dominant_emotion = dominant_emotion
+        self.scores = scores
+        self.face_confidence = face_confidence
+
+    @property
+    def complete(self) -> bool:
+        return self.scores is not None and self.face_confidence is not None
+
+    @classmethod
+    def from_report(cls, report: dict[str, Any]) -> Optional['FrameResult']:
+        """
+        Read the backend report in DeepFace format.
+
+        None is returned if even the dominant emotion is unknown.
+        """
+        try:
+            dominant_emotion = Emotions(report['dominant_emotion'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        try:
+            emotion = report['emotion']
+            scores = tuple(float(emotion[str(label)]) for label in EMOTION_LABELS)
+        except (KeyError, TypeError, ValueError):
+            scores = None
+        try:
+            face_confidence = float(report['face_confidence'])
+        except (KeyError, TypeError, ValueError):
+            face_confidence = None
+        return cls(dominant_emotion, scores, face_confidence)
+
+
+class FrameAnalysis:
+    """
+    Result of the analysis of one frame.
+
+    Results are empty unless the frame was analyzed.
+    Fallback is set when the whole frame was classified,
+    because the detector found no face box or the box was too small.
+    """
+
+    __slots__ = ('status', 'results', 'fallback')
+
+    def __init__(
+            self,
+            status: FrameStatus,
+            results: list[FrameResult],
+            fallback: bool = False,
+    ) -> None:
+        self.status = status
+        self.results = results
+        self.fallback = fallback
+
 
 class FrameAnalyzer:
     """
@@ -18,75 +111,89 @@ class FrameAnalyzer:
     @staticmethod
     def analyze_frame(
             frame,
-            brows_predictor: cv2.CascadeClassifier,
-            eye_predictor: cv2.CascadeClassifier,
-    ) -> list[dict[str, Any]]:
+            detector: Optional[FaceDetector] = None,
+            timings: Optional[StageTimings] = None,
+            backend: Optional[InferenceBackend] = None,
+            context: Optional[PreprocessingContext] = None,
+            annotate: bool = False,
+    ) -> FrameAnalysis:
         """
         Processes given frame and detects an emotional state of the person on it.
 
         The function follows the following steps in order to do so:
-        1. Set up variables, that will determine the boundaries.
-        2. Convert frame to the gray color in order to user classifier.
-        3. Delect brows on the frame.
-        4. Go through detected features and modify boundaries if needed.
-        5. Detect eyes on the frame.
-        6. Go through detected features and modify boundaries if needed.
-        7. Detect emotions on the frame with given boundaries.`
+        1. Detect the region of interest with the given detector.
+        2. If nothing is detected, the person looked away.
+        3. Choose the crop: the region if it is a face box,
+        or the whole frame if the detector found only facial features
+        (eye cascades) or the face is smaller than the classifier input.
+        Backends which do not find the face themselves are given
+        the face box whatever its size, and no face is reported
+        if there is no face box.
+        4. Detect emotions on the chosen crop once.
+        5. If annotation is on, mark detected features on the frame.
+        6. Read the reports into FrameResult records.
+
+        If timings are provided, time of each of the steps is registered,
+        every frame classified as a whole is counted as fallback
+        and incomplete reports are counted as validation errors.
+        If the detector is not provided, the eye cascades are used.
+        If the backend is not provided, DeepFace is used.
+        The preprocessing context of the worker is passed to the detector
+        and the backend, so that their buffers are reused between frames.
+        The frame is not changed unless annotation is on, which is meant
+        for debugging and for the realtime preview.
         """
-        top = -1
-        bottom = 2 ** 31
-        left = 2 * 31
-        right = -1
-        gray_frame = cv2.cvtColor(
-            src=frame,
-            code=cv2.COLOR_BGR2GRAY,
-        )
-        brows = brows_predictor.detectMultiScale(
-            image=gray_frame,
-            scaleFactor=SCALE_FACTOR,
-            minNeighbors=MIN_NEIGHBORS,
+        if detector is None:
+            if 'cascade' not in _default_detector:
+                _default_detector['cascade'] = get_face_detector('cascade')
+            detector = _default_detector['cascade']
+        if backend is None:
+            if 'deepface' not in _default_backend:
+                _default_backend['deepface'] = get_inference_backend('deepface')
+            backend = _default_backend['deepface']
+        detection = detector.detect(frame, timings, context)
+        if detection.region is None:
+            return FrameAnalysis(FrameStatus.LOOKED_AWAY, list())
+        left, bottom, width, height = detection.region
+        right = min(left + width, frame.shape[1])
+        top = min(bottom + height, frame.shape[0])
+        crop = detection.face and (
+            not backend.localizes_faces
+            or (right - left >= MIN_CROP_SIDE and top - bottom >= MIN_CROP_SIDE)
         )
-        for x, y, width, height in brows:
-            cv2.rectangle(
-                img=frame,
-                pt1=(x, y),
-                pt2=(x + width, y + height),
-                color=(255, 0, 0),
-                thickness=2,
-            )
-            left = min(left, x)
-            right = max(right, x + width)
-            top = max(top, y + height)
-            bottom = min(bottom, y)
-        eyes = eye_predictor.detectMultiScale(
-            image=gray_frame,
-            scaleFactor=SCALE_FACTOR,
-            minNeighbors=MIN_NEIGHBORS,
+        if not crop and not backend.localizes_faces:
+            return FrameAnalysis(FrameStatus.NO_FACE, list())
+        fallback = not crop
+        if fallback and timings is not None:
+            timings.increment('fallback')
+        start = perf_counter()
+        emotions = backend.analyze(
+            frame[bottom:top, left:right] if crop else frame,
+            enforce_detection=False,
+            context=context,
         )
-        if len(eyes) == 0:
-            raise Exception('Looked away')
-        for x, y, width, height in eyes:
-            cv2.rectangle(
-                img=frame,
-                pt1=(x, y),
-                pt2=(x + width, y + height), 
-                color=(255, 0, 0),
-                thickness=2,
-            )
-            left = min(left, x)
-            right = max(right, x + width)
-            top = max(top, y + height)
-            bottom = min(bottom, y)
-        emotions = None
-        try:
-            emotions = DeepFace.analyze(
-                img_path=frame[bottom:top, left:right],
-                actions=['emotion']
-            )
-        except ValueError:
-            emotions = DeepFace.analyze(
-                img_path=frame,
-                actions=['emotion'],
-                enforce_detection=False
-            )
-        return emotions
+        if timings is not None:
+            timings.add('inference', perf_counter() - start)
+            start = perf_counter()
+        if annotate:
+            for x, y, width, height in detection.features:
+                cv2.rectangle(
+                    img=frame,
+                    pt1=(x, y),
+                    pt2=(x + width, y + height),
+                    color=(255, 0, 0),
+                    thickness=2,
+                )
+        results = list()
+        for report in emotions:
+            result = FrameResult.from_report(report)
+            if result is None or not result.complete:
+                if timings is not None:
+                    timings.increment('validation_errors')
+            if result is not None:
+                results.append(result)
+        if timings is not None:
+            timings.add('validation', perf_counter() - start)
+        if not results:
+            return FrameAnalysis(FrameStatus.NO_FACE, list(), fallback)
+        return FrameAnalysis(FrameStatus.ANALYZED, results, fallback)
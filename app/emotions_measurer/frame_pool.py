@@ -0,0 +1,137 @@
+from multiprocessing import Queue, active_children
+from multiprocessing.pool import AsyncResult, Pool
+from multiprocessing.process import BaseProcess
+from queue import Empty
+from typing import Callable, Optional, Tuple
+import numpy as np
+from app.emotions_measurer.face_detectors import DEFAULT_FACE_DETECTOR
+from app.emotions_measurer.frame_transport import SharedFrameRing
+from app.emotions_measurer.inference_backends import DEFAULT_INFERENCE_BACKEND
+from app.utils.utility_functions import init_shared_frames_worker
+
+
+def ensure_workers_alive(workers: list[BaseProcess]) -> None:
+    """Threads only die on their own when the system kills them."""
+    for worker in workers:
+        if not worker.is_alive():
+            raise MemoryError(
+                f'Thread was stopped with exit code {worker.exitcode}.'
+            )
+
+
+def wait_for_free_slot(
+        free_queue: Queue,
+        pending: AsyncResult,
+        workers: list[BaseProcess],
+) -> int:
+    """Get a free slot, failing fast if the threads have stopped."""
+    while True:
+        try:
+            return free_queue.get(timeout=1.0)
+        except Empty:
+            if pending.ready():
+                pending.get()
+                raise RuntimeError('Analysis threads stopped unexpectedly.')
+            ensure_workers_alive(workers)
+
+
+class SharedFramePool:
+    """
+    Pool of threads analyzing the frames sent through a shared frame ring.
+
+    The threads are started once and analyze the frames in rounds:
+    1. A round is started with the function the threads run.
+    2. Decoded frames are written into free slots and only the slot
+    indexes are sent to the threads, with the index of the frame
+    and the part of the round it belongs to.
+    3. The round is finished by a stop sentinel for each thread,
+    and the results of all threads are returned.
+    The decoder blocks when all slots are busy, which bounds the memory
+    used by the decoded frames. A thread killed by the system
+    is reported as MemoryError.
+    """
+
+    def __init__(
+            self,
+            frame_shape: Tuple[int, ...],
+            dtype: np.dtype,
+            thread_amount: int,
+            slots_amount: int,
+            trace: bool = False,
+            cpu_profile_path: Optional[str] = None,
+            inference_backend: str = DEFAULT_INFERENCE_BACKEND,
+            face_detector: str = DEFAULT_FACE_DETECTOR,
+            annotate_frames: bool = False,
+    ) -> None:
+        self._thread_amount = thread_amount
+        self._ring = SharedFrameRing(frame_shape, dtype, slots_amount)
+        self._task_queue = Queue()
+        self._free_queue = Queue()
+        for slot in range(self._ring.slots_amount):
+            self._free_queue.put(slot)
+        try:
+            existing_processes = set(active_children())
+            self._pool = Pool(
+                processes=thread_amount,
+                initializer=init_shared_frames_worker,
+                initargs=(
+                    self._ring.descriptor,
+                    self._task_queue,
+                    self._free_queue,
+                    trace,
+                    cpu_profile_path,
+                    inference_backend,
+                    face_detector,
+                    annotate_frames,
+                ),
+            )
+        except BaseException:
+            self._ring.close()
+            raise
+        self._workers = [
+            process for process in active_children()
+            if process not in existing_processes
+        ]
+        self._pending: Optional[AsyncResult] = None
+
+    def __enter__(self) -> 'SharedFramePool':
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
+
+    def fits(self, frame_shape: Tuple[int, ...]) -> bool:
+        """Whether a frame of the shape fits into a slot."""
+        return self._ring.fits(frame_shape)
+
+    def start_round(self, function: Callable[[int], object]) -> None:
+        """Run the function on every thread, numbered from 1."""
+        self._pending = self._pool.map_async(
+            func=function,
+            iterable=range(1, self._thread_amount + 1),
+            chunksize=1,
+        )
+
+    def send(self, frame: np.ndarray, frame_index: int, part: int = 0) -> None:
+        """Write the frame into a free slot and send it to the threads."""
+        slot = wait_for_free_slot(self._free_queue, self._pending, self._workers)
+        self._ring.write(slot, frame)
+        self._task_queue.put((slot, frame_index, part, frame.shape))
+
+    def finish_round(self) -> list:
+        """Stop the threads of the round and get their results."""
+        for _ in range(self._thread_amount):
+            self._task_queue.put(None)
+        while not self._pending.ready():
+            self._pending.wait(timeout=1.0)
+            ensure_workers_alive(self._workers)
+        results = self._pending.get()
+        self._pending = None
+        return results
+
+    def close(self) -> None:
+        """Stop the threads and remove the ring."""
+        try:
+            self._pool.terminate()
+        finally:
+            self._ring.close()
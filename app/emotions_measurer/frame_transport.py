@@ -0,0 +1,118 @@
+from multiprocessing import shared_memory
+from typing import Final, Optional, Tuple
+import numpy as np
+
+
+SLOTS_PER_WORKER: Final[int] = 4
+
+
+class SharedFrameRing:
+    """
+    Ring buffer of fixed-size frame slots placed in shared memory.
+
+    The decoding process writes frames into free slots and ships only
+    slot indices to the workers, which read the frames without copying.
+    The ownership of the slots is the following:
+    1. The parent takes a free slot index, writes a frame into it.
+    2. The slot index is sent to a worker over the task queue.
+    3. The worker analyzes the frame in place and gives the slot back.
+    A slot also holds any smaller frame, stored from its start,
+    which is read back by passing its shape.
+    """
+
+    def __init__(
+            self,
+            frame_shape: Tuple[int, ...],
+            dtype: np.dtype,
+            slots_amount: int,
+            name: str = None,
+    ) -> None:
+        """
+        Create a new ring or attach to an existing one by name.
+
+        The creator of the ring is responsible for unlinking it.
+        """
+        self._frame_shape = tuple(frame_shape)
+        self._dtype = np.dtype(dtype)
+        self._slots_amount = slots_amount
+        self._slot_size = int(np.prod(self._frame_shape)) * self._dtype.itemsize
+        self._owner = name is None
+        if self._owner:
+            self._memory = shared_memory.SharedMemory(
+                create=True,
+                size=self._slot_size * slots_amount,
+            )
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        self._frames = np.ndarray(
+            shape=(slots_amount, *self._frame_shape),
+            dtype=self._dtype,
+            buffer=self._memory.buf,
+        )
+        self._slots = self._frames.reshape(slots_amount, -1)
+
+    @property
+    def descriptor(self) -> Tuple[str, Tuple[int, ...], str, int]:
+        """Picklable description of the ring, used to attach from workers."""
+        return (
+            self._memory.name,
+            self._frame_shape,
+            self._dtype.str,
+            self._slots_amount,
+        )
+
+    @classmethod
+    def attach(
+            cls,
+            descriptor: Tuple[str, Tuple[int, ...], str, int],
+    ) -> 'SharedFrameRing':
+        """Attach to the ring created by another process."""
+        name, frame_shape, dtype, slots_amount = descriptor
+        return cls(frame_shape, np.dtype(dtype), slots_amount, name)
+
+    @property
+    def slots_amount(self) -> int:
+        return self._slots_amount
+
+    @property
+    def frame_shape(self) -> Tuple[int, ...]:
+        return self._frame_shape
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the shared memory of all slots."""
+        return self._slot_size * self._slots_amount
+
+    def fits(self, frame_shape: Tuple[int, ...]) -> bool:
+        """Whether a frame of the shape fits into a slot."""
+        return int(np.prod(frame_shape)) <= self._slots.shape[1]
+
+    def write(self, slot: int, frame: np.ndarray) -> None:
+        """Copy the decoded frame into the given slot."""
+        if frame.shape == self._frame_shape:
+            np.copyto(self._frames[slot], frame)
+            return
+        if not self.fits(frame.shape):
+            raise ValueError(
+                f'Frame of shape {frame.shape} does not fit '
+                f'into a slot of shape {self._frame_shape}.'
+            )
+        np.copyto(self._slots[slot, :frame.size].reshape(frame.shape), frame)
+
+    def read(
+            self,
+            slot: int,
+            frame_shape: Optional[Tuple[int, ...]] = None,
+    ) -> np.ndarray:
+        """Get a view on the frame stored in the given slot (no copy)."""
+        if frame_shape is None or tuple(frame_shape) == self._frame_shape:
+            return self._frames[slot]
+        return self._slots[slot, :int(np.prod(frame_shape))].reshape(frame_shape)
+
+    def close(self) -> None:
+        """Release the mapping and remove the segment if it is owned."""
+        del self._slots
+        del self._frames
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
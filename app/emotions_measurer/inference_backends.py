@@ -0,0 +1,212 @@
+import os
+from typing import Any, Final, Optional
+import numpy as np
+from app.data_models.models import Emotions
+from app.emotions_measurer.preprocessing import (
+    PreprocessingContext,
+    get_preprocessing_context,
+)
+
+
+INFERENCE_BACKENDS: Final[tuple[str, ...]] = ('deepface', 'onnx')
+DEFAULT_INFERENCE_BACKEND: Final[str] = 'deepface'
+FACE_REGION_BACKENDS: Final[tuple[str, ...]] = ('onnx',)
+EMOTION_LABELS: Final[tuple[Emotions, ...]] = (
+    Emotions.ANGRY,
+    Emotions.DISGUST,
+    Emotions.FEAR,
+    Emotions.HAPPY,
+    Emotions.SAD,
+    Emotions.SURPRISE,
+    Emotions.NEUTRAL,
+)
+EMOTION_INPUT_SIZE: Final[int] = 48
+ONNX_MODEL_ENVIRONMENT_VARIABLE: Final[str] = 'EMOTION_ONNX_MODEL'
+DEFAULT_ONNX_MODEL_PATH: Final[str] = os.path.join('models', 'facial_expression.onnx')
+
+
+class InferenceBackend:
+    """
+    Emotion classifier used by FrameAnalyzer.
+
+    Every backend returns the reports in the same shape as DeepFace does:
+    a list with a dictionary per face, containing emotion percentages,
+    dominant emotion, region and face confidence.
+    If the preprocessing context is given, the image is prepared
+    for the model in its buffers.
+    Backends which localize faces find the face in the image
+    themselves, others expect the image to be the face region.
+    """
+
+    name: str = ''
+    localizes_faces: bool = True
+
+    def analyze(
+            self,
+            image: np.ndarray,
+            enforce_detection: bool = True,
+            context: Optional[PreprocessingContext] = None,
+    ) -> list[dict[str, Any]]:
+        raise NotImplementedError
+
+
+class DeepFaceBackend(InferenceBackend):
+    """
+    Backend running DeepFace (TensorFlow/Keras) analysis.
+
+    Only the conversion of grayscale images to BGR uses the context,
+    DeepFace allocates its own crop, resize and normalization.
+    """
+
+    name = 'deepface'
+
+    def __init__(self) -> None:
+        from deepface import DeepFace
+        self._deepface = DeepFace
+
+    def analyze(
+            self,
+            image: np.ndarray,
+            enforce_detection: bool = True,
+            context: Optional[PreprocessingContext] = None,
+    ) -> list[dict[str, Any]]:
+        if image.ndim == 2:
+            image = get_preprocessing_context(context).bgr(image)
+        return self._deepface.analyze(
+            img_path=image,
+            actions=['emotion'],
+            enforce_detection=enforce_detection,
+        )
+
+
+class OnnxEmotionBackend(InferenceBackend):
+    """
+    Backend running the DeepFace emotion model exported to ONNX.
+
+    Only onnxruntime is imported, so the threads do not load TensorFlow.
+    The backend does not localize faces, so it is used only with
+    the detectors of face boxes, and FrameAnalyzer gives it the face box.
+    The image is converted to grayscale, padded to a square, resized to 48x48 and scaled
+    to [0, 1], which is the preprocessing DeepFace applies before
+    the same model.
+    As there is no face detector in the backend, the confidence
+    of the dominant emotion is reported as face confidence.
+    """
+
+    name = 'onnx'
+    localizes_faces = False
+
+    def __init__(self, model_path: str = None) -> None:
+        import onnxruntime
+        model_path = model_path or os.environ.get(
+            ONNX_MODEL_ENVIRONMENT_VARIABLE,
+            DEFAULT_ONNX_MODEL_PATH,
+        )
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(
+                f'ONNX emotion model is not found at {model_path}. '
+                'Export it with export_deepface_emotion_model first.'
+            )
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=['CPUExecutionProvider'],
+        )
+        self._input_name = self._session.get_inputs()[0].name
+
+    def analyze(
+            self,
+            image: np.ndarray,
+            enforce_detection: bool = True,
+            context: Optional[PreprocessingContext] = None,
+    ) -> list[dict[str, Any]]:
+        if image.size == 0:
+            if enforce_detection:
+                raise ValueError('Face could not be detected in an empty image.')
+            return list()
+        context = get_preprocessing_context(context)
+        gray = context.grayscale(image)
+        tensor = context.normalized(
+            context.resize(
+                context.letterbox(gray),
+                (EMOTION_INPUT_SIZE, EMOTION_INPUT_SIZE),
+            )
+        )
+        predictions = self._session.run(
+            None,
+            {self._input_name: tensor},
+        )[0][0]
+        percentages = 100 * predictions / max(float(predictions.sum()), 1e-12)
+        dominant = int(np.argmax(percentages))
+        height, width = gray.shape[:2]
+        return [
+            {
+                'emotion': {
+                    str(label): float(percentages[i])
+                    for i, label in enumerate(EMOTION_LABELS)
+                },
+                'dominant_emotion': str(EMOTION_LABELS[dominant]),
+                'region': {
+                    'x': 0,
+                    'y': 0,
+                    'w': width,
+                    'h': height,
+                    'left_eye': None,
+                    'right_eye': None,
+                },
+                'face_confidence': float(predictions[dominant]),
+            }
+        ]
+
+
+def get_inference_backend(name: str = DEFAULT_INFERENCE_BACKEND) -> InferenceBackend:
+    """Create the backend by its name."""
+    if name == 'onnx':
+        return OnnxEmotionBackend()
+    if name == 'deepface':
+        return DeepFaceBackend()
+    raise ValueError(
+        f'Unknown inference backend "{name}", '
+        f'expected one of: {", ".join(INFERENCE_BACKENDS)}.'
+    )
+
+
+def export_deepface_emotion_model(
+        output_path: str = DEFAULT_ONNX_MODEL_PATH,
+        quantize: bool = False,
+) -> str:
+    """
+    Export the DeepFace emotion model to ONNX, optionally quantized to int8.
+
+    TensorFlow, DeepFace and tf2onnx are needed only for the export.
+    With quantization, the weights are dynamically quantized to int8
+    and the quantized model is saved next to the float one with .int8 suffix.
+    """
+    import tensorflow
+    import tf2onnx
+    from deepface.modules import modeling
+    model = modeling.build_model('Emotion').model
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tf2onnx.convert.from_keras(
+        model,
+        input_signature=[
+            tensorflow.TensorSpec(
+                (None, EMOTION_INPUT_SIZE, EMOTION_INPUT_SIZE, 1),
+                tensorflow.float32,
+                name='input',
+            )
+        ],
+        output_path=output_path,
+    )
+    if not quantize:
+        return output_path
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    root, extension = os.path.splitext(output_path)
+    quantized_path = f'{root}.int8{extension}'
+    quantize_dynamic(output_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
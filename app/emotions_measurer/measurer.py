@@ -1,17 +1,76 @@
-from typing import Tuple, Optional, Final
+import math
+import os
+from itertools import chain
+from time import perf_counter, sleep
+from typing import Iterable, Sequence, Tuple, Optional, Final
 import cv2
-from pydantic_core import ValidationError
-from app.emotions_measurer.frame_analyzer import FrameAnalyzer
+import numpy as np
+from app.emotions_measurer.frame_analyzer import FrameAnalyzer, FrameStatus
+from app.emotions_measurer.inference_backends import (
+    get_inference_backend,
+    DEFAULT_INFERENCE_BACKEND,
+    FACE_REGION_BACKENDS,
+    EMOTION_LABELS,
+)
+from app.emotions_measurer.face_detectors import (
+    get_face_detector,
+    DEFAULT_FACE_DETECTOR,
+    FACE_BOX_DETECTORS,
+)
+from app.emotions_measurer.video_decoders import (
+    get_video_decoder,
+    VideoDecoder,
+    DEFAULT_VIDEO_DECODER,
+)
+from app.emotions_measurer.frame_transport import SLOTS_PER_WORKER
+from app.emotions_measurer.frame_pool import SharedFramePool
+from app.emotions_measurer.preprocessing import PreprocessingContext
+from app.utils.analysis_artifact import AnalysisArtifact
+from app.utils.best_frames import BestFramesTracker
+from app.utils.checkpoints import (
+    checkpoint_key as get_checkpoint_key,
+    chunk_bounds,
+    ChunkCheckpoints,
+    ChunkKey,
+    ChunkResult,
+    remove_expired_checkpoints,
+    stable_key,
+    CHUNK_FRAMES,
+)
+from app.utils.chunk_queue import ChunkQueue
+from app.utils.estimation import (
+    estimate_percentages,
+    stratified_rounds,
+    EmotionEstimate,
+    DEFAULT_ESTIMATION_CONFIDENCE,
+    ESTIMATION_STRATA,
+    ESTIMATION_ROUND_FRAMES,
+    LOOKED_AWAY_KEY,
+)
+from app.utils.instrumentation import StageTimings
+from app.utils.temporal_smoothing import (
+    empty_scores,
+    emotion_occurances,
+    smooth_scores,
+    timeline_coordinates,
+    DEFAULT_SMOOTHING_METHOD,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+from app.utils.tracing import TraceRecorder
+from app.utils.resources import (
+    available_cpu_count,
+    plan_workers,
+    record_worker_footprint,
+)
 from app.utils.utility_functions import (
-    get_amount_of_frames,
-    separate_frames_into_arrays,
-    analyze_several_frames,
+    analyze_shared_frames,
+    score_vector,
 )
-from app.data_models.models import EmotionalReport, Emotions
-from multiprocessing.pool import Pool
+from app.data_models.models import Emotions
 
 
-THREADS_AMOUNT: Final[int] = 6
+POLL_INTERVAL: Final[float] = 2.0
+MAX_SKIPPED_FRAMES: Final[int] = 50
 EMOTIONS_GRAPH_INTERPRETATION: Final[dict[Emotions, float]] = {
     Emotions.NEUTRAL: 0.0,
     Emotions.ANGRY: -0.75,
@@ -35,6 +94,18 @@ class EmotionsMeasurer:
             input_path: str,
             thread_amount: Optional[int],
             mode: str,
+            trace_path: Optional[str] = None,
+            cpu_profile: bool = False,
+            inference_backend: str = DEFAULT_INFERENCE_BACKEND,
+            face_detector: str = DEFAULT_FACE_DETECTOR,
+            checkpoint_key: Optional[str] = None,
+            resume: bool = True,
+            chunk_frames: int = CHUNK_FRAMES,
+            segments: Optional[list[Tuple[float, Optional[float]]]] = None,
+            video_decoder: str = DEFAULT_VIDEO_DECODER,
+            decode_grayscale: bool = False,
+            decode_max_side: Optional[int] = None,
+            annotate_frames: bool = False,
     ) -> None:
         """
         Initialisation of the measurer.
@@ -42,89 +113,647 @@ class EmotionsMeasurer:
         The given files are given by the user.
         During the initialization, the video capture is created.
         All esentials are being created.
+        If the amount of threads is not given, it is chosen automatically
+        from the CPU and memory limits when the frame size is known.
+        If the trace path is given, the analysis is written there
+        as Chrome trace, optionally with CPU profiles of the threads.
+        The inference backend is the name of the emotion classifier to use,
+        the face detector is the name of the region of interest detector.
+        Backends which classify only face regions are not combined
+        with the detectors of facial features, ValueError is raised.
+        The video is analyzed in chunks of the given amount of frames.
+        Finished chunks of the analysis are saved under the checkpoint key,
+        which is derived from the file if not given. Unless resume is off,
+        the chunks saved by a previous run are not analyzed again.
+        Checkpoints of the analyses not used for the retention period
+        are removed, see remove_expired_checkpoints.
+        If segments are given as start and end seconds, the end being None
+        for the end of the video, only the frames of the segments are analyzed.
+        The video decoder is the name of the decoder of the file, which
+        may decode straight to grayscale or to a reduced longest side.
+        If annotate frames is set, detected features are drawn
+        on the frames, as they always are in the realtime preview.
         """
+        if inference_backend in FACE_REGION_BACKENDS and face_detector not in FACE_BOX_DETECTORS:
+            raise ValueError(
+                f'Inference backend {inference_backend} classifies face regions only, '
+                f'face detector is expected to be one of: {", ".join(FACE_BOX_DETECTORS)}.'
+            )
         self._frames_amount = 0
+        self._position: Optional[int] = 0
+        self._peeked: Optional[Tuple[int, np.ndarray]] = None
+        self._video_decoder = video_decoder
+        self._decode_grayscale = decode_grayscale
+        self._decode_max_side = decode_max_side
         if mode == '' or mode is None:
             self._input_path = input_path
-            self._video_capture = cv2.VideoCapture(
-                filename=self._input_path
-            )
+            self._decoder = self._open_video()
             self._size: Tuple[int, int] = (0, 0)
             self._thread_amount = thread_amount \
-                if thread_amount is not None else THREADS_AMOUNT
-            self._frames_amount = get_amount_of_frames(self._video_capture)
+                if thread_amount is not None else available_cpu_count()
+            self._slots_amount = thread_amount * SLOTS_PER_WORKER \
+                if thread_amount is not None else None
+            self._frames_amount = self._decoder.frames_amount()
+            self._fps = self._decoder.fps
+            self._chunk_frames = chunk_frames
+            self._checkpoint_key = get_checkpoint_key(
+                input_path,
+                inference_backend,
+                face_detector,
+                self._chunk_frames,
+                video_decoder,
+                decode_grayscale,
+                decode_max_side,
+            ) if checkpoint_key is None else stable_key(
+                checkpoint_key,
+                inference_backend,
+                face_detector,
+                self._chunk_frames,
+                video_decoder,
+                decode_grayscale,
+                decode_max_side,
+            )
+            remove_expired_checkpoints()
+            self._checkpoints = ChunkCheckpoints(self._checkpoint_key)
+            if not resume:
+                self._checkpoints.clear()
+            self._checkpoints.touch()
         self._emotions_occurances: dict[Emotions, int] = dict()
         self._looked_away = 0
         self._coordinates: list[Tuple[int, float]] = list()
-        self._best_performance = dict()
+        self._best_performance: dict[Emotions, list[bytes]] = dict()
+        self._scores = empty_scores(self._frames_amount)
+        self._estimate: Optional[EmotionEstimate] = None
+        self._segments = segments
+        self._trace_path = trace_path
+        self._cpu_profile = cpu_profile
+        self._inference_backend = inference_backend
+        self._face_detector = face_detector
+        self._annotate_frames = annotate_frames
+        self._stage_timings = StageTimings(
+            TraceRecorder(0, 'decoder') if trace_path is not None else None
+        )
 
     def analyse_prepared_video(self) -> None:
         """
         Shares info between processes and initializes the analysis.
 
         The following steps are taken:
-        1. Separate frames between threads.
-        2. Start threads according to users input.
-        3. In each thread, the frames are being analyzed one by one.
-        4. Afterwards, the results are gathered and registered.        
-        """
-        self._frames_arrays = separate_frames_into_arrays(
-            self._video_capture,
-            self._thread_amount,
-            self._frames_amount
-        )
+        1. Split the video into chunks of frames, load the completed ones.
+        2. Allocate a ring of frame slots in shared memory.
+        3. Start threads according to users input or the resources available.
+        4. Decode frames of each missing chunk into free slots
+        and send slot indexes to threads.
+        5. In each thread, the frames are being analyzed one by one.
+        6. Each finished chunk is saved, so a restarted analysis resumes.
+        7. If the memory runs out, retry the missing chunks with half of the threads.
+        8. Afterwards, the chunks are merged in order and registered.
+        9. Emotion scores of every analyzed frame are kept in one array.
+        If segments are set, see analyse_segments.
+        """
+        if self._segments is not None:
+            self.analyse_segments()
+            return
         print('[INFO] Starting to analyse the video.')
-        processes_arguments = [
-            (self._frames_arrays[i], i + 1) \
-                for i in range(self._thread_amount)
-        ]
-        results: list[dict[Emotions], int, list[Tuple[int, float]]] = list()
-        with Pool(processes=self._thread_amount) as pool:
+        chunks, chunk_results = self.plan_chunks()
+        if chunk_results:
+            print(
+                f'[INFO] Resuming the analysis: {len(chunk_results)} of '
+                f'{len(chunks)} chunks are already done.'
+            )
+        try:
+            self._analyze_chunks_with_retries(chunks.items(), chunk_results)
+        finally:
+            self.release_video()
+        self.merge_chunk_results(chunk_results)
+
+    def plan_chunks(self) -> Tuple[dict[int, range], dict[int, ChunkResult]]:
+        """Frame ranges of the chunks of the video and the results of the saved chunks."""
+        chunks = {
+            chunk: range(start, end)
+            for chunk, (start, end) in enumerate(
+                chunk_bounds(self._frames_amount, self._chunk_frames)
+            )
+        }
+        return chunks, self._load_checkpoints(chunks)
+
+    def analyse_segments(self) -> None:
+        """
+        Analyze only the frames of the segments of the video.
+
+        The segments are split at the chunk bounds. Parts covering
+        a whole chunk are analyzed and saved as chunks, other parts
+        are saved under their frame ranges. A part already covered
+        by a saved chunk or range is taken from it, so overlapping
+        requests for the same video are not analyzed again.
+        Only the frames of the parts are decoded, the video is sought
+        between them. Frame indexes of the timeline and of the scores
+        stay absolute, the amount of frames becomes the amount
+        in the segments, so the percentages refer to the segments.
+        """
+        ranges = self.segment_frame_ranges()
+        print(
+            '[INFO] Starting to analyse the segments: ' + ', '.join(
+                f'{start / self._fps:.2f}-{end / self._fps:.2f} s'
+                for start, end in ranges
+            ) + '.'
+        )
+        parts: dict[ChunkKey, Tuple[int, int]] = dict()
+        for chunk, (chunk_start, chunk_end) in enumerate(
+                chunk_bounds(self._frames_amount, self._chunk_frames)
+        ):
+            for start, end in ranges:
+                start, end = max(start, chunk_start), min(end, chunk_end)
+                if start < end:
+                    key = chunk if (start, end) == (chunk_start, chunk_end) \
+                        else (start, end)
+                    parts[key] = (start, end)
+        stored_ranges = self._checkpoints.stored_ranges()
+        part_results: dict[ChunkKey, ChunkResult] = dict()
+        for key, (start, end) in parts.items():
+            part_result = self._checkpoints.load(key)
+            if part_result is None and isinstance(key, tuple):
+                stored = self._checkpoints.load(start // self._chunk_frames)
+                if stored is None:
+                    covering = next((
+                        (stored_start, stored_end)
+                        for stored_start, stored_end in stored_ranges
+                        if stored_start <= start and end <= stored_end
+                    ), None)
+                    if covering is not None:
+                        stored = self._checkpoints.load(covering)
+                if stored is not None:
+                    part_result = stored.restricted(start, end)
+            if part_result is not None:
+                part_results[key] = part_result
+        if part_results:
+            print(
+                f'[INFO] {len(part_results)} of {len(parts)} parts '
+                'of the segments are taken from the saved analysis.'
+            )
+        try:
+            self._analyze_chunks_with_retries(
+                [(key, range(start, end)) for key, (start, end) in parts.items()],
+                part_results,
+            )
+        finally:
+            self.release_video()
+        self.merge_chunk_results({
+            parts[key][0]: part_result for key, part_result in part_results.items()
+        })
+        self._frames_amount = sum(end - start for start, end in parts.values())
+
+    def segment_frame_ranges(self) -> list[Tuple[int, int]]:
+        """Sorted non-overlapping [start, end) frame ranges of the segments."""
+        if not self._fps or self._fps <= 0:
+            raise ValueError('Frame rate of the video is unknown, segments cannot be located.')
+        ranges: list[Tuple[int, int]] = list()
+        for start, end in sorted(self._segments, key=lambda segment: segment[0]):
+            first = max(0, math.floor(start * self._fps))
+            last = self._frames_amount if end is None \
+                else min(self._frames_amount, math.ceil(end * self._fps))
+            if first >= last:
+                continue
+            if ranges and first <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], last))
+            else:
+                ranges.append((first, last))
+        return ranges
+
+    def estimate_video(
+            self,
+            tolerance: float,
+            confidence: float = DEFAULT_ESTIMATION_CONFIDENCE,
+            seed: Optional[int] = None,
+    ) -> EmotionEstimate:
+        """
+        Estimate the emotion percentages from a sample of frames.
+
+        Frames are analyzed in rounds of stratified random samples,
+        see stratified_rounds. After each round the confidence intervals
+        of the percentages are updated, and the analysis stops once
+        all of them are narrower than the tolerance in percentage points.
+        The occurances and looked away amount are set from the estimate
+        for the whole video, so the reports show the estimated percentages.
+        The timeline and the best frames come from the sampled frames only.
+        If the memory runs out, the failed round is analyzed again
+        before the next one is drawn.
+        """
+        print(
+            f'[INFO] Starting to estimate the emotions within {tolerance:g} '
+            f'percentage points at {confidence * 100:g}% confidence.'
+        )
+        chunk_results: dict[int, ChunkResult] = dict()
+        sampled: dict[int, np.ndarray] = dict()
+
+        def current_estimate() -> EmotionEstimate:
+            done = sorted(chunk_results.keys())
+            return estimate_percentages(
+                np.concatenate([sampled[chunk] for chunk in done]),
+                np.concatenate([chunk_results[chunk].frame_indexes for chunk in done]),
+                np.concatenate([chunk_results[chunk].scores for chunk in done]),
+                self._frames_amount,
+                ESTIMATION_STRATA,
+                confidence,
+            )
+
+        def rounds() -> Iterable[Tuple[int, np.ndarray]]:
+            for sample_round, frames in enumerate(stratified_rounds(
+                    self._frames_amount,
+                    ESTIMATION_STRATA,
+                    ESTIMATION_ROUND_FRAMES,
+                    seed,
+            )):
+                if chunk_results:
+                    estimate = current_estimate()
+                    print(
+                        f'[INFO] Sampled {estimate.sampled_frames} frames, '
+                        f'largest error is {estimate.max_error:.2f} '
+                        'percentage points.'
+                    )
+                    if estimate.within(tolerance):
+                        return
+                sampled[sample_round] = frames
+                yield sample_round, frames
+                # The round is taken again if its analysis failed
+                # and is retried with fewer threads.
+                while sample_round not in chunk_results and len(frames) > 0:
+                    yield sample_round, frames
+
+        try:
+            self._analyze_chunks_with_retries(rounds(), chunk_results, False)
+        finally:
+            self.release_video()
+        self.merge_chunk_results(chunk_results)
+        self._estimate = current_estimate() if chunk_results else EmotionEstimate(
+            dict(),
+            dict(),
+            0,
+            self._frames_amount,
+            confidence,
+        )
+        if chunk_results:
+            self._looked_away = round(
+                self._estimate.percentages[LOOKED_AWAY_KEY] / 100 * self._frames_amount
+            )
+            occurances = {
+                label: round(
+                    self._estimate.percentages[str(label)] / 100
+                    * (self._frames_amount - self._looked_away)
+                )
+                for label in EMOTION_LABELS
+            }
+            self._emotions_occurances = {
+                label: amount for label, amount in occurances.items() if amount > 0
+            }
+        print(f'[INFO] {self._estimate.summary()}')
+        return self._estimate
+
+    def analyse_chunks(
+            self,
+            chunks: dict[int, Tuple[int, int]],
+    ) -> dict[int, ChunkResult]:
+        """
+        Analyze only the given chunks, numbered ranges of frames.
+
+        Used by the workers of the distributed analysis. The video
+        stays open between the calls, the chunks saved before are loaded.
+        """
+        self.open_video()
+        chunk_results = self._load_checkpoints(chunks)
+        self._analyze_chunks_with_retries(
+            [(chunk, range(start, end)) for chunk, (start, end) in chunks.items()],
+            chunk_results,
+        )
+        return chunk_results
+
+    def publish_chunks(self, queue: ChunkQueue) -> int:
+        """
+        Publish the chunks of the video to the queue, return their amount.
+
+        The job is published under the checkpoint key, so a restarted
+        coordinator waits for the same job. The video has to be available
+        to the workers at the same path.
+        """
+        self.release_video()
+        chunks_amount = queue.publish(
+            self._checkpoint_key,
+            os.path.abspath(self._input_path),
+            self._frames_amount,
+            self._chunk_frames,
+            self._inference_backend,
+            self._face_detector,
+            self._video_decoder,
+            self._decode_grayscale,
+            self._decode_max_side,
+        )
+        print(
+            f'[INFO] Published {chunks_amount} chunks of the video '
+            f'as job {self._checkpoint_key}.'
+        )
+        return chunks_amount
+
+    def analyse_distributed(
+            self,
+            queue: ChunkQueue,
+            poll_interval: float = POLL_INTERVAL,
+    ) -> None:
+        """
+        Wait for the workers of the queue to analyze the published chunks.
+
+        Finished chunks are collected as they come and merged in order,
+        as the local analysis does. Once merged, the job and its results
+        are removed from the queue, so publishing the video again
+        analyzes it again instead of reusing the old results.
+        """
+        job_id = self._checkpoint_key
+        chunks_amount = len(chunk_bounds(self._frames_amount, self._chunk_frames))
+        chunk_results: dict[int, ChunkResult] = dict()
+        reported = None
+        while True:
+            chunk_results.update(queue.results(job_id, set(chunk_results)))
+            progress = queue.progress(job_id)
+            if progress.get('failed', 0) > 0:
+                raise RuntimeError(
+                    f'{progress["failed"]} chunks of job {job_id} '
+                    'failed on every attempt.'
+                )
+            if len(chunk_results) >= chunks_amount:
+                break
+            if reported != (len(chunk_results), progress.get('leased', 0)):
+                reported = (len(chunk_results), progress.get('leased', 0))
+                print(
+                    f'[INFO] {reported[0]} of {chunks_amount} chunks are done, '
+                    f'{reported[1]} are being analyzed.'
+                )
+            sleep(poll_interval)
+        self.merge_chunk_results(chunk_results)
+        queue.remove(job_id)
+
+    def _load_checkpoints(self, chunks: Iterable[int]) -> dict[int, ChunkResult]:
+        chunk_results: dict[int, ChunkResult] = dict()
+        for chunk in chunks:
+            chunk_result = self._checkpoints.load(chunk)
+            if chunk_result is not None:
+                chunk_results[chunk] = chunk_result
+        return chunk_results
+
+    def _analyze_chunks_with_retries(
+            self,
+            chunks: Iterable[Tuple[ChunkKey, Sequence[int]]],
+            chunk_results: dict[ChunkKey, ChunkResult],
+            save_checkpoints: bool = True,
+    ) -> None:
+        """If the memory runs out, retry the missing chunks with half of the threads."""
+        while True:
             try:
-                results = pool.starmap(
-                    func=analyze_several_frames,
-                    iterable=processes_arguments,
+                self._analyze_chunks_in_shared_memory(
+                    chunks,
+                    chunk_results,
+                    save_checkpoints,
                 )
+                break
             except MemoryError:
+                if self._thread_amount == 1:
+                    print(
+                        '[WARNING] MemoryError was raised '
+                        'while executing the analysis on a single thread.'
+                    )
+                    break
+                self._thread_amount = max(1, self._thread_amount // 2)
+                self._slots_amount = self._thread_amount * SLOTS_PER_WORKER
                 print(
                     '[WARNING] MemoryError was raised '
                     'while executing the analysis. '
-                    'Try lowering the amount of threads.')
-            finally:
-                self._video_capture.release()
-        for result in results:
-            for emotion in result[0].keys():
+                    f'Retrying with {self._thread_amount} threads.'
+                )
+                self.release_video()
+                self.open_video()
+
+    def merge_chunk_results(self, chunk_results: dict[int, ChunkResult]) -> None:
+        """Merge the chunks in order of their keys, register the result and the trace."""
+        merge_start = perf_counter()
+        best_frames = BestFramesTracker()
+        for chunk in sorted(chunk_results.keys()):
+            chunk_result = chunk_results[chunk]
+            for emotion, amount in chunk_result.emotions_occurances.items():
                 if Emotions(emotion) not in \
                         self._emotions_occurances.keys():
                     self._emotions_occurances[Emotions(emotion)] = 0
-                self._emotions_occurances[Emotions(emotion)] += \
-                    result[0][emotion]
-            self._looked_away += result[1]
-            for coordinate in result[2]:
-                self._coordinates.append(
-                    (
-                        results.index(result) * \
-                            (self._frames_amount // self._thread_amount) + \
-                                coordinate[0],
-                        coordinate[1],
-                    )
+                self._emotions_occurances[Emotions(emotion)] += amount
+            self._looked_away += chunk_result.looked_away
+            self._coordinates.extend(chunk_result.coordinates)
+            best_frames.merge(chunk_result.best_frames)
+            in_range = chunk_result.frame_indexes < len(self._scores)
+            self._scores[chunk_result.frame_indexes[in_range]] = \
+                chunk_result.scores[in_range]
+        self._best_performance = best_frames.thumbnails()
+        self._stage_timings.add('merge', perf_counter() - merge_start)
+        record_worker_footprint(
+            self._stage_timings.maximum('worker_peak_rss_bytes'),
+            self._inference_backend,
+        )
+        if self._stage_timings.trace is not None:
+            self._stage_timings.trace.write(self._trace_path)
+            print(f'[INFO] Trace of the analysis is saved to {self._trace_path}.')
+
+    def _analyze_chunks_in_shared_memory(
+            self,
+            chunks: Iterable[Tuple[ChunkKey, Sequence[int]]],
+            chunk_results: dict[ChunkKey, ChunkResult],
+            save_checkpoints: bool = True,
+    ) -> None:
+        """
+        Decode the frames of the missing chunks into a shared frame pool.
+
+        Each chunk is its key and the increasing indexes of its frames,
+        a range for the consecutive chunks of the video.
+        The pool stays up for all the chunks, each chunk is one round
+        of the threads, and its result is saved as soon as it is done.
+        Chunks are taken one by one after the previous is done, so the
+        next chunk may be chosen from the results of the previous ones.
+        The first frame is decoded before the pool is started,
+        as the frame slots are sized for it.
+        """
+        pending_chunks = (
+            (chunk, frames) for chunk, frames in chunks
+            if chunk not in chunk_results and len(frames) > 0
+        )
+        first_chunk = next(pending_chunks, None)
+        if first_chunk is None:
+            return
+        frame = self._peek_frame(first_chunk[1][0])
+        if frame is None:
+            return
+        if self._slots_amount is None:
+            self._thread_amount, self._slots_amount = plan_workers(
+                frame.shape,
+                frame.dtype.itemsize,
+                footprint_key=self._inference_backend,
+            )
+            print(
+                f'[INFO] Using {self._thread_amount} threads and '
+                f'{self._slots_amount} frame slots.'
+            )
+        with SharedFramePool(
+                frame.shape,
+                frame.dtype,
+                self._thread_amount,
+                self._slots_amount,
+                self._trace_path is not None,
+                self._trace_path if self._cpu_profile else None,
+                self._inference_backend,
+                self._face_detector,
+                self._annotate_frames,
+        ) as pool:
+            for chunk, frames in chain((first_chunk,), pending_chunks):
+                pool.start_round(analyze_shared_frames)
+                self.send_frames(pool, frames)
+                chunk_results[chunk] = self.chunk_result(
+                    chunk,
+                    pool.finish_round(),
+                    save_checkpoints,
                 )
-            for emotion in result[3].keys():
-                if Emotions(emotion) not in \
-                        self._best_performance.keys():
-                    self._best_performance[Emotions(emotion)] = list()
-                self._best_performance[Emotions(emotion)].append(result[3][emotion])
+                if save_checkpoints:
+                    print(f'[INFO] Frames {frames[0]}-{frames[-1] + 1} are done.')
+
+    def send_frames(
+            self,
+            pool: SharedFramePool,
+            frames: Sequence[int],
+            part: int = 0,
+    ) -> int:
+        """
+        Decode the frames and send them to the pool as the part of its round.
+
+        Frames between the indexes are skipped without being sent to the
+        threads when close, and by seeking the video otherwise. Sending
+        stops at the first frame which cannot be read or is larger
+        than the slots of the pool. The amount of sent frames is returned.
+        """
+        sent = 0
+        for frame_index in frames:
+            return_code, frame = self._read_frame(frame_index)
+            if not return_code:
+                break
+            if not pool.fits(frame.shape):
+                self._position = None
+                print(
+                    f'[WARNING] Frames of {self._input_path} are larger '
+                    'than its container reports, the rest of the chunk is skipped.'
+                )
+                break
+            pool.send(frame, frame_index, part)
+            sent += 1
+        return sent
+
+    def chunk_result(
+            self,
+            chunk: ChunkKey,
+            worker_results: list[tuple],
+            save_checkpoint: bool = True,
+    ) -> ChunkResult:
+        """Merge the results of the threads for the chunk, save it unless told otherwise."""
+        for result in worker_results:
+            self._stage_timings.merge(result[4])
+        chunk_result = ChunkResult.from_worker_results(worker_results)
+        if save_checkpoint:
+            self._checkpoints.save(chunk, chunk_result)
+        return chunk_result
+
+    def frame_format(self) -> Tuple[Tuple[int, ...], np.dtype]:
+        """
+        Shape and dtype of the decoded frames of the video.
+
+        Both come from the decoder, so they follow its grayscale
+        and max side. If the container does not report the size,
+        the first frame is decoded and kept for the analysis.
+        The shape is empty if the video has no frames.
+        """
+        frame_shape = self._decoder.frame_shape
+        if int(np.prod(frame_shape)) > 0:
+            return tuple(frame_shape), self._decoder.frame_dtype
+        frame = self._peek_frame(0)
+        if frame is None:
+            return (0,), self._decoder.frame_dtype
+        return frame.shape, frame.dtype
+
+    def open_video(self) -> None:
+        """Open the video again if it was released."""
+        if not self._decoder.is_opened():
+            self._decoder = self._open_video()
+            self._position = 0
+
+    def release_video(self) -> None:
+        """Close the video, it is opened again by open_video."""
+        self._decoder.release()
+        self._position = None
+        self._peeked = None
+
+    def _open_video(self) -> VideoDecoder:
+        return get_video_decoder(
+            self._input_path,
+            self._video_decoder,
+            self._decode_grayscale,
+            self._decode_max_side,
+        )
+
+    def _peek_frame(self, frame_index: int) -> Optional[np.ndarray]:
+        """Decode the frame and keep it for the next read of the same index."""
+        return_code, frame = self._read_frame(frame_index)
+        if not return_code:
+            return None
+        self._peeked = (frame_index, frame)
+        return frame
+
+    def _read_frame(self, frame_index: int) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Decode the frame at the index from the current position.
+
+        After a failed read the position is unknown,
+        so the video is sought before the next read.
+        """
+        if self._peeked is not None:
+            peeked_index, frame = self._peeked
+            self._peeked = None
+            if peeked_index == frame_index:
+                return True, frame
+        if self._position != frame_index:
+            self._position = self._skip_to(frame_index, self._position)
+        with self._stage_timings.measure('decode'):
+            return_code, frame = self._decoder.read()
+        self._position = frame_index + 1 if return_code else None
+        return return_code, frame
+
+    def _seek(self, frame_index: int) -> int:
+        """Position the video so that the next read returns the given frame."""
+        self._decoder.seek(frame_index)
+        return frame_index
+
+    def _skip_to(self, frame_index: int, position: Optional[int]) -> int:
+        """
+        Position the video at the frame from the current position.
+
+        Close frames are grabbed without being retrieved,
+        which is cheaper than seeking to the nearest keyframe.
+        If the position is unknown, the video is sought.
+        """
+        if position is None or frame_index < position or \
+                frame_index - position > MAX_SKIPPED_FRAMES:
+            return self._seek(frame_index)
+        with self._stage_timings.measure('decode'):
+            while position < frame_index:
+                self._decoder.grab()
+                position += 1
+        return position
 
     def analyze_realtime(self) -> None:
         """Analyze emotions in realtime from camera."""
-        best_performance_frame = dict()
-        best_confidence = dict()
-        brows_predictor = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye_tree_eyeglasses.xml'
-        )
-        eye_predictor = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye_tree_eyeglasses.xml'
-        )
+        best_frames = BestFramesTracker()
+        frame_scores: list[np.ndarray] = list()
+        detector = get_face_detector(self._face_detector)
+        backend = get_inference_backend(self._inference_backend)
+        context = PreprocessingContext()
         self._video_capture = cv2.VideoCapture(0)
         while self._video_capture.isOpened():
             return_code, frame = self._video_capture.read()
@@ -132,87 +761,86 @@ class EmotionsMeasurer:
                 print('[INFO] Input was ended.')
                 break
             self._frames_amount += 1
-            emotions = list()
-            try:
-                emotions = FrameAnalyzer.analyze_frame(
-                    frame,
-                    brows_predictor,
-                    eye_predictor
-                )
-            except Exception:
+            analysis = FrameAnalyzer.analyze_frame(
+                frame,
+                detector,
+                self._stage_timings,
+                backend,
+                context,
+                annotate=True,
+            )
+            if analysis.status != FrameStatus.ANALYZED:
                 self._looked_away += 1
-            for emotion in emotions:
-                try:
-                    emotion_model = EmotionalReport.model_validate(emotion)
-                    if Emotions(emotion_model.dominant_emotion) not in \
-                            self._emotions_occurances.keys():
-                        self._emotions_occurances[
-                            Emotions(emotion_model.dominant_emotion)
-                        ] = 0
-                        best_confidence[
-                            Emotions(emotion_model.dominant_emotion)
-                        ] = -1
-                    if best_confidence[Emotions(emotion_model.dominant_emotion)] < \
-                            emotion_model.face_confidence:
-                        best_performance_frame[
-                            Emotions(emotion_model.dominant_emotion)
-                        ] = frame
-                        best_confidence[
-                            Emotions(emotion_model.dominant_emotion)
-                        ] = emotion_model.face_confidence
-                    self._emotions_occurances[
-                        Emotions(emotion_model.dominant_emotion)
-                    ] += 1
-                    cv2.putText(
+            scores = empty_scores(1)[0]
+            if analysis.results:
+                scores[:] = score_vector(analysis.results[0])
+            frame_scores.append(scores)
+            for result in analysis.results:
+                if result.dominant_emotion not in \
+                        self._emotions_occurances.keys():
+                    self._emotions_occurances[result.dominant_emotion] = 0
+                self._emotions_occurances[result.dominant_emotion] += 1
+                if result.face_confidence is not None:
+                    best_frames.offer(
+                        result.dominant_emotion,
+                        result.face_confidence,
+                        self._frames_amount - 1,
                         frame,
-                        emotion_model.dominant_emotion,
-                        (frame.shape[0] // 2, frame.shape[1] // 2),
-                        cv2.FONT_HERSHEY_COMPLEX,
-                        0.9,
-                        (255, 0, 0), 
-                        3,       
                     )
-                    self._coordinates.append(
-                        (
-                            self._frames_amount - 1,
-                            EMOTIONS_GRAPH_INTERPRETATION[
-                                Emotions(emotion_model.dominant_emotion)
-                            ]
-                        )
+                cv2.putText(
+                    frame,
+                    str(result.dominant_emotion),
+                    (frame.shape[0] // 2, frame.shape[1] // 2),
+                    cv2.FONT_HERSHEY_COMPLEX,
+                    0.9,
+                    (255, 0, 0),
+                    3,
+                )
+                self._coordinates.append(
+                    (
+                        self._frames_amount - 1,
+                        EMOTIONS_GRAPH_INTERPRETATION[result.dominant_emotion]
                     )
-                except ValidationError:
-                    try:
-                        dominant = emotion['dominant_emotion']
-                        if Emotions(dominant) not in \
-                                self._emotions_occurances.keys():
-                            self._emotions_occurances[Emotions(dominant)] = 0
-                            self._best_performance[
-                                Emotions(dominant)
-                            ] = -1
-                        self._emotions_occurances[Emotions(dominant)] += 1
-                        cv2.putText(
-                            frame,
-                            dominant,
-                            (frame.shape[0] // 2, frame.shape[1] // 2),
-                            cv2.FONT_HERSHEY_COMPLEX,
-                            0.9,
-                            (255, 0, 0), 
-                            3,       
-                        )
-                        self._coordinates.append(
-                            (
-                                self._frames_amount - 1,
-                                EMOTIONS_GRAPH_INTERPRETATION[
-                                    Emotions(dominant)
-                                ]
-                            )
-                        )
-                    except KeyError:
-                        continue
+                )
             cv2.imshow('frame', frame)
             if cv2.waitKey(1) == ord('q'):
                 break
         self._video_capture.release()
         cv2.destroyAllWindows()
-        for emotion in best_performance_frame:
-            self._best_performance[Emotions(emotion)] = [best_performance_frame[emotion]]
+        self._best_performance = best_frames.thumbnails()
+        self._scores = np.array(frame_scores, dtype=np.float32).reshape(
+            -1,
+            self._scores.shape[1],
+        )
+
+    def analysis_artifact(self) -> AnalysisArtifact:
+        """Output of the analysis, which the reports can be rendered from."""
+        return AnalysisArtifact(
+            self._emotions_occurances,
+            self._looked_away,
+            self._frames_amount,
+            self._coordinates,
+            self._best_performance,
+            self._scores,
+        )
+
+    def apply_smoothing(
+            self,
+            method: str = DEFAULT_SMOOTHING_METHOD,
+            window: int = DEFAULT_SMOOTHING_WINDOW,
+    ) -> None:
+        """
+        Recompute the emotions occurances and the graph from smoothed scores.
+
+        The scores stored during the analysis are smoothed over the window
+        of frames, so no inference is run again and short flickers
+        of the dominant emotion do not skew the results.
+        """
+        if method == 'none' or len(self._scores) == 0:
+            return
+        smoothed = smooth_scores(self._scores, method, window)
+        self._emotions_occurances = emotion_occurances(smoothed)
+        self._coordinates = timeline_coordinates(
+            smoothed,
+            EMOTIONS_GRAPH_INTERPRETATION,
+        )
@@ -0,0 +1,108 @@
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+
+
+class PreprocessingContext:
+    """
+    Reusable buffers of the frame preprocessing of one worker.
+
+    Grayscale, color, resized, letterboxed and normalized images are
+    written by OpenCV into buffers allocated once per name, so that frames
+    of the same video do not allocate new images. The images are contiguous
+    views of the start of the buffer, which is reallocated only when
+    a larger image or another type is needed, so crops of varying size
+    reuse it as well. The images returned are overwritten by the next call
+    with the same buffer, so the context is used by one thread
+    and the images are not kept beyond the frame.
+    """
+
+    __slots__ = ('_buffers', 'allocations')
+
+    def __init__(self) -> None:
+        self._buffers: dict[str, np.ndarray] = dict()
+        self.allocations = 0
+
+    def buffer(
+            self,
+            name: str,
+            shape: Tuple[int, ...],
+            dtype: type = np.uint8,
+    ) -> np.ndarray:
+        """Image of the given shape in the buffer of the given name."""
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = np.empty(size, dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        return buffer[:size].reshape(shape)
+
+    def grayscale(self, image: np.ndarray) -> np.ndarray:
+        """Image in grayscale, returned as is if it is already single-channel."""
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(
+            src=image,
+            code=cv2.COLOR_BGR2GRAY,
+            dst=self.buffer('gray', image.shape[:2]),
+        )
+
+    def bgr(self, image: np.ndarray) -> np.ndarray:
+        """Image in BGR, returned as is if it already has colors."""
+        if image.ndim == 3:
+            return image
+        return cv2.cvtColor(
+            src=image,
+            code=cv2.COLOR_GRAY2BGR,
+            dst=self.buffer('bgr', image.shape + (3,)),
+        )
+
+    def resize(
+            self,
+            image: np.ndarray,
+            size: Tuple[int, int],
+            interpolation: int = cv2.INTER_LINEAR,
+            name: str = 'resize',
+    ) -> np.ndarray:
+        """Image resized to the (width, height) size."""
+        return cv2.resize(
+            src=image,
+            dsize=size,
+            dst=self.buffer(name, (size[1], size[0]) + image.shape[2:], image.dtype),
+            interpolation=interpolation,
+        )
+
+    def letterbox(self, image: np.ndarray) -> np.ndarray:
+        """Image padded with black borders to a square, keeping it centered."""
+        height, width = image.shape[:2]
+        if height == width:
+            return image
+        side = max(height, width)
+        top = (side - height) // 2
+        left = (side - width) // 2
+        return cv2.copyMakeBorder(
+            src=image,
+            top=top,
+            bottom=side - height - top,
+            left=left,
+            right=side - width - left,
+            borderType=cv2.BORDER_CONSTANT,
+            dst=self.buffer('letterbox', (side, side) + image.shape[2:], image.dtype),
+            value=0,
+        )
+
+    def normalized(self, image: np.ndarray) -> np.ndarray:
+        """Single-channel image scaled to [0, 1] as a batch of one (1, height, width, 1)."""
+        height, width = image.shape[:2]
+        tensor = self.buffer('tensor', (1, height, width, 1), np.float32)
+        np.copyto(tensor[0, :, :, 0], image)
+        np.divide(tensor, 255.0, out=tensor)
+        return tensor
+
+
+def get_preprocessing_context(
+        context: Optional[PreprocessingContext],
+) -> PreprocessingContext:
+    """The given context, or a new one whose buffers live for one call."""
+    return context if context is not None else PreprocessingContext()
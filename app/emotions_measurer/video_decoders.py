@@ -0,0 +1,281 @@
+import os
+from fractions import Fraction
+from typing import Final, Optional, Tuple
+import cv2
+import numpy as np
+
+
+VIDEO_DECODERS: Final[tuple[str, ...]] = ('opencv', 'pyav')
+DEFAULT_VIDEO_DECODER: Final[str] = 'opencv'
+DECODER_THREADS_ENVIRONMENT_VARIABLE: Final[str] = 'VIDEO_DECODER_THREADS'
+
+
+def output_size(
+        width: int,
+        height: int,
+        max_side: Optional[int],
+) -> Tuple[int, int]:
+    """Size of the frame with its longest side reduced to max_side, kept even."""
+    if max_side is None or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def decoder_threads() -> int:
+    """Threads of the codec, 0 lets the decoder choose."""
+    return int(os.environ.get(DECODER_THREADS_ENVIRONMENT_VARIABLE, 0))
+
+
+class VideoDecoder:
+    """
+    Source of the video frames used by EmotionsMeasurer.
+
+    Frames are decoded in order by read, skipped by grab without
+    being converted, and seek positions the decoder so that
+    the next read returns the given frame. If grayscale is set,
+    frames are single-channel, otherwise BGR, as OpenCV gives them.
+    If max side is set, the longest side of the frames is reduced to it.
+    Frames are 8-bit, as frame dtype tells.
+    """
+
+    name: str = ''
+    frame_dtype: np.dtype = np.dtype(np.uint8)
+
+    def __init__(
+            self,
+            grayscale: bool = False,
+            max_side: Optional[int] = None,
+    ) -> None:
+        self._grayscale = grayscale
+        self._max_side = max_side
+        self._size: Tuple[int, int] = (0, 0)
+
+    @property
+    def fps(self) -> float:
+        raise NotImplementedError
+
+    @property
+    def frame_shape(self) -> Tuple[int, ...]:
+        """Shape of the decoded frames, from the size the container reports."""
+        width, height = self._size
+        return (height, width) if self._grayscale else (height, width, 3)
+
+    def frames_amount(self) -> int:
+        raise NotImplementedError
+
+    def is_opened(self) -> bool:
+        raise NotImplementedError
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        raise NotImplementedError
+
+    def grab(self) -> bool:
+        raise NotImplementedError
+
+    def seek(self, frame_index: int) -> None:
+        raise NotImplementedError
+
+    def release(self) -> None:
+        raise NotImplementedError
+
+
+class OpenCvDecoder(VideoDecoder):
+    """
+    Decoder on cv2.VideoCapture, available everywhere OpenCV is.
+
+    The frame count is taken from the container, and counted by grabbing
+    all frames only if the container does not report it. Grayscale
+    and reduced frames are converted after decoding the full BGR frame.
+    """
+
+    name = 'opencv'
+
+    def __init__(
+            self,
+            path: str,
+            grayscale: bool = False,
+            max_side: Optional[int] = None,
+            threads: Optional[int] = None,
+    ) -> None:
+        super().__init__(grayscale, max_side)
+        self._path = path
+        threads = decoder_threads() if threads is None else threads
+        if threads > 0 and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+            self._capture = cv2.VideoCapture(
+                path,
+                cv2.CAP_ANY,
+                [cv2.CAP_PROP_N_THREADS, threads],
+            )
+        else:
+            self._capture = cv2.VideoCapture(filename=path)
+        self._size = output_size(
+            int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            max_side,
+        )
+
+    @property
+    def fps(self) -> float:
+        return self._capture.get(cv2.CAP_PROP_FPS)
+
+    def frames_amount(self) -> int:
+        frames_amount = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frames_amount > 0:
+            return frames_amount
+        counter = cv2.VideoCapture(filename=self._path)
+        try:
+            frames_amount = 0
+            while counter.grab():
+                frames_amount += 1
+        finally:
+            counter.release()
+        return frames_amount
+
+    def is_opened(self) -> bool:
+        return self._capture.isOpened()
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        return_code, frame = self._capture.read()
+        if not return_code:
+            return return_code, frame
+        if self._size != (frame.shape[1], frame.shape[0]):
+            frame = cv2.resize(
+                src=frame,
+                dsize=self._size,
+                interpolation=cv2.INTER_AREA,
+            )
+        if self._grayscale:
+            frame = cv2.cvtColor(src=frame, code=cv2.COLOR_BGR2GRAY)
+        return return_code, frame
+
+    def grab(self) -> bool:
+        return self._capture.grab()
+
+    def seek(self, frame_index: int) -> None:
+        self._capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+    def release(self) -> None:
+        self._capture.release()
+
+
+class PyAvDecoder(VideoDecoder):
+    """
+    Decoder on FFmpeg libraries through PyAV.
+
+    The codec decodes on several threads. Seeking goes to the keyframe
+    before the frame and decodes forward from it, frames are numbered
+    by their timestamps. Conversion to grayscale and the reduced size
+    is done by swscale in one pass, the BGR frame is never built.
+    Frames are counted exactly by demuxing the packets without decoding.
+    """
+
+    name = 'pyav'
+
+    def __init__(
+            self,
+            path: str,
+            grayscale: bool = False,
+            max_side: Optional[int] = None,
+            threads: Optional[int] = None,
+    ) -> None:
+        import av
+        super().__init__(grayscale, max_side)
+        self._av = av
+        self._path = path
+        self._container = av.open(path)
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = 'AUTO'
+        self._stream.thread_count = decoder_threads() if threads is None else threads
+        self._time_base: Fraction = self._stream.time_base
+        self._rate: Fraction = self._stream.average_rate or self._stream.guessed_rate
+        self._start_pts = self._stream.start_time or 0
+        self._size = output_size(
+            self._stream.codec_context.width,
+            self._stream.codec_context.height,
+            max_side,
+        )
+        self._format = 'gray' if grayscale else 'bgr24'
+        self._frames = self._container.decode(self._stream)
+        self._skip_until = 0
+        self._opened = True
+
+    @property
+    def fps(self) -> float:
+        return float(self._rate) if self._rate else 0.0
+
+    def _frame_index(self, pts: Optional[int]) -> int:
+        if pts is None or not self._rate:
+            return self._skip_until
+        return round((pts - self._start_pts) * self._time_base * self._rate)
+
+    def frames_amount(self) -> int:
+        counter = self._av.open(self._path)
+        try:
+            stream = counter.streams.video[0]
+            return sum(
+                1 for packet in counter.demux(stream)
+                if packet.size > 0
+            )
+        finally:
+            counter.close()
+
+    def is_opened(self) -> bool:
+        return self._opened
+
+    def _next_frame(self):
+        for frame in self._frames:
+            if self._frame_index(frame.pts) >= self._skip_until:
+                self._skip_until = self._frame_index(frame.pts) + 1
+                return frame
+        return None
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        frame = self._next_frame()
+        if frame is None:
+            return False, None
+        return True, frame.to_ndarray(
+            format=self._format,
+            width=self._size[0],
+            height=self._size[1],
+        )
+
+    def grab(self) -> bool:
+        return self._next_frame() is not None
+
+    def seek(self, frame_index: int) -> None:
+        target = self._start_pts + int(frame_index / (self._time_base * self._rate)) \
+            if self._rate else self._start_pts
+        self._container.seek(target, stream=self._stream, backward=True, any_frame=False)
+        self._frames = self._container.decode(self._stream)
+        self._skip_until = frame_index
+
+    def release(self) -> None:
+        if self._opened:
+            self._container.close()
+            self._opened = False
+
+
+def get_video_decoder(
+        path: str,
+        name: str = DEFAULT_VIDEO_DECODER,
+        grayscale: bool = False,
+        max_side: Optional[int] = None,
+) -> VideoDecoder:
+    """
+    Open the video with the decoder by its name.
+
+    If PyAV is not installed, the OpenCV decoder is used instead.
+    """
+    if name == 'pyav':
+        try:
+            return PyAvDecoder(path, grayscale, max_side)
+        except ImportError:
+            print('[WARNING] PyAV is not installed, decoding with OpenCV.')
+            return OpenCvDecoder(path, grayscale, max_side)
+    if name == 'opencv':
+        return OpenCvDecoder(path, grayscale, max_side)
+    raise ValueError(
+        f'Unknown video decoder "{name}", '
+        f'expected one of: {", ".join(VIDEO_DECODERS)}.'
+    )
@@ -0,0 +1,297 @@
+from datetime import datetime, timedelta
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Final, Optional
+from sqlalchemy import Integer, case, cast, func, literal, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+
+
+EMOTION_COLUMNS: Final[tuple[str, ...]] = (
+    'neutral',
+    'angry',
+    'disgust',
+    'fear',
+    'happy',
+    'sad',
+    'surprise',
+    'lookedAway',
+)
+MAX_VALUE: Final[float] = 100.0
+HISTOGRAM_BINS: Final[int] = 100
+QUANTILES: Final[tuple[float, ...]] = (0.5, 0.9, 0.99)
+SUMMARY_REFRESH_SECONDS: Final[float] = 60.0
+SUMMARY_REFRESH_ROWS: Final[int] = 1000
+BUCKETS: Final[dict[str, Callable[[datetime], datetime]]] = {
+    'hour': lambda moment: moment.replace(minute=0, second=0, microsecond=0),
+    'day': lambda moment: moment.replace(hour=0, minute=0, second=0, microsecond=0),
+    'week': lambda moment: moment.replace(
+        hour=0,
+        minute=0,
+        second=0,
+        microsecond=0,
+    ) - timedelta(days=moment.weekday()),
+}
+
+
+def value_bin(value: float) -> int:
+    """Bin of the percentage in the histogram of the summary."""
+    return min(max(int(value * HISTOGRAM_BINS / MAX_VALUE), 0), HISTOGRAM_BINS - 1)
+
+
+def bin_expression(column, dialect_name: str):
+    """
+    Bin of the percentage computed by the database.
+
+    SQLite has no floor everywhere, but its cast truncates,
+    which is the same for the percentages, as they are not negative.
+    """
+    scaled = column * (HISTOGRAM_BINS / MAX_VALUE)
+    return case(
+        (column >= MAX_VALUE, HISTOGRAM_BINS - 1),
+        (column <= 0, 0),
+        else_=cast(scaled if dialect_name == 'sqlite' else func.floor(scaled), Integer),
+    )
+
+
+def histogram_percentile(histogram: list[int], quantile: float) -> Optional[float]:
+    """Percentile of the histogram, interpolated within its bin."""
+    amount = sum(histogram)
+    if amount == 0:
+        return None
+    width = MAX_VALUE / len(histogram)
+    target = quantile * amount
+    accumulated = 0
+    for number, bin_amount in enumerate(histogram):
+        if bin_amount > 0 and accumulated + bin_amount >= target:
+            return (number + (target - accumulated) / bin_amount) * width
+        accumulated += bin_amount
+    return MAX_VALUE
+
+
+def describe(histogram: list[int], total: float, bins: int) -> dict:
+    """
+    Mean, percentiles and histogram of one emotion of one group.
+
+    The percentiles are taken from the full histogram, so they are
+    off by at most one percent, the histogram is merged to the bins asked for.
+    """
+    amount = sum(histogram)
+    step = HISTOGRAM_BINS // bins
+    return {
+        'mean': total / amount if amount > 0 else None,
+        'percentiles': {
+            f'p{quantile * 100:g}': histogram_percentile(histogram, quantile)
+            for quantile in QUANTILES
+        },
+        'histogram': [
+            sum(histogram[start:start + step])
+            for start in range(0, HISTOGRAM_BINS, step)
+        ],
+    }
+
+
+def describe_groups(
+        histograms: dict[str, dict[str, list[int]]],
+        totals: dict[str, dict[str, float]],
+        bins: int,
+) -> list[dict]:
+    return [
+        {
+            'group': group,
+            'reports': sum(histograms[group][EMOTION_COLUMNS[0]]),
+            'emotions': {
+                emotion: describe(
+                    histograms[group][emotion],
+                    totals[group][emotion],
+                    bins,
+                )
+                for emotion in EMOTION_COLUMNS
+            },
+        }
+        for group in sorted(histograms)
+    ]
+
+
+def empty_group() -> dict[str, list[int]]:
+    return {emotion: [0] * HISTOGRAM_BINS for emotion in EMOTION_COLUMNS}
+
+
+def prefix_analytics(
+        db: Session,
+        prefix: str,
+        prefix_length: Optional[int],
+        start: Optional[datetime],
+        end: Optional[datetime],
+        bins: int,
+) -> list[dict]:
+    """
+    Statistics of the reports whose names start with the prefix.
+
+    The reports are grouped by the first prefix length characters
+    of their names, or make one group of the prefix. The database
+    finds the reports by the index on the names and counts the bins,
+    so only the histograms leave it.
+    """
+    group = func.substr(models.EmotionReports.report_name, 1, prefix_length) \
+        if prefix_length is not None else literal(prefix)
+    dialect_name = db.get_bind().dialect.name
+    histograms: dict[str, dict[str, list[int]]] = dict()
+    totals: dict[str, dict[str, float]] = dict()
+    for emotion in EMOTION_COLUMNS:
+        column = getattr(models.EmotionReportData, emotion)
+        value_bin_expression = bin_expression(column, dialect_name)
+        query = db.query(
+            group,
+            value_bin_expression,
+            func.count(),
+            func.sum(column),
+        ).join(
+            models.EmotionReportResults,
+            models.EmotionReportData.reportResultId == models.EmotionReportResults.id,
+        ).join(
+            models.EmotionReports,
+            models.EmotionReportResults.reportId == models.EmotionReports.id,
+        ).filter(
+            models.EmotionReports.report_name.startswith(prefix, autoescape=True)
+        )
+        if start is not None:
+            query = query.filter(models.EmotionReports.createdAt >= start)
+        if end is not None:
+            query = query.filter(models.EmotionReports.createdAt < end)
+        for key, number, amount, total in query.group_by(group, value_bin_expression):
+            histograms.setdefault(key, empty_group())[emotion][number] += amount
+            totals.setdefault(key, dict.fromkeys(EMOTION_COLUMNS, 0.0))[emotion] += total or 0.0
+    return describe_groups(histograms, totals, bins)
+
+
+class EmotionSummary:
+    """
+    Hourly histograms of the emotions, kept in the summary table.
+
+    The summary is refreshed when it is read, at most once
+    in the refresh period, and only the report results which
+    were not summarized yet are added, so a refresh costs as much
+    as the reports since the previous one. The results are locked
+    while they are summarized, so concurrent services do not count
+    them twice. Results of the reports created before the reports
+    had their time are marked as summarized and left out.
+    """
+
+    def __init__(self, refresh_seconds: float = SUMMARY_REFRESH_SECONDS) -> None:
+        self._refresh_seconds = refresh_seconds
+        self._refreshed: Optional[float] = None
+        self._lock = Lock()
+
+    def refresh(self, db: Session, force: bool = False) -> int:
+        """Add the new report results to the summary, return their amount."""
+        with self._lock:
+            if not force and self._refreshed is not None and \
+                    perf_counter() - self._refreshed < self._refresh_seconds:
+                return 0
+            summarized = 0
+            while True:
+                amount = self._summarize_rows(db)
+                summarized += amount
+                if amount < SUMMARY_REFRESH_ROWS:
+                    break
+            self._refreshed = perf_counter()
+            return summarized
+
+    @staticmethod
+    def _summarize_rows(db: Session) -> int:
+        rows = db.query(
+            models.EmotionReportData.id,
+            models.EmotionReports.createdAt,
+            *(getattr(models.EmotionReportData, emotion) for emotion in EMOTION_COLUMNS),
+        ).join(
+            models.EmotionReportResults,
+            models.EmotionReportData.reportResultId == models.EmotionReportResults.id,
+        ).join(
+            models.EmotionReports,
+            models.EmotionReportResults.reportId == models.EmotionReports.id,
+        ).filter(
+            models.EmotionReportData.summarized.is_(False)
+        ).order_by(
+            models.EmotionReportData.id
+        ).limit(
+            SUMMARY_REFRESH_ROWS
+        ).with_for_update(
+            of=models.EmotionReportData,
+            skip_locked=True,
+        ).all()
+        if not rows:
+            db.rollback()
+            return 0
+        additions: dict[tuple[datetime, str, int], list] = dict()
+        for row in rows:
+            if row.createdAt is None:
+                continue
+            bucket = BUCKETS['hour'](row.createdAt)
+            for emotion in EMOTION_COLUMNS:
+                value = getattr(row, emotion) or 0.0
+                addition = additions.setdefault((bucket, emotion, value_bin(value)), [0, 0.0])
+                addition[0] += 1
+                addition[1] += value
+        existing = {
+            (histogram.bucketStart, histogram.emotion, histogram.bin): histogram
+            for histogram in db.query(models.EmotionHistograms).filter(
+                models.EmotionHistograms.bucketStart.in_({key[0] for key in additions})
+            )
+        } if additions else dict()
+        for key, (amount, total) in additions.items():
+            histogram = existing.get(key)
+            if histogram is None:
+                db.add(models.EmotionHistograms(
+                    bucketStart=key[0],
+                    emotion=key[1],
+                    bin=key[2],
+                    amount=amount,
+                    total=total,
+                ))
+            else:
+                histogram.amount += amount
+                histogram.total += total
+        db.execute(
+            update(models.EmotionReportData).where(
+                models.EmotionReportData.id.in_([row.id for row in rows])
+            ).values(summarized=True)
+        )
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            print('[WARNING] Summary was refreshed concurrently, retrying later.')
+            return 0
+        return len(rows)
+
+    def time_analytics(
+            self,
+            db: Session,
+            bucket: str,
+            start: Optional[datetime],
+            end: Optional[datetime],
+            bins: int,
+    ) -> list[dict]:
+        """
+        Statistics of the reports grouped by the time bucket of their creation.
+
+        Only the rows of the summary within the time are read,
+        the hours are merged into the buckets asked for.
+        """
+        self.refresh(db)
+        query = db.query(models.EmotionHistograms)
+        if start is not None:
+            query = query.filter(models.EmotionHistograms.bucketStart >= BUCKETS['hour'](start))
+        if end is not None:
+            query = query.filter(models.EmotionHistograms.bucketStart < end)
+        histograms: dict[str, dict[str, list[int]]] = dict()
+        totals: dict[str, dict[str, float]] = dict()
+        for histogram in query:
+            key = BUCKETS[bucket](histogram.bucketStart).isoformat()
+            histograms.setdefault(key, empty_group())[histogram.emotion][histogram.bin] += \
+                histogram.amount
+            totals.setdefault(key, dict.fromkeys(EMOTION_COLUMNS, 0.0))[histogram.emotion] += \
+                histogram.total
+        return describe_groups(histograms, totals, bins)
@@ -0,0 +1,109 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Final, Hashable, Optional, Tuple
+
+
+CACHE_MAX_ENTRIES: Final[int] = 1024
+CACHE_TTL_SECONDS: Final[float] = 300.0
+CACHE_MAX_BYTES: Final[int] = 256 * 1024 * 1024
+
+
+def content_etag(content: bytes) -> str:
+    """Strong ETag of the content."""
+    return f'"{hashlib.sha1(content).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether the If-None-Match header names the ETag, weak or not."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    Bounded cache of the responses of the service, least recently used first out.
+
+    Entries are values with their ETag. An entry expires after
+    the time to live, and the least recently used entries are dropped
+    once there are more than max entries, or more than max bytes
+    if the size of the values is given. The cache is shared
+    by the requests, so it is locked.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = CACHE_MAX_ENTRIES,
+            ttl_seconds: float = CACHE_TTL_SECONDS,
+            max_bytes: Optional[int] = None,
+            size: Callable[[Any], int] = len,
+    ) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._max_bytes = max_bytes
+        self._size = size
+        self._entries: OrderedDict[Hashable, Tuple[Any, str, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, str]]:
+        """Value and ETag of the entry, None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: Hashable, value: Any, etag: str) -> None:
+        size = self._size(value) if self._max_bytes is not None else 0
+        if self._max_bytes is not None and size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, etag, monotonic() + self._ttl_seconds, size)
+            self._bytes += size
+            while len(self._entries) > self._max_entries or \
+                    (self._max_bytes is not None and self._bytes > self._max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the entry, used when the cached report is written again."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: Hashable) -> None:
+        self._bytes -= self._entries.pop(key)[3]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def render_cache_metrics(caches: dict[str, ResponseCache]) -> str:
+    """Render the hits, misses and sizes of the caches in Prometheus text exposition format."""
+    lines = ['# TYPE emotion_analysis_cache_requests_total counter']
+    for name, cache in caches.items():
+        lines.append(
+            f'emotion_analysis_cache_requests_total{{cache="{name}",result="hit"}} {cache.hits}'
+        )
+        lines.append(
+            f'emotion_analysis_cache_requests_total{{cache="{name}",result="miss"}} {cache.misses}'
+        )
+    lines.append('# TYPE emotion_analysis_cache_entries gauge')
+    for name, cache in caches.items():
+        lines.append(f'emotion_analysis_cache_entries{{cache="{name}"}} {len(cache)}')
+    return '\n'.join(lines) + '\n'
@@ -1,3 +1,4 @@
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
@@ -32,9 +33,15 @@ def get_url_database():
         f':{dbConnection.db_parameters.port}/{dbConnection.db_parameters.db_name}'
     )
 
-URL_DATABASE = get_url_database()
+DATABASE_URL_ENVIRONMENT_VARIABLE = 'DATABASE_URL'
+URL_DATABASE = os.environ.get(DATABASE_URL_ENVIRONMENT_VARIABLE) or get_url_database()
 
 
-engine = create_engine(URL_DATABASE)
+engine = create_engine(
+    URL_DATABASE,
+    connect_args={'check_same_thread': False}
+        if URL_DATABASE.startswith('sqlite') else dict(),
+)
 SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
 Base = declarative_base()
+
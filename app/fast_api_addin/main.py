@@ -1,19 +1,62 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header
 from pydantic import BaseModel
-from typing import List, Annotated
+from typing import List, Annotated, Optional, Tuple
 import models
 from database import engine, SessionLocal
+from metrics import ServiceMetrics
+from cache import (
+    ResponseCache,
+    content_etag,
+    etag_matches,
+    render_cache_metrics,
+    CACHE_MAX_BYTES,
+)
+from analytics import (
+    EmotionSummary,
+    prefix_analytics,
+    BUCKETS,
+    HISTOGRAM_BINS,
+    MAX_VALUE,
+)
 from sqlalchemy.orm import Session
 import boto3
+import os
 from app.emotions_measurer.measurer import EmotionsMeasurer
 from app.utils.utility_functions import get_percentages_from_results
 from starlette.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.utils.utility_functions import generate_latex_report_from_result_dictionary
+from app.utils.utility_functions import (
+    get_takeaways_from_results,
+    validate_smoothing,
+    validate_segments,
+    DEFAULT_REPORT_FORMAT,
+    REPORT_FORMATS,
+    EMOTIONS_GRAPH_INTERPRETATION,
+)
+from app.utils.schema import add_missing_columns
+from app.utils.report_queue import (
+    ReportQueue,
+    report_extension,
+    REPORT_MEDIA_TYPES,
+)
+from app.utils.s3_transfer import (
+    download_fileobj,
+    ensure_bucket,
+    transfer_config,
+    upload_file,
+)
+from app.utils.temporal_smoothing import (
+    DEFAULT_SMOOTHING_METHOD,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+from app.data_models.models import ReportThresholds
 from sqlalchemy import func
+from time import perf_counter
+from datetime import datetime
 
 app = FastAPI()
 models.Base.metadata.create_all(bind=engine)
+add_missing_columns(engine, models.Base.metadata)
 
 origins = [
     "http://localhost:3000",
@@ -46,6 +89,10 @@ class ReportResultsBase(BaseModel):
 class S3CredentialsBase(BaseModel):
     """
     S3 credentials to pass in order to upload the video to the API.
+
+    Segments are start and end seconds of the parts of the video
+    to analyze, the end is null for the end of the video.
+    The whole video is analyzed if no segments are given.
     """
     region: str
     endpoint_url: str
@@ -53,11 +100,23 @@ class S3CredentialsBase(BaseModel):
     aws_secret_access_key: str
     bucket_name: str
     key_name: str
+    report_format: str = DEFAULT_REPORT_FORMAT
+    segments: List[Tuple[float, Optional[float]]] = []
 
     class Config:
         orm_mode = True
 
 
+class RerenderRequestBase(BaseModel):
+    """
+    Parameters to render the report of the stored analysis again.
+    """
+    report_format: str = DEFAULT_REPORT_FORMAT
+    smoothing: str = DEFAULT_SMOOTHING_METHOD
+    smoothing_window: int = DEFAULT_SMOOTHING_WINDOW
+    thresholds: ReportThresholds = ReportThresholds()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -67,10 +126,64 @@ def get_db():
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
+report_queue = ReportQueue()
+service_metrics = ServiceMetrics()
+transfer_settings = transfer_config()
+report_rows_cache = ResponseCache()
+report_files_cache = ResponseCache(
+    max_bytes=CACHE_MAX_BYTES,
+    size=lambda value: len(value[0]),
+)
+emotion_summary = EmotionSummary()
+last_report: dict[str, str] = dict()
+
+
+def report_file_response(report_id: str) -> Response:
+    """Serve the rendered report, or its generation status if not ready."""
+    status = report_queue.status(report_id)
+    if status == 'pending':
+        return Response(content='Report is being generated.', status_code=202)
+    if status == 'failed':
+        return Response(content='Report generation failed.', status_code=500)
+    path = report_queue.path(report_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail='No such report.')
+    extension = os.path.splitext(path)[1]
+    filename = f'result{report_id}{extension}'
+    report_bytes = open(path, 'rb').read()
+    response = Response(content=report_bytes)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Content-Type'] = REPORT_MEDIA_TYPES[extension]
+    return response
+
+
+def cached_response(
+        content: bytes,
+        etag: str,
+        if_none_match: Optional[str],
+        media_type: str,
+        headers: Optional[dict[str, str]] = None,
+) -> Response:
+    """
+    Serve the content with its ETag, or 304 if the client has it already.
+
+    Clients revalidate on every read, which is answered from the cache.
+    """
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    response = Response(content=content, media_type=media_type, headers=headers)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 @app.post('/requestReport/')
 async def requestReport(credentials: S3CredentialsBase, db: db_dependency):
+    if credentials.report_format not in REPORT_FORMATS:
+        raise HTTPException(status_code=422, detail='Unknown report format.')
+    segments_valid, message = validate_segments(credentials.segments)
+    if not segments_valid:
+        raise HTTPException(status_code=422, detail=message)
     try:
         client = boto3.client(
             's3',
@@ -80,10 +193,12 @@ async def requestReport(credentials: S3CredentialsBase, db: db_dependency):
             aws_secret_access_key = credentials.aws_secret_access_key,
         )
         with open('video.mp4', 'wb') as file:
-            client.download_fileobj(
+            download_fileobj(
+                client,
                 credentials.bucket_name,
                 credentials.key_name,
                 file,
+                transfer_settings,
             )
             report = models.EmotionReports(
                 report_name=f'{credentials.bucket_name}-{credentials.key_name}'
@@ -91,8 +206,29 @@ async def requestReport(credentials: S3CredentialsBase, db: db_dependency):
             db.add(report)
             db.commit()
             db.refresh(report)
-            measurer = EmotionsMeasurer('video.mp4', None, '')
-            measurer.analyse_prepared_video()
+            etag = client.head_object(
+                Bucket=credentials.bucket_name,
+                Key=credentials.key_name,
+            ).get('ETag', '')
+            measurer = EmotionsMeasurer(
+                'video.mp4',
+                None,
+                '',
+                checkpoint_key=f'{credentials.bucket_name}/{credentials.key_name}/{etag}',
+                segments=credentials.segments or None,
+            )
+            service_metrics.job_started()
+            analysis_start = perf_counter()
+            try:
+                measurer.analyse_prepared_video()
+            except Exception:
+                service_metrics.job_failed()
+                raise
+            service_metrics.job_finished(
+                measurer._frames_amount,
+                perf_counter() - analysis_start,
+                measurer._stage_timings,
+            )
             percentages = get_percentages_from_results(
                 measurer._emotions_occurances,
                 measurer._looked_away,
@@ -115,28 +251,48 @@ async def requestReport(credentials: S3CredentialsBase, db: db_dependency):
             )
             db.add(reportResultData)
             db.commit()
-            generate_latex_report_from_result_dictionary(
+            report_rows_cache.invalidate(reportResult.id)
+            report_queue.save_artifact(
+                str(reportResult.id),
+                measurer.analysis_artifact(),
+            )
+            report_queue.submit(
+                str(reportResult.id),
                 measurer._emotions_occurances,
                 measurer._looked_away,
                 measurer._frames_amount,
                 measurer._coordinates,
                 measurer._best_performance,
+                credentials.report_format,
             )
+            last_report['id'] = str(reportResult.id)
             return Response(content=str(reportResult.id), status_code=200)
     except Exception as ex:
         return Response(content=ex, status_code=404)
 
 
 @app.get("/getReportResult/{reportResultId}/", response_model=ReportResultsBase)
-async def getReportResult(reportResultId: int, db: db_dependency):
-    result = db.query(
-        models.EmotionReportData
-    ).filter(
-        models.EmotionReportData.reportResultId == reportResultId
-    ).first()
-    if not result:
-        raise HTTPException(status_code=404, detail='No such report result.')
-    return result
+async def getReportResult(
+        reportResultId: int,
+        db: db_dependency,
+        if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    cached = report_rows_cache.get(reportResultId)
+    if cached is None:
+        result = db.query(
+            models.EmotionReportData
+        ).filter(
+            models.EmotionReportData.reportResultId == reportResultId
+        ).first()
+        if not result:
+            raise HTTPException(status_code=404, detail='No such report result.')
+        content = ReportResultsBase.model_validate(
+            result,
+            from_attributes=True,
+        ).model_dump_json().encode('utf-8')
+        cached = (content, content_etag(content))
+        report_rows_cache.put(reportResultId, *cached)
+    return cached_response(*cached, if_none_match, 'application/json')
 
 @app.get("/getReportResults/", response_model=List[ReportResultsBase])
 async def getReportResults(db: db_dependency):
@@ -147,18 +303,118 @@ async def getReportResults(db: db_dependency):
         return Response(content='No reports', status_code=404)
     return result
 
+def validate_bins(bins: int) -> None:
+    if bins < 1 or HISTOGRAM_BINS % bins != 0:
+        raise HTTPException(
+            status_code=422,
+            detail=f'Amount of bins should divide {HISTOGRAM_BINS}.',
+        )
+
+
+@app.get("/analytics/byPrefix/")
+async def getAnalyticsByPrefix(
+        db: db_dependency,
+        prefix: str = '',
+        prefixLength: Optional[int] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        bins: int = 10,
+):
+    validate_bins(bins)
+    if prefixLength is not None and prefixLength < 1:
+        raise HTTPException(status_code=422, detail='Prefix length should be positive.')
+    return {
+        'binWidth': MAX_VALUE / bins,
+        'groups': prefix_analytics(db, prefix, prefixLength, start, end, bins),
+    }
+
+
+@app.get("/analytics/byTime/")
+async def getAnalyticsByTime(
+        db: db_dependency,
+        bucket: str = 'day',
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        bins: int = 10,
+):
+    validate_bins(bins)
+    if bucket not in BUCKETS:
+        raise HTTPException(
+            status_code=422,
+            detail=f'Bucket should be one of {", ".join(BUCKETS)}.',
+        )
+    return {
+        'binWidth': MAX_VALUE / bins,
+        'groups': emotion_summary.time_analytics(db, bucket, start, end, bins),
+    }
+
+
+@app.post("/analytics/refresh/")
+async def refreshAnalytics(db: db_dependency):
+    return {'summarized': emotion_summary.refresh(db, force=True)}
+
+
 @app.get("/getLastReport/")
 async def getLastReport():
-    pdf_bytes = open('emotional_report.pdf', 'rb').read()
-    response = Response(content=pdf_bytes)
-    response.headers['Content-Disposition'] = 'attachment; filename="emotional_report.pdf"'
-    response.headers['Content-Type'] = 'application/pdf'
-    return response
+    if 'id' not in last_report:
+        raise HTTPException(status_code=404, detail='No reports requested yet.')
+    return report_file_response(last_report['id'])
+
+
+@app.get("/getReport/{reportResultId}/")
+async def getReport(reportResultId: int):
+    return report_file_response(str(reportResultId))
+
+
+@app.post("/rerenderReport/{reportResultId}/")
+async def rerenderReport(reportResultId: int, request: RerenderRequestBase):
+    if request.report_format not in REPORT_FORMATS:
+        raise HTTPException(status_code=422, detail='Unknown report format.')
+    input_valid, message = validate_smoothing(
+        request.smoothing,
+        str(request.smoothing_window),
+    )
+    if not input_valid:
+        raise HTTPException(status_code=422, detail=message)
+    artifact = report_queue.load_artifact(str(reportResultId))
+    if artifact is None:
+        raise HTTPException(status_code=404, detail='No stored analysis.')
+    artifact.apply_smoothing(
+        request.smoothing,
+        request.smoothing_window,
+        EMOTIONS_GRAPH_INTERPRETATION,
+    )
+    report_queue.submit_artifact(
+        str(reportResultId),
+        artifact,
+        request.report_format,
+        request.thresholds,
+    )
+    return {
+        'reportResultId': reportResultId,
+        'percentages': get_percentages_from_results(
+            artifact.emotions_occurances,
+            artifact.looked_away,
+            artifact.frames_amount,
+        ),
+        'takeaways': get_takeaways_from_results(
+            artifact.emotions_occurances,
+            artifact.looked_away,
+            artifact.frames_amount,
+            request.thresholds,
+        ),
+    }
 
 
 @app.post("/uploadReport/")
 async def uploadLastReport(db: db_dependency):
     lastReport = db.query(func.max(models.EmotionReportResults.id)).first()[0]
+    report_path = report_queue.path(str(lastReport))
+    if report_path is None:
+        return Response(
+            content=f'Report {lastReport} is not ready yet.',
+            status_code=409,
+        )
     s3_client = boto3.client(
         's3',
         region_name='ru-central-1',
@@ -166,36 +422,65 @@ async def uploadLastReport(db: db_dependency):
         aws_access_key_id='SECOND_USER',
         aws_secret_access_key='SECOND_USER_SECRET',
     )
-    buckets = s3_client.list_buckets().get('Buckets', list())
-    creationNeeded = True
-    for bucket in buckets:
-        if bucket['Name'] == 'results':
-            creationNeeded = False
-    if creationNeeded:
-        print('[INFO] Bucket non existent, need to create. Creating...')
-        s3_client.create_bucket(Bucket='results')
+    ensure_bucket(s3_client, 'results')
     print('[INFO] Uploading file...')
-    s3_client.upload_file('emotional_report.pdf', 'results', f'result{lastReport}')
+    upload_file(
+        s3_client,
+        report_path,
+        'results',
+        f'result{lastReport}',
+        transfer_settings,
+        content_type=REPORT_MEDIA_TYPES[os.path.splitext(report_path)[1]],
+    )
+    report_files_cache.invalidate(lastReport)
     return Response(str(lastReport))
 
 
 @app.get("/getReportFromS3/{id}/")
-async def getReportFromS3(id: int):
-    s3_client = boto3.client(
-        's3',
-        region_name='ru-central-1',
-        endpoint_url='http://127.0.0.1:9000',
-        aws_access_key_id='SECOND_USER',
-        aws_secret_access_key='SECOND_USER_SECRET',
-    )
-    with open(f'result{id}.pdf', 'wb') as file:
-        s3_client.download_fileobj(
-            'results',
-            f'result{id}',
-            file,
+async def getReportFromS3(
+        id: int,
+        if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    cached = report_files_cache.get(id)
+    if cached is None:
+        s3_client = boto3.client(
+            's3',
+            region_name='ru-central-1',
+            endpoint_url='http://127.0.0.1:9000',
+            aws_access_key_id='SECOND_USER',
+            aws_secret_access_key='SECOND_USER_SECRET',
+        )
+        extension = report_extension(
+            s3_client.head_object(Bucket='results', Key=f'result{id}').get('ContentType')
         )
-    pdf_bytes = open(f'result{id}.pdf', 'rb').read()
-    response = Response(content=pdf_bytes)
-    response.headers['Content-Disposition'] = f'attachment; filename="result{id}.pdf"'
-    response.headers['Content-Type'] = 'application/pdf'
-    return response
\ No newline at end of file
+        with open(f'result{id}{extension}', 'wb') as file:
+            download_fileobj(
+                s3_client,
+                'results',
+                f'result{id}',
+                file,
+                transfer_settings,
+                progress=False,
+            )
+        report_bytes = open(f'result{id}{extension}', 'rb').read()
+        cached = ((report_bytes, extension), content_etag(report_bytes))
+        report_files_cache.put(id, *cached)
+    (report_bytes, extension), etag = cached
+    return cached_response(
+        report_bytes,
+        etag,
+        if_none_match,
+        REPORT_MEDIA_TYPES[extension],
+        {'Content-Disposition': f'attachment; filename="result{id}{extension}"'},
+    )
+
+
+@app.get("/metrics")
+async def getMetrics():
+    return Response(
+        content=service_metrics.render(report_queue.pending_amount()) + render_cache_metrics({
+            'report_results': report_rows_cache,
+            'report_files': report_files_cache,
+        }),
+        media_type='text/plain; version=0.0.4',
+    )
@@ -0,0 +1,120 @@
+from threading import Lock
+from time import perf_counter
+from typing import Final
+from app.utils.instrumentation import StageTimings
+
+
+QUANTILES: Final[tuple[float, ...]] = (0.5, 0.9, 0.99)
+
+
+class ServiceMetrics:
+    """
+    Metrics of the service exposed in Prometheus text format.
+
+    Stage histograms of every finished analysis are merged together,
+    so the percentiles cover all the jobs since the start of the service.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._jobs: dict[str, int] = {'completed': 0, 'failed': 0}
+        self._in_progress = 0
+        self._frames = 0
+        self._analysis_seconds = 0.0
+        self._last_frames_per_second = 0.0
+        self._timings = StageTimings()
+        self._started = perf_counter()
+
+    def job_started(self) -> None:
+        with self._lock:
+            self._in_progress += 1
+
+    def job_finished(
+            self,
+            frames: int,
+            seconds: float,
+            timings: StageTimings,
+    ) -> None:
+        """Register the successfully finished analysis job."""
+        with self._lock:
+            self._in_progress -= 1
+            self._jobs['completed'] += 1
+            self._frames += frames
+            self._analysis_seconds += seconds
+            self._last_frames_per_second = frames / seconds if seconds > 0 else 0.0
+            self._timings.merge(timings)
+
+    def job_failed(self) -> None:
+        with self._lock:
+            self._in_progress -= 1
+            self._jobs['failed'] += 1
+
+    def render(self, queued_reports: int) -> str:
+        """Render all the metrics in Prometheus text exposition format."""
+        lines = list()
+        with self._lock:
+            lines.append('# TYPE emotion_analysis_jobs_total counter')
+            for status, amount in self._jobs.items():
+                lines.append(
+                    f'emotion_analysis_jobs_total{{status="{status}"}} {amount}'
+                )
+            uptime = perf_counter() - self._started
+            lines.append('# TYPE emotion_analysis_jobs_per_second gauge')
+            lines.append(
+                'emotion_analysis_jobs_per_second '
+                f'{self._jobs["completed"] / uptime if uptime > 0 else 0.0}'
+            )
+            lines.append('# TYPE emotion_analysis_queue_depth gauge')
+            lines.append(
+                f'emotion_analysis_queue_depth{{queue="analysis"}} {self._in_progress}'
+            )
+            lines.append(
+                f'emotion_analysis_queue_depth{{queue="report"}} {queued_reports}'
+            )
+            lines.append('# TYPE emotion_analysis_frames_total counter')
+            lines.append(f'emotion_analysis_frames_total {self._frames}')
+            lines.append('# TYPE emotion_analysis_frames_per_second gauge')
+            lines.append(
+                'emotion_analysis_frames_per_second{window="overall"} '
+                f'{self._frames / self._analysis_seconds if self._analysis_seconds > 0 else 0.0}'
+            )
+            lines.append(
+                'emotion_analysis_frames_per_second{window="last_job"} '
+                f'{self._last_frames_per_second}'
+            )
+            lines.append('# TYPE emotion_analysis_events_total counter')
+            for event, amount in self._timings.counters().items():
+                lines.append(
+                    f'emotion_analysis_events_total{{event="{event}"}} {amount}'
+                )
+            frames = self._timings.counter('frames')
+            lines.append('# TYPE emotion_analysis_fallback_ratio gauge')
+            lines.append(
+                'emotion_analysis_fallback_ratio '
+                f'{self._timings.counter("fallback") / frames if frames > 0 else 0.0}'
+            )
+            lines.append('# TYPE emotion_analysis_stage_seconds histogram')
+            for stage in self._timings.stages():
+                for bound, cumulative in self._timings.cumulative_buckets(stage):
+                    upper = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(
+                        'emotion_analysis_stage_seconds_bucket'
+                        f'{{stage="{stage}",le="{upper}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'emotion_analysis_stage_seconds_sum{{stage="{stage}"}} '
+                    f'{self._timings.total_seconds(stage)}'
+                )
+                lines.append(
+                    f'emotion_analysis_stage_seconds_count{{stage="{stage}"}} '
+                    f'{self._timings.count(stage)}'
+                )
+            lines.append('# TYPE emotion_analysis_stage_latency_seconds summary')
+            for stage in self._timings.stages():
+                for quantile in QUANTILES:
+                    lines.append(
+                        'emotion_analysis_stage_latency_seconds'
+                        f'{{stage="{stage}",quantile="{quantile}"}} '
+                        f'{self._timings.percentile(stage, quantile)}'
+                    )
+        return '\n'.join(lines) + '\n'
@@ -4,6 +4,12 @@ from sqlalchemy import (
     Integer,
     String,
     Float,
+    Boolean,
+    DateTime,
+    Index,
+    UniqueConstraint,
+    false,
+    func,
 )
 from database import Base
 
@@ -12,9 +18,17 @@ class EmotionReports(Base):
     """Table for emotion reports registry."""
 
     __tablename__ = 'emotionReports'
+    __table_args__ = (
+        Index(
+            'ix_emotionReports_report_name',
+            'report_name',
+            postgresql_ops={'report_name': 'varchar_pattern_ops'},
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     report_name = Column(String)
+    createdAt = Column(DateTime, default=func.now(), index=True)
 
 
 class EmotionReportResults(Base):
@@ -23,7 +37,7 @@ class EmotionReportResults(Base):
     __tablename__ = 'emotionReportResults'
 
     id = Column(Integer, primary_key=True, index=True)
-    reportId = Column(Integer, ForeignKey('emotionReports.id'))
+    reportId = Column(Integer, ForeignKey('emotionReports.id'), index=True)
 
 
 class EmotionReportData(Base):
@@ -32,7 +46,7 @@ class EmotionReportData(Base):
     __tablename__ = 'resultDetails'
 
     id = Column(Integer, index=True, primary_key=True)
-    reportResultId = Column(Integer, ForeignKey('emotionReportResults.id'))
+    reportResultId = Column(Integer, ForeignKey('emotionReportResults.id'), index=True)
     neutral = Column(Float, default=0.0)
     angry = Column(Float, default=0.0)
     disgust = Column(Float, default=0.0)
@@ -41,3 +55,20 @@ class EmotionReportData(Base):
     sad = Column(Float, default=0.0)
     surprise = Column(Float, default=0.0)
     lookedAway = Column(Float, default=0.0)
+    summarized = Column(Boolean, default=False, server_default=false(), index=True)
+
+
+class EmotionHistograms(Base):
+    """Table for the summary of the report results, histograms of the emotions per hour."""
+
+    __tablename__ = 'emotionHistograms'
+    __table_args__ = (
+        UniqueConstraint('bucketStart', 'emotion', 'bin'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucketStart = Column(DateTime, index=True)
+    emotion = Column(String)
+    bin = Column(Integer)
+    amount = Column(Integer, default=0)
+    total = Column(Float, default=0.0)
@@ -1,6 +1,17 @@
 """Utility in order to upload files to S3 object storage."""
+import os
 import boto3
 import argparse
+from app.utils.s3_transfer import (
+    ensure_bucket,
+    transfer_config,
+    upload_file,
+    upload_folder,
+    MULTIPART_CHUNK_BYTES,
+    MEBIBYTE,
+    TRANSFER_CONCURRENCY,
+    UPLOAD_WORKERS,
+)
 
 
 class CommandLine:
@@ -39,15 +50,46 @@ class CommandLine:
         parser.add_argument(
             '-k',
             '--key',
-            help = 'Provive key to write the file to.',
+            help = 'Provive key to write the file to, or the key prefix for a folder.',
             required = True,
         )
         parser.add_argument(
             '-i',
             '--input',
-            help = 'Provive the file name to load.',
+            help = 'Provive the file name or the folder to load.',
             required = True,
         )
+        parser.add_argument(
+            '-c',
+            '--concurrency',
+            help = f'Provide the amount of parts uploaded at once, {TRANSFER_CONCURRENCY} by default.',
+            required = False,
+            type = int,
+            default = None,
+        )
+        parser.add_argument(
+            '-m',
+            '--chunkMb',
+            help = f'Provide the part size in MiB, {MULTIPART_CHUNK_BYTES // MEBIBYTE} by default.',
+            required = False,
+            type = int,
+            default = None,
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            help = f'Provide the amount of files of a folder uploaded at once, {UPLOAD_WORKERS} by default.',
+            required = False,
+            type = int,
+            default = UPLOAD_WORKERS,
+        )
+        parser.add_argument(
+            '-f',
+            '--force',
+            help = 'Upload the files even if the same objects are already uploaded.',
+            required = False,
+            action = 'store_true',
+        )
         argument = parser.parse_args()
         s3_client = boto3.client(
             's3',
@@ -56,16 +98,36 @@ class CommandLine:
             aws_access_key_id=argument.awsAccessKeyId,
             aws_secret_access_key=argument.awsSecretAccessKey,
         )
-        buckets = s3_client.list_buckets().get('Buckets', list())
-        creationNeeded = True
-        for bucket in buckets:
-            if bucket['Name'] == argument.bucket:
-                creationNeeded = False
-        if creationNeeded:
-            print('[INFO] Bucket non existent, need to create. Creating...')
-            s3_client.create_bucket(Bucket=argument.bucket)
+        ensure_bucket(s3_client, argument.bucket)
+        config = transfer_config(
+            argument.concurrency,
+            argument.chunkMb * MEBIBYTE if argument.chunkMb else None,
+        )
+        if os.path.isdir(argument.input):
+            print('[INFO] Uploading folder...')
+            amounts = upload_folder(
+                s3_client,
+                argument.input,
+                argument.bucket,
+                argument.key,
+                config,
+                argument.workers,
+                not argument.force,
+            )
+            print(
+                f'[INFO] Uploaded {amounts["uploaded"]} files, '
+                f'skipped {amounts["skipped"]}, failed {amounts["failed"]}.'
+            )
+            return
         print('[INFO] Uploading file...')
-        s3_client.upload_file(argument.input, argument.bucket, argument.key)
+        upload_file(
+            s3_client,
+            argument.input,
+            argument.bucket,
+            argument.key,
+            config,
+            not argument.force,
+        )
 
 if __name__ == '__main__':
     app = CommandLine()
@@ -0,0 +1,136 @@
+import os
+from typing import Final, Tuple
+import numpy as np
+from app.data_models.models import Emotions
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.temporal_smoothing import (
+    empty_scores,
+    emotion_occurances,
+    smooth_scores,
+    timeline_coordinates,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+
+
+ARTIFACT_EXTENSION: Final[str] = '.npz'
+
+
+class AnalysisArtifact:
+    """
+    Output of the analysis needed to render the reports again.
+
+    The artifact is stored as a compressed NumPy archive:
+    per-frame scores, the gathered occurances,
+    the graph coordinates and the best frame thumbnails,
+    concatenated into one byte array with offsets.
+    """
+
+    __slots__ = (
+        'emotions_occurances',
+        'looked_away',
+        'frames_amount',
+        'coordinates',
+        'best_performance',
+        'scores',
+    )
+
+    def __init__(
+            self,
+            emotions_occurances: dict[Emotions, int],
+            looked_away: int,
+            frames_amount: int,
+            coordinates: list[Tuple[int, float]],
+            best_performance: dict[Emotions, list[bytes]],
+            scores: np.ndarray = None,
+    ) -> None:
+        self.emotions_occurances = emotions_occurances
+        self.looked_away = looked_away
+        self.frames_amount = frames_amount
+        self.coordinates = coordinates
+        self.best_performance = best_performance
+        self.scores = scores if scores is not None else empty_scores(frames_amount)
+
+    def apply_smoothing(
+            self,
+            method: str,
+            window: int = DEFAULT_SMOOTHING_WINDOW,
+            interpretation: dict[Emotions, float] = None,
+    ) -> None:
+        """Recompute the occurances and, if interpretation is given, the graph."""
+        if method == 'none' or len(self.scores) == 0:
+            return
+        smoothed = smooth_scores(self.scores, method, window)
+        self.emotions_occurances = emotion_occurances(smoothed)
+        if interpretation is not None:
+            self.coordinates = timeline_coordinates(smoothed, interpretation)
+
+    def save(self, path: str) -> str:
+        """Write the artifact, return the path with the extension."""
+        if not path.endswith(ARTIFACT_EXTENSION):
+            path += ARTIFACT_EXTENSION
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        thumbnails = [
+            (EMOTION_LABELS.index(emotion), thumbnail)
+            for emotion, emotion_thumbnails in self.best_performance.items()
+            for thumbnail in emotion_thumbnails
+        ]
+        offsets = np.zeros(len(thumbnails) + 1, dtype=np.int64)
+        np.cumsum([len(thumbnail) for _, thumbnail in thumbnails], out=offsets[1:])
+        np.savez_compressed(
+            path,
+            scores=self.scores.astype(np.float32),
+            occurances=np.array(
+                [self.emotions_occurances.get(label, 0) for label in EMOTION_LABELS],
+                dtype=np.int64,
+            ),
+            summary=np.array([self.looked_away, self.frames_amount], dtype=np.int64),
+            coordinate_indexes=np.array(
+                [index for index, _ in self.coordinates],
+                dtype=np.int64,
+            ),
+            coordinate_values=np.array(
+                [value for _, value in self.coordinates],
+                dtype=np.float32,
+            ),
+            thumbnail_emotions=np.array(
+                [emotion for emotion, _ in thumbnails],
+                dtype=np.int8,
+            ),
+            thumbnail_offsets=offsets,
+            thumbnail_data=np.frombuffer(
+                b''.join(thumbnail for _, thumbnail in thumbnails),
+                dtype=np.uint8,
+            ),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'AnalysisArtifact':
+        """Read the artifact written by save."""
+        with np.load(path, allow_pickle=False) as archive:
+            occurances = archive['occurances']
+            looked_away, frames_amount = archive['summary'].tolist()
+            offsets = archive['thumbnail_offsets']
+            data = archive['thumbnail_data'].tobytes()
+            best_performance: dict[Emotions, list[bytes]] = dict()
+            for i, emotion in enumerate(archive['thumbnail_emotions'].tolist()):
+                best_performance.setdefault(EMOTION_LABELS[emotion], list()).append(
+                    data[offsets[i]:offsets[i + 1]]
+                )
+            return cls(
+                {
+                    label: int(occurances[i])
+                    for i, label in enumerate(EMOTION_LABELS)
+                    if occurances[i] > 0
+                },
+                looked_away,
+                frames_amount,
+                list(zip(
+                    archive['coordinate_indexes'].tolist(),
+                    archive['coordinate_values'].tolist(),
+                )),
+                best_performance,
+                archive['scores'],
+            )
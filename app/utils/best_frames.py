@@ -0,0 +1,109 @@
+import heapq
+from typing import Final, Tuple
+import cv2
+import numpy as np
+from app.data_models.models import Emotions
+
+
+BEST_FRAMES_PER_EMOTION: Final[int] = 3
+THUMBNAIL_MAX_SIDE: Final[int] = 320
+THUMBNAIL_JPEG_QUALITY: Final[int] = 80
+
+
+def encode_thumbnail(frame: np.ndarray) -> bytes:
+    """Downscale the frame to the thumbnail size and compress it to JPEG."""
+    height, width = frame.shape[:2]
+    scale = THUMBNAIL_MAX_SIDE / max(height, width)
+    if scale < 1.0:
+        frame = cv2.resize(
+            src=frame,
+            dsize=(max(1, int(width * scale)), max(1, int(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    _, encoded = cv2.imencode(
+        '.jpg',
+        frame,
+        [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY],
+    )
+    return encoded.tobytes()
+
+
+class BestFramesTracker:
+    """
+    Keeps the most confident frames for each emotion.
+
+    Only the top-k candidates are retained per emotion as compressed
+    thumbnails, so the memory does not depend on the amount of frames.
+    A candidate is encoded only when it actually enters the top-k.
+    Trackers of different threads are merged into a global top-k.
+    """
+
+    def __init__(
+            self,
+            frames_per_emotion: int = BEST_FRAMES_PER_EMOTION,
+    ) -> None:
+        self._frames_per_emotion = frames_per_emotion
+        self._candidates: dict[Emotions, list[Tuple[float, int, bytes]]] = dict()
+
+    def _accepts(self, emotion: Emotions, confidence: float) -> bool:
+        candidates = self._candidates.get(emotion)
+        if candidates is None or len(candidates) < self._frames_per_emotion:
+            return True
+        return confidence > candidates[0][0]
+
+    def _push(self, emotion: Emotions, candidate: Tuple[float, int, bytes]) -> None:
+        candidates = self._candidates.setdefault(emotion, list())
+        if len(candidates) < self._frames_per_emotion:
+            heapq.heappush(candidates, candidate)
+        else:
+            heapq.heappushpop(candidates, candidate)
+
+    def offer(
+            self,
+            emotion: Emotions,
+            confidence: float,
+            frame_index: int,
+            frame: np.ndarray,
+    ) -> None:
+        """Register the frame if it is among the most confident ones."""
+        if not self._accepts(emotion, confidence):
+            return
+        self._push(
+            emotion,
+            (confidence, frame_index, encode_thumbnail(frame)),
+        )
+
+    def merge(self, other: 'BestFramesTracker') -> None:
+        """Merge the candidates found by another tracker."""
+        for emotion, candidates in other._candidates.items():
+            for candidate in candidates:
+                if self._accepts(emotion, candidate[0]):
+                    self._push(emotion, candidate)
+
+    def candidates(self) -> list[Tuple[Emotions, float, int, bytes]]:
+        """Get the retained candidates as emotion, confidence, frame index, thumbnail."""
+        return [
+            (emotion, confidence, frame_index, thumbnail)
+            for emotion, candidates in self._candidates.items()
+            for confidence, frame_index, thumbnail in candidates
+        ]
+
+    def add_candidate(
+            self,
+            emotion: Emotions,
+            confidence: float,
+            frame_index: int,
+            thumbnail: bytes,
+    ) -> None:
+        """Register the already encoded thumbnail, e.g. read from a checkpoint."""
+        if self._accepts(emotion, confidence):
+            self._push(emotion, (confidence, frame_index, thumbnail))
+
+    def thumbnails(self) -> dict[Emotions, list[bytes]]:
+        """Get JPEG thumbnails per emotion, the most confident first."""
+        return {
+            emotion: [
+                thumbnail for _, _, thumbnail in sorted(candidates, reverse=True)
+            ]
+            for emotion, candidates in self._candidates.items()
+        }
@@ -0,0 +1,342 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import time
+from typing import Final, Iterable, Optional, Tuple, Union
+import numpy as np
+from app.data_models.models import Emotions
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.best_frames import BestFramesTracker
+from app.utils.temporal_smoothing import emotion_occurances
+
+
+CHECKPOINTS_DIRECTORY: Final[str] = 'checkpoints'
+CHUNK_FRAMES: Final[int] = 1500
+CHECKPOINT_RETENTION_DAYS: Final[float] = 7.0
+CHECKPOINT_RETENTION_ENVIRONMENT_VARIABLE: Final[str] = 'CHECKPOINT_RETENTION_DAYS'
+RANGE_FILE_PATTERN: Final[re.Pattern] = re.compile(r'range-(\d+)-(\d+)\.npz')
+
+ChunkKey = Union[int, Tuple[int, int]]
+
+
+def checkpoint_key(video_path: str, *configuration: object) -> str:
+    """
+    Identity of the analysis to find its checkpoints by.
+
+    The video is identified by its absolute path, size and modification
+    time, so that a changed file is never resumed from stale chunks.
+    The analysis configuration (backend, detector, chunk size, decoder) is added,
+    as the partial results depend on it.
+    """
+    try:
+        stat = os.stat(video_path)
+        size, modified = stat.st_size, stat.st_mtime_ns
+    except OSError:
+        size, modified = 0, 0
+    return stable_key(
+        os.path.abspath(video_path),
+        size,
+        modified,
+        *configuration,
+    )
+
+
+def stable_key(*parts: object) -> str:
+    """Short digest of the given parts."""
+    return hashlib.sha1(
+        '\0'.join(str(part) for part in parts).encode('utf-8')
+    ).hexdigest()[:20]
+
+
+def remove_expired_checkpoints(
+        directory: str = CHECKPOINTS_DIRECTORY,
+        retention_days: Optional[float] = None,
+) -> int:
+    """
+    Remove the checkpoints of the analyses not used for the retention period.
+
+    Every analysis keeps its chunks after it is done, so that a repeated
+    or overlapping request reuses them, and its directory is touched
+    when it is used again. If not given, the retention is read
+    from the environment. Return the amount of the removed analyses.
+    """
+    if retention_days is None:
+        retention_days = float(os.environ.get(
+            CHECKPOINT_RETENTION_ENVIRONMENT_VARIABLE,
+            CHECKPOINT_RETENTION_DAYS,
+        ))
+    if not os.path.isdir(directory):
+        return 0
+    expired = time.time() - retention_days * 24 * 60 * 60
+    removed = 0
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < expired:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def chunk_bounds(
+        frames_amount: int,
+        chunk_frames: int = CHUNK_FRAMES,
+) -> list[Tuple[int, int]]:
+    """Split the frames into consecutive [start, end) ranges."""
+    return [
+        (start, min(start + chunk_frames, frames_amount))
+        for start in range(0, frames_amount, chunk_frames)
+    ]
+
+
+class ChunkResult:
+    """
+    Partial result of the analysis of one range of frames.
+
+    The chunk holds everything the final result is merged from:
+    the occurances, indexes of the frames the person looked away on,
+    the timeline, the scores of the analyzed frames
+    and the best frame candidates.
+    """
+
+    __slots__ = (
+        'emotions_occurances',
+        'looked_away_indexes',
+        'coordinates',
+        'best_frames',
+        'frame_indexes',
+        'scores',
+    )
+
+    def __init__(
+            self,
+            emotions_occurances: dict[Emotions, int],
+            looked_away_indexes: np.ndarray,
+            coordinates: list[Tuple[int, float]],
+            best_frames: BestFramesTracker,
+            frame_indexes: np.ndarray,
+            scores: np.ndarray,
+    ) -> None:
+        self.emotions_occurances = emotions_occurances
+        self.looked_away_indexes = looked_away_indexes
+        self.coordinates = coordinates
+        self.best_frames = best_frames
+        self.frame_indexes = frame_indexes
+        self.scores = scores
+
+    @property
+    def looked_away(self) -> int:
+        return len(self.looked_away_indexes)
+
+    @classmethod
+    def from_worker_results(cls, results: Iterable[tuple]) -> 'ChunkResult':
+        """Merge the results returned by the threads for the chunk."""
+        emotions_occurances: dict[Emotions, int] = dict()
+        looked_away_indexes = list()
+        coordinates: list[Tuple[int, float]] = list()
+        best_frames = BestFramesTracker()
+        frame_indexes = list()
+        scores = list()
+        for result in results:
+            for emotion, amount in result[0].items():
+                emotions_occurances[Emotions(emotion)] = \
+                    emotions_occurances.get(Emotions(emotion), 0) + amount
+            looked_away_indexes.append(result[1])
+            coordinates.extend(result[2])
+            best_frames.merge(result[3])
+            frame_indexes.append(result[5])
+            scores.append(result[6])
+        coordinates.sort(key=lambda coordinate: coordinate[0])
+        return cls(
+            emotions_occurances,
+            np.sort(np.concatenate(looked_away_indexes)) if looked_away_indexes
+                else np.zeros(0, dtype=np.int64),
+            coordinates,
+            best_frames,
+            np.concatenate(frame_indexes) if frame_indexes
+                else np.zeros(0, dtype=np.int64),
+            np.concatenate(scores) if scores
+                else np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32),
+        )
+
+    def restricted(self, start: int, end: int) -> 'ChunkResult':
+        """
+        Part of the chunk for the frames in [start, end).
+
+        Occurances are gathered again from the scores of the frames,
+        which hold the first face of each frame. Only the frames
+        which were read and not analyzed are counted as looked away.
+        """
+        in_range = (self.frame_indexes >= start) & (self.frame_indexes < end)
+        frame_indexes = self.frame_indexes[in_range]
+        scores = self.scores[in_range]
+        best_frames = BestFramesTracker()
+        for emotion, confidence, frame_index, thumbnail in self.best_frames.candidates():
+            if start <= frame_index < end:
+                best_frames.add_candidate(emotion, confidence, frame_index, thumbnail)
+        return ChunkResult(
+            emotion_occurances(scores),
+            self.looked_away_indexes[
+                (self.looked_away_indexes >= start) & (self.looked_away_indexes < end)
+            ],
+            [
+                (index, value) for index, value in self.coordinates
+                if start <= index < end
+            ],
+            best_frames,
+            frame_indexes,
+            scores,
+        )
+
+    def save(self, path: str) -> None:
+        """Write the chunk atomically, so a crash never leaves half a chunk."""
+        temporary_path = path + '.tmp.npz'
+        self._write(temporary_path)
+        os.replace(temporary_path, path)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the chunk to send it to another host."""
+        buffer = io.BytesIO()
+        self._write(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ChunkResult':
+        return cls.load(io.BytesIO(data))
+
+    def _write(self, file) -> None:
+        candidates = self.best_frames.candidates()
+        offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+        np.cumsum([len(candidate[3]) for candidate in candidates], out=offsets[1:])
+        np.savez_compressed(
+            file,
+            occurances=np.array(
+                [self.emotions_occurances.get(label, 0) for label in EMOTION_LABELS],
+                dtype=np.int64,
+            ),
+            looked_away_indexes=self.looked_away_indexes.astype(np.int64),
+            coordinate_indexes=np.array(
+                [index for index, _ in self.coordinates],
+                dtype=np.int64,
+            ),
+            coordinate_values=np.array(
+                [value for _, value in self.coordinates],
+                dtype=np.float32,
+            ),
+            frame_indexes=self.frame_indexes.astype(np.int64),
+            scores=self.scores.astype(np.float32),
+            candidate_emotions=np.array(
+                [EMOTION_LABELS.index(candidate[0]) for candidate in candidates],
+                dtype=np.int8,
+            ),
+            candidate_confidences=np.array(
+                [candidate[1] for candidate in candidates],
+                dtype=np.float64,
+            ),
+            candidate_frames=np.array(
+                [candidate[2] for candidate in candidates],
+                dtype=np.int64,
+            ),
+            candidate_offsets=offsets,
+            candidate_data=np.frombuffer(
+                b''.join(candidate[3] for candidate in candidates),
+                dtype=np.uint8,
+            ),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'ChunkResult':
+        with np.load(path, allow_pickle=False) as archive:
+            occurances = archive['occurances']
+            best_frames = BestFramesTracker()
+            offsets = archive['candidate_offsets']
+            data = archive['candidate_data'].tobytes()
+            for i, (emotion, confidence, frame_index) in enumerate(zip(
+                    archive['candidate_emotions'].tolist(),
+                    archive['candidate_confidences'].tolist(),
+                    archive['candidate_frames'].tolist(),
+            )):
+                best_frames.add_candidate(
+                    EMOTION_LABELS[emotion],
+                    confidence,
+                    frame_index,
+                    data[offsets[i]:offsets[i + 1]],
+                )
+            return cls(
+                {
+                    label: int(occurances[i])
+                    for i, label in enumerate(EMOTION_LABELS)
+                    if occurances[i] > 0
+                },
+                archive['looked_away_indexes'],
+                list(zip(
+                    archive['coordinate_indexes'].tolist(),
+                    archive['coordinate_values'].tolist(),
+                )),
+                best_frames,
+                archive['frame_indexes'],
+                archive['scores'],
+            )
+
+
+class ChunkCheckpoints:
+    """
+    Completed chunks of one analysis stored on disk.
+
+    Each chunk is a separate file named by its number,
+    so that a restarted analysis only runs the missing chunks.
+    Parts of the chunks analyzed for the segments of the video
+    are stored under their [start, end) frame ranges instead.
+    """
+
+    def __init__(
+            self,
+            key: str,
+            directory: str = CHECKPOINTS_DIRECTORY,
+    ) -> None:
+        self._directory = os.path.join(directory, key)
+
+    def _path(self, chunk: ChunkKey) -> str:
+        if isinstance(chunk, tuple):
+            start, end = chunk
+            return os.path.join(self._directory, f'range-{start:09d}-{end:09d}.npz')
+        return os.path.join(self._directory, f'chunk-{chunk:06d}.npz')
+
+    def touch(self) -> None:
+        """Mark the analysis as used, so its checkpoints are retained."""
+        if os.path.isdir(self._directory):
+            os.utime(self._directory)
+
+    def completed(self, chunk: ChunkKey) -> bool:
+        return os.path.isfile(self._path(chunk))
+
+    def stored_ranges(self) -> list[Tuple[int, int]]:
+        """Frame ranges of the stored parts of the chunks."""
+        if not os.path.isdir(self._directory):
+            return list()
+        ranges = list()
+        for filename in os.listdir(self._directory):
+            match = RANGE_FILE_PATTERN.fullmatch(filename)
+            if match is not None:
+                ranges.append((int(match.group(1)), int(match.group(2))))
+        return sorted(ranges)
+
+    def save(self, chunk: ChunkKey, result: ChunkResult) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+        result.save(self._path(chunk))
+
+    def load(self, chunk: ChunkKey) -> Optional[ChunkResult]:
+        """Read the chunk, None if it is missing or unreadable."""
+        if not self.completed(chunk):
+            return None
+        try:
+            return ChunkResult.load(self._path(chunk))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def clear(self) -> None:
+        """Remove all the chunks of the analysis."""
+        shutil.rmtree(self._directory, ignore_errors=True)
@@ -0,0 +1,374 @@
+from time import time
+from typing import Final, Optional
+from sqlalchemy import (
+    and_,
+    create_engine,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+    Boolean,
+    Column,
+    Float,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+)
+from app.emotions_measurer.video_decoders import DEFAULT_VIDEO_DECODER
+from app.utils.checkpoints import chunk_bounds, ChunkResult, CHUNK_FRAMES
+from app.utils.schema import add_missing_columns
+
+
+CHUNK_QUEUE_DATABASE: Final[str] = 'sqlite:///chunk_queue.db'
+LEASE_SECONDS: Final[float] = 300.0
+MAX_CHUNK_ATTEMPTS: Final[int] = 3
+
+metadata = MetaData()
+
+analysis_jobs = Table(
+    'analysisJobs',
+    metadata,
+    Column('id', String, primary_key=True),
+    Column('videoPath', String, nullable=False),
+    Column('framesAmount', Integer, nullable=False),
+    Column('chunkFrames', Integer, nullable=False),
+    Column('inferenceBackend', String, nullable=False),
+    Column('faceDetector', String, nullable=False),
+    Column('videoDecoder', String, nullable=False, server_default=DEFAULT_VIDEO_DECODER),
+    Column('decodeGrayscale', Boolean, nullable=False, server_default='0'),
+    Column('decodeMaxSide', Integer, nullable=True),
+)
+
+analysis_chunks = Table(
+    'analysisChunks',
+    metadata,
+    Column('jobId', String, ForeignKey('analysisJobs.id'), primary_key=True),
+    Column('chunk', Integer, primary_key=True),
+    Column('start', Integer, nullable=False),
+    Column('end', Integer, nullable=False),
+    Column('status', String, nullable=False, default='pending', index=True),
+    Column('worker', String, nullable=True),
+    Column('leaseExpires', Float, nullable=False, default=0.0),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('result', LargeBinary, nullable=True),
+)
+
+
+class AnalysisJob:
+    """Video published for the distributed analysis and its configuration."""
+
+    __slots__ = (
+        'id',
+        'video_path',
+        'frames_amount',
+        'chunk_frames',
+        'inference_backend',
+        'face_detector',
+        'video_decoder',
+        'decode_grayscale',
+        'decode_max_side',
+    )
+
+    def __init__(
+            self,
+            id: str,
+            video_path: str,
+            frames_amount: int,
+            chunk_frames: int,
+            inference_backend: str,
+            face_detector: str,
+            video_decoder: str = DEFAULT_VIDEO_DECODER,
+            decode_grayscale: bool = False,
+            decode_max_side: Optional[int] = None,
+    ) -> None:
+        self.id = id
+        self.video_path = video_path
+        self.frames_amount = frames_amount
+        self.chunk_frames = chunk_frames
+        self.inference_backend = inference_backend
+        self.face_detector = face_detector
+        self.video_decoder = video_decoder
+        self.decode_grayscale = decode_grayscale
+        self.decode_max_side = decode_max_side
+
+
+class ChunkLease:
+    """Chunk taken by a worker until the lease expires."""
+
+    __slots__ = ('job_id', 'chunk', 'start', 'end', 'worker')
+
+    def __init__(
+            self,
+            job_id: str,
+            chunk: int,
+            start: int,
+            end: int,
+            worker: str,
+    ) -> None:
+        self.job_id = job_id
+        self.chunk = chunk
+        self.start = start
+        self.end = end
+        self.worker = worker
+
+
+class ChunkQueue:
+    """
+    Work queue of the video chunks stored in a database table.
+
+    The coordinator publishes the chunks of a video, the workers
+    lease them one by one. A lease is taken by a conditional update,
+    so two workers never hold the same chunk, and it is renewed
+    while the chunk is analyzed. A chunk whose lease has expired,
+    because its worker died or lost the connection, is stolen
+    by the next worker asking for work. Finished chunks are stored
+    as serialized chunk results for the coordinator to merge.
+    Any SQLAlchemy database works: SQLite for the workers on one host,
+    PostgreSQL for the workers on several hosts. The job stores
+    the configuration of the analysis, decoding included, so every
+    worker analyzes the frames the coordinator would.
+    """
+
+    def __init__(
+            self,
+            url: str = CHUNK_QUEUE_DATABASE,
+            lease_seconds: float = LEASE_SECONDS,
+    ) -> None:
+        self._engine = create_engine(
+            url,
+            connect_args={'timeout': 30} if url.startswith('sqlite') else dict(),
+        )
+        self._lease_seconds = lease_seconds
+        metadata.create_all(bind=self._engine)
+        add_missing_columns(self._engine, metadata)
+
+    @property
+    def lease_seconds(self) -> float:
+        return self._lease_seconds
+
+    def publish(
+            self,
+            job_id: str,
+            video_path: str,
+            frames_amount: int,
+            chunk_frames: int = CHUNK_FRAMES,
+            inference_backend: str = '',
+            face_detector: str = '',
+            video_decoder: str = DEFAULT_VIDEO_DECODER,
+            decode_grayscale: bool = False,
+            decode_max_side: Optional[int] = None,
+    ) -> int:
+        """
+        Add the chunks of the video to the queue, return the amount of chunks.
+
+        Publishing the same job again keeps its finished chunks,
+        so a restarted coordinator only waits for the missing ones.
+        """
+        chunks = chunk_bounds(frames_amount, chunk_frames)
+        with self._engine.begin() as connection:
+            exists = connection.execute(
+                select(analysis_jobs.c.id).where(analysis_jobs.c.id == job_id)
+            ).first()
+            if exists is None:
+                connection.execute(insert(analysis_jobs).values(
+                    id=job_id,
+                    videoPath=video_path,
+                    framesAmount=frames_amount,
+                    chunkFrames=chunk_frames,
+                    inferenceBackend=inference_backend,
+                    faceDetector=face_detector,
+                    videoDecoder=video_decoder,
+                    decodeGrayscale=decode_grayscale,
+                    decodeMaxSide=decode_max_side,
+                ))
+                if chunks:
+                    connection.execute(insert(analysis_chunks), [
+                        {
+                            'jobId': job_id,
+                            'chunk': chunk,
+                            'start': start,
+                            'end': end,
+                            'status': 'pending',
+                            'leaseExpires': 0.0,
+                            'attempts': 0,
+                        }
+                        for chunk, (start, end) in enumerate(chunks)
+                    ])
+            else:
+                connection.execute(
+                    update(analysis_chunks).where(and_(
+                        analysis_chunks.c.jobId == job_id,
+                        analysis_chunks.c.status == 'failed',
+                    )).values(status='pending', worker=None, attempts=0)
+                )
+        return len(chunks)
+
+    def job(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._engine.connect() as connection:
+            row = connection.execute(
+                select(analysis_jobs).where(analysis_jobs.c.id == job_id)
+            ).first()
+        if row is None:
+            return None
+        return AnalysisJob(
+            row.id,
+            row.videoPath,
+            row.framesAmount,
+            row.chunkFrames,
+            row.inferenceBackend,
+            row.faceDetector,
+            row.videoDecoder,
+            bool(row.decodeGrayscale),
+            row.decodeMaxSide,
+        )
+
+    def lease(self, worker: str) -> Optional[ChunkLease]:
+        """
+        Take the first available chunk, None if there is none.
+
+        Pending chunks and chunks with expired leases are available,
+        the earliest chunks are taken first, so the merged prefix
+        of the video grows steadily.
+        """
+        while True:
+            now = time()
+            with self._engine.begin() as connection:
+                row = connection.execute(
+                    select(analysis_chunks.c.jobId, analysis_chunks.c.chunk,
+                           analysis_chunks.c.start, analysis_chunks.c.end,
+                           analysis_chunks.c.status, analysis_chunks.c.worker,
+                           analysis_chunks.c.leaseExpires)
+                    .where(or_(
+                        analysis_chunks.c.status == 'pending',
+                        and_(
+                            analysis_chunks.c.status == 'leased',
+                            analysis_chunks.c.leaseExpires < now,
+                        ),
+                    ))
+                    .order_by(analysis_chunks.c.chunk, analysis_chunks.c.jobId)
+                    .limit(1)
+                ).first()
+                if row is None:
+                    return None
+                taken = connection.execute(
+                    update(analysis_chunks).where(and_(
+                        analysis_chunks.c.jobId == row.jobId,
+                        analysis_chunks.c.chunk == row.chunk,
+                        analysis_chunks.c.status == row.status,
+                        analysis_chunks.c.leaseExpires == row.leaseExpires,
+                    )).values(
+                        status='leased',
+                        worker=worker,
+                        leaseExpires=now + self._lease_seconds,
+                        attempts=analysis_chunks.c.attempts + 1,
+                    )
+                ).rowcount
+            if taken == 1:
+                if row.status == 'leased':
+                    print(
+                        f'[INFO] Took over chunk {row.chunk + 1} of job {row.jobId} '
+                        f'from {row.worker}, its lease has expired.'
+                    )
+                return ChunkLease(row.jobId, row.chunk, row.start, row.end, worker)
+
+    def renew(self, lease: ChunkLease) -> bool:
+        """Extend the lease, False if the chunk was taken over meanwhile."""
+        with self._engine.begin() as connection:
+            return connection.execute(
+                update(analysis_chunks).where(
+                    self._held_by(lease)
+                ).values(leaseExpires=time() + self._lease_seconds)
+            ).rowcount == 1
+
+    def complete(self, lease: ChunkLease, result: ChunkResult) -> bool:
+        """Store the chunk result, False if the chunk was taken over meanwhile."""
+        data = result.to_bytes()
+        with self._engine.begin() as connection:
+            return connection.execute(
+                update(analysis_chunks).where(
+                    self._held_by(lease)
+                ).values(status='done', result=data)
+            ).rowcount == 1
+
+    def release(self, lease: ChunkLease) -> None:
+        """Give the chunk back after an error, fail it after too many attempts."""
+        with self._engine.begin() as connection:
+            connection.execute(
+                update(analysis_chunks).where(
+                    self._held_by(lease)
+                ).values(
+                    status='pending',
+                    worker=None,
+                    leaseExpires=0.0,
+                )
+            )
+            connection.execute(
+                update(analysis_chunks).where(and_(
+                    analysis_chunks.c.jobId == lease.job_id,
+                    analysis_chunks.c.chunk == lease.chunk,
+                    analysis_chunks.c.status == 'pending',
+                    analysis_chunks.c.attempts >= MAX_CHUNK_ATTEMPTS,
+                )).values(status='failed')
+            )
+
+    @staticmethod
+    def _held_by(lease: ChunkLease):
+        return and_(
+            analysis_chunks.c.jobId == lease.job_id,
+            analysis_chunks.c.chunk == lease.chunk,
+            analysis_chunks.c.status == 'leased',
+            analysis_chunks.c.worker == lease.worker,
+        )
+
+    def progress(self, job_id: str) -> dict[str, int]:
+        """Amount of chunks of the job in each status."""
+        with self._engine.connect() as connection:
+            rows = connection.execute(
+                select(analysis_chunks.c.status, func.count())
+                .where(analysis_chunks.c.jobId == job_id)
+                .group_by(analysis_chunks.c.status)
+            ).all()
+        return {status: amount for status, amount in rows}
+
+    def unfinished_amount(self) -> int:
+        """Amount of chunks of all jobs which are not done or failed."""
+        with self._engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(analysis_chunks).where(
+                    analysis_chunks.c.status.in_(('pending', 'leased'))
+                )
+            ).scalar_one()
+
+    def results(
+            self,
+            job_id: str,
+            known_chunks: set[int] = frozenset(),
+    ) -> dict[int, ChunkResult]:
+        """Read the finished chunks of the job except the known ones."""
+        with self._engine.connect() as connection:
+            rows = connection.execute(
+                select(analysis_chunks.c.chunk, analysis_chunks.c.result)
+                .where(and_(
+                    analysis_chunks.c.jobId == job_id,
+                    analysis_chunks.c.status == 'done',
+                    analysis_chunks.c.chunk.not_in(known_chunks),
+                ))
+            ).all()
+        return {
+            chunk: ChunkResult.from_bytes(data)
+            for chunk, data in rows
+        }
+
+    def remove(self, job_id: str) -> None:
+        """Drop the job and its chunks from the queue."""
+        with self._engine.begin() as connection:
+            connection.execute(
+                analysis_chunks.delete().where(analysis_chunks.c.jobId == job_id)
+            )
+            connection.execute(
+                analysis_jobs.delete().where(analysis_jobs.c.id == job_id)
+            )
@@ -0,0 +1,30 @@
+from typing import Tuple
+import numpy as np
+
+
+def downsample_min_max(
+        coordinates: list[Tuple[int, float]],
+        max_points: int,
+) -> list[Tuple[int, float]]:
+    """
+    Reduce the timeline to at most max_points coordinates.
+
+    The timeline is split into equal buckets and for each bucket
+    the lowest and the highest values are kept in their original order,
+    so short spikes of emotions remain visible on the graph.
+    """
+    if len(coordinates) <= max_points or max_points < 2:
+        return list(coordinates)
+    points = np.asarray(coordinates, dtype=np.float64)
+    edges = np.linspace(0, len(points), max_points // 2 + 1).astype(np.int64)
+    downsampled: list[Tuple[int, float]] = list()
+    for start, end in zip(edges[:-1], edges[1:]):
+        if start == end:
+            continue
+        bucket = points[start:end, 1]
+        low = start + int(np.argmin(bucket))
+        high = start + int(np.argmax(bucket))
+        for index in sorted({low, high}):
+            downsampled.append((int(points[index, 0]), float(points[index, 1])))
+    return downsampled
+
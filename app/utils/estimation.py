@@ -0,0 +1,209 @@
+from statistics import NormalDist
+from typing import Final, Iterator, Optional
+import numpy as np
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.temporal_smoothing import dominant_emotion_indices
+
+
+DEFAULT_ESTIMATION_CONFIDENCE: Final[float] = 0.95
+ESTIMATION_STRATA: Final[int] = 20
+ESTIMATION_ROUND_FRAMES: Final[int] = 200
+ESTIMATION_MIN_FRAMES: Final[int] = 200
+LOOKED_AWAY_KEY: Final[str] = 'lookedAway'
+
+
+def stratified_rounds(
+        frames_amount: int,
+        strata_amount: int = ESTIMATION_STRATA,
+        round_frames: int = ESTIMATION_ROUND_FRAMES,
+        seed: Optional[int] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Sorted frame indexes to analyze in each round of the estimation.
+
+    The video is split into strata of equal length, and every round takes
+    the same amount of random frames from each stratum, so the sample
+    covers the whole video however early the estimation stops.
+    No frame is taken twice, the last rounds exhaust the video.
+    """
+    strata_amount = max(1, min(strata_amount, frames_amount))
+    per_stratum = max(1, round_frames // strata_amount)
+    generator = np.random.default_rng(seed)
+    bounds = np.linspace(0, frames_amount, strata_amount + 1).astype(np.int64)
+    strata = [
+        generator.permutation(np.arange(start, end, dtype=np.int64))
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+    taken = 0
+    while True:
+        frames = [
+            stratum[taken:taken + per_stratum]
+            for stratum in strata
+            if taken < len(stratum)
+        ]
+        if not frames:
+            return
+        taken += per_stratum
+        yield np.sort(np.concatenate(frames))
+
+
+class EmotionEstimate:
+    """
+    Emotion percentages estimated from a sample of frames.
+
+    Percentages have the keys of get_percentages_from_results: emotions
+    in percents of the frames with a face, looked away in percents
+    of all frames. Errors are half-widths of the confidence intervals
+    in percentage points.
+    """
+
+    __slots__ = (
+        'percentages',
+        'errors',
+        'sampled_frames',
+        'frames_amount',
+        'confidence',
+    )
+
+    def __init__(
+            self,
+            percentages: dict[str, float],
+            errors: dict[str, float],
+            sampled_frames: int,
+            frames_amount: int,
+            confidence: float,
+    ) -> None:
+        self.percentages = percentages
+        self.errors = errors
+        self.sampled_frames = sampled_frames
+        self.frames_amount = frames_amount
+        self.confidence = confidence
+
+    @property
+    def max_error(self) -> float:
+        return max(self.errors.values(), default=0.0)
+
+    def within(self, tolerance: float) -> bool:
+        """All intervals are narrower than the tolerance, or nothing is left to sample."""
+        if self.sampled_frames >= self.frames_amount:
+            return True
+        return self.sampled_frames >= min(ESTIMATION_MIN_FRAMES, self.frames_amount) \
+            and self.max_error <= tolerance
+
+    def summary(self) -> str:
+        lines = [
+            f'Estimated from {self.sampled_frames} of {self.frames_amount} frames '
+            f'at {self.confidence * 100:g}% confidence:'
+        ]
+        for key, percentage in self.percentages.items():
+            lines.append(
+                f'{key}: {percentage:.2f}% ± {self.errors[key]:.2f}'
+            )
+        return '\n'.join(lines)
+
+
+def wilson_half_width(
+        successes: float,
+        trials: float,
+        z: float,
+        finite_population_correction: float = 1.0,
+) -> float:
+    """
+    Half-width of the Wilson score interval of the proportion, in percents.
+
+    Unlike the normal interval, it does not collapse to zero
+    when none or all of the sampled frames show the emotion.
+    """
+    if trials <= 0:
+        return 100.0
+    proportion = successes / trials
+    z_squared = z * z
+    half_width = z / (1.0 + z_squared / trials) * np.sqrt(
+        proportion * (1.0 - proportion) / trials
+        + z_squared / (4.0 * trials * trials)
+    )
+    return float(half_width * np.sqrt(max(finite_population_correction, 0.0)) * 100.0)
+
+
+def estimate_percentages(
+        sampled_frames: np.ndarray,
+        frame_indexes: np.ndarray,
+        scores: np.ndarray,
+        frames_amount: int,
+        strata_amount: int = ESTIMATION_STRATA,
+        confidence: float = DEFAULT_ESTIMATION_CONFIDENCE,
+) -> EmotionEstimate:
+    """
+    Estimate the percentages from the analyzed sample.
+
+    Sampled frames are all frames of the sample, frame indexes and scores
+    are those of the sampled frames with a face. Each stratum is weighted
+    by its share of the video. Emotions are ratios of the weighted amounts
+    of the emotion and of the frames with a face.
+    As every stratum is sampled equally, the sample is proportionally
+    allocated, and the interval of the simple random sample of the same
+    size bounds the stratified one, so the Wilson intervals
+    on the pooled amounts are conservative.
+    """
+    strata_amount = max(1, min(strata_amount, frames_amount))
+    bounds = np.linspace(0, frames_amount, strata_amount + 1).astype(np.int64)
+    stratum_sizes = np.diff(bounds)
+    sampled_per_stratum = np.bincount(
+        np.searchsorted(bounds, sampled_frames, side='right') - 1,
+        minlength=strata_amount,
+    )[:strata_amount]
+    analyzed_strata = np.searchsorted(bounds, frame_indexes, side='right') - 1
+    analyzed_per_stratum = np.bincount(
+        analyzed_strata,
+        minlength=strata_amount,
+    )[:strata_amount]
+    dominant = dominant_emotion_indices(scores)
+    emotions_per_stratum = np.zeros((strata_amount, len(EMOTION_LABELS)))
+    np.add.at(
+        emotions_per_stratum,
+        (analyzed_strata[dominant >= 0], dominant[dominant >= 0]),
+        1,
+    )
+    sampled = sampled_per_stratum > 0
+    weights = np.where(sampled, stratum_sizes, 0).astype(np.float64)
+    weights /= max(weights.sum(), 1.0)
+    rates = np.divide(
+        1.0,
+        sampled_per_stratum,
+        out=np.zeros(strata_amount),
+        where=sampled,
+    ) * weights
+    face_share = float(np.sum(analyzed_per_stratum * rates))
+    emotion_shares = emotions_per_stratum.T @ rates
+    sampled_amount = int(sampled_per_stratum.sum())
+    analyzed_amount = int(analyzed_per_stratum.sum())
+    correction = 1.0 - sampled_amount / max(frames_amount, 1)
+    z = NormalDist().inv_cdf((1.0 + confidence) / 2.0)
+    percentages: dict[str, float] = {
+        LOOKED_AWAY_KEY: (1.0 - face_share) * 100.0 if sampled_amount else 0.0
+    }
+    errors: dict[str, float] = {
+        LOOKED_AWAY_KEY: wilson_half_width(
+            sampled_amount - analyzed_amount,
+            sampled_amount,
+            z,
+            correction,
+        )
+    }
+    emotion_totals = emotions_per_stratum.sum(axis=0)
+    for i, label in enumerate(EMOTION_LABELS):
+        percentages[str(label)] = float(emotion_shares[i] / face_share * 100.0) \
+            if face_share > 0 else 0.0
+        errors[str(label)] = wilson_half_width(
+            emotion_totals[i],
+            analyzed_amount,
+            z,
+            correction,
+        )
+    return EmotionEstimate(
+        percentages,
+        errors,
+        sampled_amount,
+        frames_amount,
+        confidence,
+    )
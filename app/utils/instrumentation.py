@@ -0,0 +1,161 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Final, Iterator, Optional
+from app.utils.tracing import TraceRecorder
+
+
+STAGES: Final[tuple[str, ...]] = (
+    'decode',
+    'grayscale',
+    'detection',
+    'inference',
+    'validation',
+    'aggregation',
+    'merge',
+    'report',
+)
+BUCKET_BOUNDS: Final[tuple[float, ...]] = tuple(
+    0.0001 * 2 ** power for power in range(18)
+)
+
+
+class StageTimings:
+    """
+    Latency histograms of each stage of the pipeline.
+
+    Every thread collects its own histograms, which are merged in the parent.
+    The buckets are fixed and exponential (0.1ms to ~13s), so recording
+    a measurement costs one bisect and the histograms merge by addition.
+    Besides the stages, plain event counters and maximum gauges are kept.
+    If a trace recorder is attached, every measurement is also
+    registered as a span of the trace.
+    """
+
+    def __init__(self, trace: Optional[TraceRecorder] = None) -> None:
+        self.trace = trace
+        self._totals: dict[str, float] = dict()
+        self._counts: dict[str, int] = dict()
+        self._buckets: dict[str, list[int]] = dict()
+        self._counters: dict[str, int] = dict()
+        self._maximums: dict[str, int] = dict()
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Register one measurement of the stage."""
+        buckets = self._buckets.get(stage)
+        if buckets is None:
+            buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+            self._buckets[stage] = buckets
+            self._totals[stage] = 0.0
+            self._counts[stage] = 0
+        buckets[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self._totals[stage] += seconds
+        self._counts[stage] += 1
+        if self.trace is not None:
+            self.trace.complete(stage, seconds)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Measure the wall time of the enclosed block."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, perf_counter() - start)
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        """Increase the event counter."""
+        self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def counter(self, counter: str) -> int:
+        return self._counters.get(counter, 0)
+
+    def counters(self) -> dict[str, int]:
+        return dict(self._counters)
+
+    def observe_max(self, gauge: str, value: int) -> None:
+        """Keep the largest value of the gauge, e.g. peak memory."""
+        self._maximums[gauge] = max(self._maximums.get(gauge, value), value)
+
+    def maximum(self, gauge: str) -> int:
+        return self._maximums.get(gauge, 0)
+
+    def merge(self, other: 'StageTimings') -> None:
+        """Merge the histograms collected by another thread."""
+        for stage, buckets in other._buckets.items():
+            if stage not in self._buckets:
+                self._buckets[stage] = [0] * (len(BUCKET_BOUNDS) + 1)
+                self._totals[stage] = 0.0
+                self._counts[stage] = 0
+            own = self._buckets[stage]
+            for i, amount in enumerate(buckets):
+                own[i] += amount
+            self._totals[stage] += other._totals[stage]
+            self._counts[stage] += other._counts[stage]
+        for counter, amount in other._counters.items():
+            self.increment(counter, amount)
+        for gauge, value in other._maximums.items():
+            self.observe_max(gauge, value)
+        if self.trace is not None and other.trace is not None:
+            self.trace.merge(other.trace)
+
+    def stages(self) -> list[str]:
+        return list(self._buckets.keys())
+
+    def total_seconds(self, stage: str) -> float:
+        return self._totals.get(stage, 0.0)
+
+    def count(self, stage: str) -> int:
+        return self._counts.get(stage, 0)
+
+    def cumulative_buckets(self, stage: str) -> list[tuple[float, int]]:
+        """Get (upper bound, amount of measurements below it) pairs."""
+        cumulative = list()
+        running = 0
+        buckets = self._buckets.get(stage, [0] * (len(BUCKET_BOUNDS) + 1))
+        for bound, amount in zip(BUCKET_BOUNDS + (float('inf'),), buckets):
+            running += amount
+            cumulative.append((bound, running))
+        return cumulative
+
+    def percentile(self, stage: str, quantile: float) -> float:
+        """
+        Estimate the percentile of the stage latency.
+
+        The value is linearly interpolated inside the bucket holding it.
+        """
+        total = self._counts.get(stage, 0)
+        if total == 0:
+            return 0.0
+        rank = quantile * total
+        lower_bound = 0.0
+        previous = 0
+        for bound, cumulative in self.cumulative_buckets(stage):
+            if cumulative >= rank:
+                if bound == float('inf'):
+                    return lower_bound
+                inside = cumulative - previous
+                return lower_bound + (bound - lower_bound) * \
+                    ((rank - previous) / inside if inside else 1.0)
+            lower_bound = bound
+            previous = cumulative
+        return lower_bound
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        """Get totals, amount of calls, mean and percentiles per stage."""
+        summary: dict[str, dict[str, float]] = {
+            stage: {
+                'total_seconds': self._totals[stage],
+                'count': self._counts[stage],
+                'mean_seconds': self._totals[stage] / self._counts[stage],
+                'p50_seconds': self.percentile(stage, 0.5),
+                'p90_seconds': self.percentile(stage, 0.9),
+                'p99_seconds': self.percentile(stage, 0.99),
+            }
+            for stage in self._buckets
+        }
+        if self._counters:
+            summary['counters'] = dict(self._counters)
+        if self._maximums:
+            summary['maximums'] = dict(self._maximums)
+        return summary
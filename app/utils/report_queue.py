@@ -0,0 +1,222 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from functools import partial
+import os
+from threading import Lock
+from typing import Final, Optional, Tuple
+from app.data_models.models import Emotions, ReportThresholds
+from app.utils.analysis_artifact import AnalysisArtifact, ARTIFACT_EXTENSION
+from app.utils.utility_functions import (
+    generate_report_from_result_dictionary,
+    DEFAULT_REPORT_FORMAT,
+    DEFAULT_REPORT_THRESHOLDS,
+)
+
+
+REPORTS_DIRECTORY: Final[str] = 'reports'
+REPORT_WORKERS: Final[int] = 2
+FINISHED_REPORTS_KEPT: Final[int] = 1024
+REPORT_EXTENSIONS: Final[Tuple[str, ...]] = ('.pdf', '.html')
+REPORT_MEDIA_TYPES: Final[dict[str, str]] = {
+    '.pdf': 'application/pdf',
+    '.html': 'text/html',
+}
+
+
+def report_extension(media_type: Optional[str]) -> str:
+    """Extension of the report of the media type, PDF if it is unknown."""
+    for extension, report_media_type in REPORT_MEDIA_TYPES.items():
+        if media_type is not None and media_type.startswith(report_media_type):
+            return extension
+    return REPORT_EXTENSIONS[0]
+
+
+def generate_report_artifact(
+        report_id: str,
+        directory: str,
+        report_format: str,
+        result: dict[Emotions, int],
+        looked_away: int,
+        overall_frames_amount: int,
+        coordinates: list[Tuple[int, float]],
+        best_performance_frames: dict[Emotions, list[bytes]],
+        thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
+) -> str:
+    """Render the report of the stored analysis result, return the file path."""
+    os.makedirs(directory, exist_ok=True)
+    return generate_report_from_result_dictionary(
+        result,
+        looked_away,
+        overall_frames_amount,
+        coordinates,
+        best_performance_frames,
+        os.path.join(directory, report_id),
+        report_format,
+        thresholds,
+    )
+
+
+class ReportQueue:
+    """
+    Report generation stage running off the analysis path.
+
+    Analysis results are queued together with the report id and rendered
+    by a separate pool of processes, so that the next analysis does not
+    wait for pdflatex. Rendered reports are cached on disk by report id,
+    next to the analysis artifacts the reports can be rendered again from.
+    Only the reports being rendered are tracked by their futures.
+    Once a report is done, its path or its error is kept for the
+    most recent finished reports, older reports are found on disk.
+    """
+
+    def __init__(
+            self,
+            directory: str = REPORTS_DIRECTORY,
+            workers: int = REPORT_WORKERS,
+            finished_kept: int = FINISHED_REPORTS_KEPT,
+    ) -> None:
+        self._directory = directory
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._futures: dict[str, Future] = dict()
+        self._paths: OrderedDict[str, str] = OrderedDict()
+        self._errors: OrderedDict[str, BaseException] = OrderedDict()
+        self._unreported: set[str] = set()
+        self._finished_kept = finished_kept
+        self._lock = Lock()
+
+    def submit(
+            self,
+            report_id: str,
+            result: dict[Emotions, int],
+            looked_away: int,
+            overall_frames_amount: int,
+            coordinates: list[Tuple[int, float]],
+            best_performance_frames: dict[Emotions, list[bytes]],
+            report_format: str = DEFAULT_REPORT_FORMAT,
+            thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
+    ) -> Future:
+        """Queue the report of the analysis result under the given id."""
+        future = self._executor.submit(
+            generate_report_artifact,
+            report_id,
+            self._directory,
+            report_format,
+            result,
+            looked_away,
+            overall_frames_amount,
+            coordinates,
+            best_performance_frames,
+            thresholds,
+        )
+        with self._lock:
+            self._futures[report_id] = future
+            self._paths.pop(report_id, None)
+            self._errors.pop(report_id, None)
+            self._unreported.discard(report_id)
+        future.add_done_callback(partial(self._finished, report_id))
+        return future
+
+    def _finished(self, report_id: str, future: Future) -> None:
+        """Forget the future of the rendered report, keep its path or error."""
+        with self._lock:
+            if self._futures.get(report_id) is not future:
+                return
+            del self._futures[report_id]
+            exception = future.exception()
+            finished = self._errors if exception is not None else self._paths
+            finished[report_id] = exception if exception is not None else future.result()
+            if exception is not None:
+                self._unreported.add(report_id)
+            while len(finished) > self._finished_kept:
+                self._unreported.discard(finished.popitem(last=False)[0])
+
+    def artifact_path(self, report_id: str) -> str:
+        return os.path.join(self._directory, report_id + ARTIFACT_EXTENSION)
+
+    def save_artifact(self, report_id: str, artifact: AnalysisArtifact) -> str:
+        """Store the analysis output under the report id."""
+        return artifact.save(self.artifact_path(report_id))
+
+    def load_artifact(self, report_id: str) -> Optional[AnalysisArtifact]:
+        """Read the stored analysis output, None if there is none."""
+        path = self.artifact_path(report_id)
+        if not os.path.isfile(path):
+            return None
+        return AnalysisArtifact.load(path)
+
+    def submit_artifact(
+            self,
+            report_id: str,
+            artifact: AnalysisArtifact,
+            report_format: str = DEFAULT_REPORT_FORMAT,
+            thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
+    ) -> Future:
+        """Queue the report rendered from the analysis artifact."""
+        return self.submit(
+            report_id,
+            artifact.emotions_occurances,
+            artifact.looked_away,
+            artifact.frames_amount,
+            artifact.coordinates,
+            artifact.best_performance,
+            report_format,
+            thresholds,
+        )
+
+    def _cached_path(self, report_id: str) -> Optional[str]:
+        for extension in REPORT_EXTENSIONS:
+            path = os.path.join(self._directory, report_id + extension)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def status(self, report_id: str) -> str:
+        """Get one of the statuses: pending, ready, failed or unknown."""
+        with self._lock:
+            if report_id in self._futures:
+                return 'pending'
+            if report_id in self._errors:
+                return 'failed'
+        return 'ready' if self.path(report_id) else 'unknown'
+
+    def path(self, report_id: str) -> Optional[str]:
+        """Get the path of the rendered report if it is ready."""
+        with self._lock:
+            if report_id in self._futures or report_id in self._errors:
+                return None
+            path = self._paths.get(report_id)
+        return path if path is not None else self._cached_path(report_id)
+
+    def pending_amount(self) -> int:
+        """Amount of the reports which are queued or being rendered."""
+        with self._lock:
+            return len(self._futures)
+
+    def wait(self) -> None:
+        """
+        Wait for all queued reports and print the failures not printed yet.
+
+        The waited reports are finished here, as their callbacks
+        may not have run yet, and each failure is printed once.
+        """
+        with self._lock:
+            futures = dict(self._futures)
+        wait(futures.values())
+        for report_id, future in futures.items():
+            self._finished(report_id, future)
+        with self._lock:
+            errors = {
+                report_id: exception for report_id, exception in self._errors.items()
+                if report_id in self._unreported
+            }
+            self._unreported.clear()
+        for report_id, exception in errors.items():
+            print(
+                '[WARNING] Exception raised while generating report '
+                f'{report_id}: {exception}.'
+            )
+
+    def shutdown(self) -> None:
+        """Wait for the queued reports and stop the workers."""
+        self.wait()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,197 @@
+import json
+import os
+import platform
+from typing import Final, Optional, Tuple
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+DEFAULT_MODEL_FOOTPRINT_BYTES: Final[int] = 1536 * 1024 ** 2
+DEFAULT_AVAILABLE_MEMORY_BYTES: Final[int] = 4 * 1024 ** 3
+MEMORY_SAFETY_FRACTION: Final[float] = 0.8
+FRAME_COPIES_PER_WORKER: Final[int] = 3
+MIN_SLOTS_PER_WORKER: Final[int] = 2
+MAX_SLOTS_PER_WORKER: Final[int] = 4
+FOOTPRINTS_PATH: Final[str] = os.path.join('checkpoints', 'worker_footprints.json')
+
+
+_measured_footprint: dict[str, int] = dict()
+
+
+def _read_first_line(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as file:
+            return file.readline().strip()
+    except OSError:
+        return None
+
+
+def _read_int(path: str) -> Optional[int]:
+    value = _read_first_line(path)
+    if value is None or not value.lstrip('-').isdigit():
+        return None
+    return int(value)
+
+
+def available_cpu_count() -> int:
+    """
+    Amount of CPUs the process may use.
+
+    The affinity mask and cgroup v1/v2 CPU quota are taken into account.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = None
+    cpu_max = _read_first_line('/sys/fs/cgroup/cpu.max')
+    if cpu_max is not None:
+        limit, _, period = cpu_max.partition(' ')
+        if limit.isdigit() and period.isdigit() and int(period) > 0:
+            quota = int(limit) / int(period)
+    else:
+        limit = _read_int('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        period = _read_int('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if limit is not None and period and limit > 0:
+            quota = limit / period
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+
+def available_memory_bytes() -> int:
+    """
+    Amount of memory available to the process.
+
+    The smallest of the cgroup v1/v2 limit left and the system
+    available memory is taken.
+    """
+    candidates = list()
+    limit = _read_int('/sys/fs/cgroup/memory.max')
+    usage = _read_int('/sys/fs/cgroup/memory.current')
+    if limit is None:
+        limit = _read_int('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+        usage = _read_int('/sys/fs/cgroup/memory/memory.usage_in_bytes')
+    if limit is not None and limit < 2 ** 60:
+        candidates.append(limit - (usage or 0))
+    try:
+        with open('/proc/meminfo', 'r') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    candidates.append(int(line.split()[1]) * 1024)
+                    break
+    except OSError:
+        pass
+    if not candidates and hasattr(os, 'sysconf'):
+        try:
+            candidates.append(
+                os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+            )
+        except (ValueError, OSError):
+            pass
+    if not candidates:
+        return DEFAULT_AVAILABLE_MEMORY_BYTES
+    return max(0, min(candidates))
+
+
+def get_process_peak_rss_bytes(children: bool = False) -> Optional[int]:
+    """Peak resident memory of this process or of its finished children."""
+    if resource is None:
+        return None
+    scale = 1 if platform.system() == 'Darwin' else 1024
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss * scale
+
+
+def _load_footprints(path: str) -> dict[str, int]:
+    try:
+        with open(path, 'r') as file:
+            footprints = json.load(file)
+        return {
+            key: int(value) for key, value in footprints.items()
+            if isinstance(value, (int, float))
+        }
+    except (OSError, ValueError, AttributeError):
+        return dict()
+
+
+def record_worker_footprint(
+        peak_rss_bytes: int,
+        key: str = 'worker',
+        path: str = FOOTPRINTS_PATH,
+) -> None:
+    """
+    Remember the largest memory measured in the threads for the next planning.
+
+    The footprints are kept by key, the inference backend, as it
+    dominates the memory of a thread. The maximum of the runs is stored
+    next to the checkpoints, so the next runs plan with it from the start.
+    """
+    if peak_rss_bytes <= 0:
+        return
+    footprints = _load_footprints(path)
+    peak = max(peak_rss_bytes, footprints.get(key, 0), _measured_footprint.get(key, 0))
+    _measured_footprint[key] = peak
+    if footprints.get(key) == peak:
+        return
+    footprints[key] = peak
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(footprints, file)
+        os.replace(temporary_path, path)
+    except OSError as ex:
+        print(f'[WARNING] Memory of the threads could not be saved: {ex}.')
+
+
+def model_footprint_bytes(key: str = 'worker', path: str = FOOTPRINTS_PATH) -> int:
+    """
+    Largest measured memory of one thread, or the estimate if never measured.
+
+    Until a run with the key has finished, the fixed estimate is used.
+    """
+    if key not in _measured_footprint:
+        stored = _load_footprints(path).get(key, 0)
+        if stored > 0:
+            _measured_footprint[key] = stored
+    return _measured_footprint.get(key, DEFAULT_MODEL_FOOTPRINT_BYTES)
+
+
+def plan_workers(
+        frame_shape: Tuple[int, ...],
+        itemsize: int,
+        max_workers: Optional[int] = None,
+        footprint_key: str = 'worker',
+) -> Tuple[int, int]:
+    """
+    Choose the amount of threads and of in-flight frame slots.
+
+    The following steps are taken:
+    1. The CPU limit gives the upper bound for the amount of threads.
+    2. Each thread costs the model footprint and a few frame copies.
+    The footprint is the largest one measured by the previous runs
+    with the key, the first run plans with the fixed estimate.
+    3. The threads are limited by the memory left after the frame slots.
+    4. The slots per thread are reduced if even one thread does not fit.
+    """
+    frame_bytes = itemsize
+    for dimension in frame_shape:
+        frame_bytes *= dimension
+    budget = int(available_memory_bytes() * MEMORY_SAFETY_FRACTION)
+    per_worker = model_footprint_bytes(footprint_key) + FRAME_COPIES_PER_WORKER * frame_bytes
+    workers = available_cpu_count()
+    if max_workers is not None:
+        workers = min(workers, max_workers)
+    slots_per_worker = MAX_SLOTS_PER_WORKER
+    while workers > 1 and \
+            workers * (per_worker + slots_per_worker * frame_bytes) > budget:
+        workers -= 1
+    while slots_per_worker > MIN_SLOTS_PER_WORKER and \
+            workers * (per_worker + slots_per_worker * frame_bytes) > budget:
+        slots_per_worker -= 1
+    return workers, workers * slots_per_worker
@@ -0,0 +1,232 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import perf_counter
+from typing import BinaryIO, Final, Optional
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+
+MEBIBYTE: Final[int] = 1024 * 1024
+MULTIPART_CHUNK_BYTES: Final[int] = 16 * MEBIBYTE
+MULTIPART_THRESHOLD_BYTES: Final[int] = 16 * MEBIBYTE
+TRANSFER_CONCURRENCY: Final[int] = 10
+UPLOAD_WORKERS: Final[int] = 4
+MIN_PART_BYTES: Final[int] = 5 * MEBIBYTE
+MAX_PART_BYTES: Final[int] = 5 * 1024 * MEBIBYTE
+MAX_PARTS: Final[int] = 10000
+CHUNK_ENVIRONMENT_VARIABLE: Final[str] = 'S3_MULTIPART_CHUNK_MB'
+CONCURRENCY_ENVIRONMENT_VARIABLE: Final[str] = 'S3_TRANSFER_CONCURRENCY'
+PROGRESS_STEP: Final[float] = 10.0
+
+
+def transfer_config(
+        concurrency: Optional[int] = None,
+        chunk_bytes: Optional[int] = None,
+) -> TransferConfig:
+    """
+    Multipart settings of the transfers.
+
+    Files larger than one chunk are transferred in chunks
+    of the given size on the given amount of threads.
+    If not given, the values are read from the environment.
+    """
+    chunk_bytes = chunk_bytes or int(os.environ.get(
+        CHUNK_ENVIRONMENT_VARIABLE,
+        MULTIPART_CHUNK_BYTES // MEBIBYTE,
+    )) * MEBIBYTE
+    concurrency = concurrency or int(os.environ.get(
+        CONCURRENCY_ENVIRONMENT_VARIABLE,
+        TRANSFER_CONCURRENCY,
+    ))
+    return TransferConfig(
+        multipart_threshold=max(chunk_bytes, MIN_PART_BYTES),
+        multipart_chunksize=max(chunk_bytes, MIN_PART_BYTES),
+        max_concurrency=concurrency,
+        use_threads=concurrency > 1,
+    )
+
+
+def part_size(file_size: int, config: TransferConfig) -> int:
+    """Size of the parts boto3 uploads the file in, as its chunk size adjuster does."""
+    size = min(max(config.multipart_chunksize, MIN_PART_BYTES), MAX_PART_BYTES)
+    while file_size / size > MAX_PARTS:
+        size *= 2
+    return min(size, MAX_PART_BYTES)
+
+
+def expected_etag(path: str, config: TransferConfig) -> str:
+    """
+    ETag which S3 gives the file uploaded with the settings.
+
+    It is the MD5 of the file, or for the multipart upload,
+    the MD5 of the MD5s of the parts with the amount of parts.
+    """
+    file_size = os.path.getsize(path)
+    if file_size < config.multipart_threshold:
+        digest = hashlib.md5()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(MEBIBYTE), b''):
+                digest.update(block)
+        return f'"{digest.hexdigest()}"'
+    size = part_size(file_size, config)
+    part_digests = list()
+    with open(path, 'rb') as file:
+        for part in iter(lambda: file.read(size), b''):
+            part_digests.append(hashlib.md5(part).digest())
+    return f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}"'
+
+
+class TransferProgress:
+    """
+    Callback of the transfers printing the progress every few percents.
+
+    Called from the transfer threads, so the counter is locked.
+    """
+
+    def __init__(self, name: str, total_bytes: int, step: float = PROGRESS_STEP) -> None:
+        self._name = name
+        self._total_bytes = total_bytes
+        self._step = step
+        self._transferred = 0
+        self._reported = 0.0
+        self._started = perf_counter()
+        self._lock = Lock()
+
+    def __call__(self, bytes_amount: int) -> None:
+        with self._lock:
+            self._transferred += bytes_amount
+            percent = self._transferred / self._total_bytes * 100 \
+                if self._total_bytes > 0 else 100.0
+            if percent < self._reported + self._step and percent < 100.0:
+                return
+            if self._reported >= 100.0:
+                return
+            self._reported = percent
+            seconds = perf_counter() - self._started
+            print(
+                f'[INFO] {self._name}: {percent:.0f}% of '
+                f'{self._total_bytes / MEBIBYTE:.1f} MiB, '
+                f'{self._transferred / MEBIBYTE / seconds if seconds > 0 else 0.0:.1f} MiB/s.'
+            )
+
+
+def ensure_bucket(client, bucket: str) -> None:
+    """Create the bucket if it does not exist."""
+    buckets = client.list_buckets().get('Buckets', list())
+    if all(existing['Name'] != bucket for existing in buckets):
+        print('[INFO] Bucket non existent, need to create. Creating...')
+        client.create_bucket(Bucket=bucket)
+
+
+def remote_etag(client, bucket: str, key: str) -> Optional[str]:
+    """ETag of the object, None if there is no such object."""
+    try:
+        return client.head_object(Bucket=bucket, Key=key).get('ETag')
+    except ClientError as ex:
+        if ex.response.get('Error', dict()).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+def upload_file(
+        client,
+        path: str,
+        bucket: str,
+        key: str,
+        config: Optional[TransferConfig] = None,
+        skip_existing: bool = True,
+        progress: bool = True,
+        content_type: Optional[str] = None,
+) -> bool:
+    """
+    Upload the file in parallel parts, return whether it was uploaded.
+
+    If skip existing is set, the file is not uploaded when the object
+    has the ETag the file would get, which means it is already there.
+    If the content type is given, it is stored with the object.
+    """
+    config = config or transfer_config()
+    if skip_existing and remote_etag(client, bucket, key) == expected_etag(path, config):
+        print(f'[INFO] {key} is already uploaded, skipping.')
+        return False
+    client.upload_file(
+        path,
+        bucket,
+        key,
+        ExtraArgs={'ContentType': content_type} if content_type else None,
+        Config=config,
+        Callback=TransferProgress(key, os.path.getsize(path)) if progress else None,
+    )
+    return True
+
+
+def upload_folder(
+        client,
+        folder: str,
+        bucket: str,
+        prefix: str = '',
+        config: Optional[TransferConfig] = None,
+        workers: int = UPLOAD_WORKERS,
+        skip_existing: bool = True,
+) -> dict[str, int]:
+    """
+    Upload the files of the folder and its subfolders on several threads.
+
+    Keys are the paths relative to the folder, after the prefix.
+    Each file is itself uploaded in parallel parts, so the amount
+    of connections is up to workers times the concurrency of the config.
+    The amounts of uploaded, skipped and failed files are returned.
+    """
+    config = config or transfer_config()
+    files = [
+        os.path.join(directory, filename)
+        for directory, _, filenames in os.walk(folder)
+        for filename in sorted(filenames)
+    ]
+    amounts = {'uploaded': 0, 'skipped': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(
+                upload_file,
+                client,
+                path,
+                bucket,
+                prefix + os.path.relpath(path, folder).replace(os.sep, '/'),
+                config,
+                skip_existing,
+            ): path
+            for path in files
+        }
+        for future in as_completed(futures):
+            try:
+                amounts['uploaded' if future.result() else 'skipped'] += 1
+            except Exception as ex:
+                print(f'[WARNING] Upload of {futures[future]} failed: {ex}.')
+                amounts['failed'] += 1
+    return amounts
+
+
+def download_fileobj(
+        client,
+        bucket: str,
+        key: str,
+        file: BinaryIO,
+        config: Optional[TransferConfig] = None,
+        progress: bool = True,
+) -> None:
+    """Download the object into the file in parallel ranged parts."""
+    callback = None
+    if progress:
+        callback = TransferProgress(
+            key,
+            client.head_object(Bucket=bucket, Key=key).get('ContentLength', 0),
+        )
+    client.download_fileobj(
+        bucket,
+        key,
+        file,
+        Config=config or transfer_config(),
+        Callback=callback,
+    )
@@ -0,0 +1,30 @@
+from sqlalchemy import inspect, text, Engine, MetaData
+from sqlalchemy.schema import CreateColumn
+
+
+def add_missing_columns(engine: Engine, metadata: MetaData) -> None:
+    """
+    Add the columns and indexes of the models which the existing tables lack.
+
+    create_all only creates the missing tables, so the tables created
+    by the earlier versions are brought up to date here, as there
+    are no migrations. Only additions are handled.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                connection.execute(text(
+                    'ALTER TABLE '
+                    f'{connection.dialect.identifier_preparer.format_table(table)} '
+                    f'ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}'
+                ))
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
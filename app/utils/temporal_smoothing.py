@@ -0,0 +1,161 @@
+import warnings
+from typing import Final
+import numpy as np
+from app.data_models.models import Emotions
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+
+
+SMOOTHING_METHODS: Final[tuple[str, ...]] = ('none', 'mean', 'ema', 'median')
+DEFAULT_SMOOTHING_METHOD: Final[str] = 'none'
+DEFAULT_SMOOTHING_WINDOW: Final[int] = 25
+EMA_BLOCK_SIZE: Final[int] = 256
+
+
+def empty_scores(frames_amount: int) -> np.ndarray:
+    """
+    Scores of the video before the analysis.
+
+    Each row holds the percentages of EMOTION_LABELS for one frame,
+    rows of the frames without a face stay NaN.
+    """
+    return np.full((frames_amount, len(EMOTION_LABELS)), np.nan, dtype=np.float32)
+
+
+def _valid_rows(scores: np.ndarray) -> np.ndarray:
+    return ~np.isnan(scores).any(axis=1)
+
+
+def moving_average(scores: np.ndarray, window: int) -> np.ndarray:
+    """
+    Centered moving average of the scores over the window of frames.
+
+    NaN rows are skipped, so the average is taken over the analyzed
+    frames of the window only. Rows stay NaN if the frame was not analyzed.
+    """
+    if window <= 1 or len(scores) == 0:
+        return scores.copy()
+    valid = _valid_rows(scores)
+    values = np.where(valid[:, None], scores, 0.0).astype(np.float64)
+    cumulative = np.zeros((len(scores) + 1, scores.shape[1]), dtype=np.float64)
+    np.cumsum(values, axis=0, out=cumulative[1:])
+    counts = np.zeros(len(scores) + 1, dtype=np.int64)
+    np.cumsum(valid, out=counts[1:])
+    positions = np.arange(len(scores))
+    lower = np.clip(positions - window // 2, 0, len(scores))
+    upper = np.clip(positions + (window - window // 2), 0, len(scores))
+    amounts = counts[upper] - counts[lower]
+    sums = cumulative[upper] - cumulative[lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (sums / amounts[:, None]).astype(np.float32)
+    result[~valid] = np.nan
+    return result
+
+
+def exponential_moving_average(scores: np.ndarray, window: int) -> np.ndarray:
+    """
+    Exponential moving average with the span of the window.
+
+    The recursion is evaluated in blocks: inside a block the weights
+    of all the frames are applied by one matrix product and only
+    the last value is carried to the next block.
+    Frames which were not analyzed keep the previous value
+    and stay NaN in the result.
+    """
+    if window <= 1 or len(scores) == 0:
+        return scores.copy()
+    valid = _valid_rows(scores)
+    if not valid.any():
+        return scores.copy()
+    alpha = 2.0 / (window + 1.0)
+    last_valid = np.where(valid, np.arange(len(scores)), 0)
+    np.maximum.accumulate(last_valid, out=last_valid)
+    filled = scores[last_valid].astype(np.float64)
+    first = int(np.argmax(valid))
+    filled[:first] = filled[first]
+    steps = np.arange(EMA_BLOCK_SIZE)
+    decay = (1.0 - alpha) ** (steps[:, None] - steps[None, :])
+    weights = np.tril(alpha * decay)
+    carry_weights = (1.0 - alpha) ** (steps + 1)
+    result = np.empty_like(filled)
+    state = filled[0]
+    for start in range(0, len(filled), EMA_BLOCK_SIZE):
+        block = filled[start:start + EMA_BLOCK_SIZE]
+        size = len(block)
+        result[start:start + size] = weights[:size, :size] @ block + \
+            carry_weights[:size, None] * state[None, :]
+        state = result[start + size - 1]
+    result = result.astype(np.float32)
+    result[~valid] = np.nan
+    return result
+
+
+def moving_median(scores: np.ndarray, window: int) -> np.ndarray:
+    """Centered moving median of the scores, NaN rows are skipped."""
+    if window <= 1 or len(scores) == 0:
+        return scores.copy()
+    valid = _valid_rows(scores)
+    padded = np.pad(
+        scores,
+        ((window // 2, window - window // 2 - 1), (0, 0)),
+        constant_values=np.nan,
+    )
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        result = np.nanmedian(windows, axis=-1).astype(np.float32)
+    result[~valid] = np.nan
+    return result
+
+
+def smooth_scores(
+        scores: np.ndarray,
+        method: str = DEFAULT_SMOOTHING_METHOD,
+        window: int = DEFAULT_SMOOTHING_WINDOW,
+) -> np.ndarray:
+    """Smooth the scores with the method given by its name."""
+    if method == 'mean':
+        return moving_average(scores, window)
+    if method == 'ema':
+        return exponential_moving_average(scores, window)
+    if method == 'median':
+        return moving_median(scores, window)
+    if method == 'none':
+        return scores.copy()
+    raise ValueError(
+        f'Unknown smoothing method "{method}", '
+        f'expected one of: {", ".join(SMOOTHING_METHODS)}.'
+    )
+
+
+def dominant_emotion_indices(scores: np.ndarray) -> np.ndarray:
+    """Index of the dominant emotion in EMOTION_LABELS per frame, -1 if not analyzed."""
+    valid = _valid_rows(scores)
+    dominant = np.full(len(scores), -1, dtype=np.int8)
+    if valid.any():
+        dominant[valid] = np.argmax(scores[valid], axis=1)
+    return dominant
+
+
+def emotion_occurances(scores: np.ndarray) -> dict[Emotions, int]:
+    """Amount of frames per dominant emotion, as gathered by the analysis."""
+    dominant = dominant_emotion_indices(scores)
+    counts = np.bincount(dominant[dominant >= 0], minlength=len(EMOTION_LABELS))
+    return {
+        label: int(counts[i])
+        for i, label in enumerate(EMOTION_LABELS)
+        if counts[i] > 0
+    }
+
+
+def timeline_coordinates(
+        scores: np.ndarray,
+        interpretation: dict[Emotions, float],
+) -> list[tuple[int, float]]:
+    """Coordinates of the emotions graph from the dominant emotion per frame."""
+    dominant = dominant_emotion_indices(scores)
+    values = np.array(
+        [interpretation[label] for label in EMOTION_LABELS],
+        dtype=np.float64,
+    )
+    indices = np.flatnonzero(dominant >= 0)
+    return list(zip(indices.tolist(), values[dominant[indices]].tolist()))
@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+import json
+import os
+from time import time
+from typing import Any, Iterator, Optional
+
+
+class TraceRecorder:
+    """
+    Collector of spans in Chrome trace-event format.
+
+    Each thread of the analysis gets its own recorder tagged with
+    the worker id. The recorders are merged in the parent and written
+    as a single file, which can be opened in chrome://tracing or Perfetto.
+    Timestamps are taken from the wall clock, so that spans of different
+    processes are placed on the same timeline.
+    """
+
+    def __init__(self, worker: int, worker_name: str = None) -> None:
+        self._worker = worker
+        self._pid = os.getpid()
+        self.frame: Optional[int] = None
+        self._events: list[dict[str, Any]] = [
+            {
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': self._pid,
+                'tid': worker,
+                'args': {'name': worker_name or f'worker {worker}'},
+            }
+        ]
+
+    def complete(
+            self,
+            name: str,
+            seconds: float,
+            category: str = 'stage',
+            end: float = None,
+    ) -> None:
+        """Register the span of the given length which ended at the end time."""
+        end = time() if end is None else end
+        args: dict[str, Any] = {'worker': self._worker}
+        if self.frame is not None:
+            args['frame'] = self.frame
+        self._events.append(
+            {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (end - seconds) * 1e6,
+                'dur': seconds * 1e6,
+                'pid': self._pid,
+                'tid': self._worker,
+                'args': args,
+            }
+        )
+
+    @contextmanager
+    def span(self, name: str, category: str = 'stage') -> Iterator[None]:
+        """Record the enclosed block as a span."""
+        start = time()
+        try:
+            yield
+        finally:
+            end = time()
+            self.complete(name, end - start, category, end)
+
+    def merge(self, other: 'TraceRecorder') -> None:
+        self._events.extend(other._events)
+
+    def write(self, path: str) -> None:
+        """Save the collected spans as Chrome trace JSON."""
+        with open(path, 'w') as file:
+            json.dump(
+                {'traceEvents': self._events, 'displayTimeUnit': 'ms'},
+                file,
+            )
@@ -1,15 +1,46 @@
+import base64
+import cProfile
 from datetime import datetime
+import html
+from itertools import groupby
 import os
 from os import listdir
 from os.path import isfile, join
-from time import sleep
-from typing import Final, Tuple
+from time import perf_counter, sleep
+from multiprocessing import Queue
+from typing import Final, Iterable, Iterator, Optional, Tuple
 from cv2 import VideoCapture
 import cv2
+import numpy as np
 import pathlib
-from app.data_models.models import EmotionalReport, Emotions
-from app.emotions_measurer.frame_analyzer import FrameAnalyzer
-from pydantic_core import ValidationError
+from app.data_models.models import Emotions, ReportThresholds
+from app.emotions_measurer.frame_analyzer import (
+    FrameAnalyzer,
+    FrameResult,
+    FrameStatus,
+)
+from app.emotions_measurer.frame_transport import SharedFrameRing
+from app.emotions_measurer.preprocessing import PreprocessingContext
+from app.emotions_measurer.video_decoders import VIDEO_DECODERS
+from app.emotions_measurer.face_detectors import (
+    get_face_detector,
+    DEFAULT_FACE_DETECTOR,
+    FACE_BOX_DETECTORS,
+    FACE_DETECTORS,
+)
+from app.emotions_measurer.inference_backends import (
+    get_inference_backend,
+    DEFAULT_INFERENCE_BACKEND,
+    FACE_REGION_BACKENDS,
+    INFERENCE_BACKENDS,
+    EMOTION_LABELS,
+)
+from app.utils.best_frames import BestFramesTracker
+from app.utils.downsampling import downsample_min_max
+from app.utils.instrumentation import StageTimings
+from app.utils.temporal_smoothing import SMOOTHING_METHODS
+from app.utils.tracing import TraceRecorder
+from app.utils.resources import get_process_peak_rss_bytes
 from pylatex import (
     Document,
     Section,
@@ -21,14 +52,12 @@ from pylatex import (
 )
 
 
-LOOKED_AWAY_THRESHOLD: Final[float] = 7.5
-HAPPY_TO_ANGRY_DIFFERENCE_THRESHOLD: Final[float] = 10.0
-HAPPY_TO_SAD_DIFFERENCE_THRESHOLD: Final[float] = 10.0
-NEUTRAL_TO_SURPRISED_THRESHOLD: Final[float] = 10.0
-FEAR_THRESHOLD: Final[float] = 5.0
-HAPPY_THRESHOLD: Final[float] = 20.0
-DISGUST_ANGRY_THRESHOLD: Final[float] = 12.5
-SAD_THRESHOLD: Final[float] = 15.0
+DEFAULT_REPORT_THRESHOLDS: Final[ReportThresholds] = ReportThresholds()
+REPORT_FORMATS: Final[Tuple[str, ...]] = ('latex', 'html')
+DEFAULT_REPORT_FORMAT: Final[str] = 'latex'
+TIMELINE_MAX_POINTS: Final[int] = 2000
+GRAPH_WIDTH: Final[int] = 1000
+GRAPH_HEIGHT: Final[int] = 400
 
 
 EMOTIONS_GRAPH_INTERPRETATION: Final[dict[Emotions, float]] = {
@@ -42,51 +71,78 @@ EMOTIONS_GRAPH_INTERPRETATION: Final[dict[Emotions, float]] = {
 }
 
 
+_shared_worker_state: dict = dict()
+
 
 def get_amount_of_frames(capture: VideoCapture) -> int:
     """Get the amount of frames in the provided video."""
     return int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
 
 
-def separate_frames_into_arrays(
-        capture: VideoCapture,
-        threads_amount: int,
-        frames_amount: int
-) -> list[list]:
+def validate_inference_backend(backend_name: str) -> Tuple[bool, str]:
+    """Inference backend is either empty (default is used) or a known one."""
+    if backend_name != '' and backend_name not in INFERENCE_BACKENDS:
+        return (
+            False,
+            'Inference backend is expected to be one of: '
+            f'{", ".join(INFERENCE_BACKENDS)}.'
+        )
+    return (True, '')
+
+
+def validate_face_detector(detector_name: str, backend_name: str = '') -> Tuple[bool, str]:
     """
-    The given video's frames are being separated between processes.
+    Face detector is either empty (default is used) or a known one.
 
-    The method is dedicated to separate frames between threads.
-    There are following rules for that:
-    1. Frames should remain in the same order for further processing.
-    2. Each thread initially gets the same amount of frames.
-    3. If any frames are left, the last ones are sent to the last thread.
+    Backends which classify only face regions need a detector of face boxes.
     """
-    frames_per_thread = list()
-    overall_frames = list()
-    for _ in range(frames_amount):
-        _, frame = capture.read()
-        overall_frames.append(frame)
-    batches = frames_amount // threads_amount
-    for i in range(threads_amount):
-        frames_per_thread.append(
-            overall_frames[
-                (i * batches):((i + 1) * batches)
-            ]
-        )
-    if batches * threads_amount == batches:
-        return frames_per_thread
-    frames_per_thread[threads_amount - 1].extend(
-        overall_frames[threads_amount * batches:]
-    )
-    return frames_per_thread
+    if detector_name != '' and detector_name not in FACE_DETECTORS:
+        return (
+            False,
+            'Face detector is expected to be one of: '
+            f'{", ".join(FACE_DETECTORS)}.'
+        )
+    if backend_name in FACE_REGION_BACKENDS and \
+            default_face_detector(backend_name, detector_name) not in FACE_BOX_DETECTORS:
+        return (
+            False,
+            f'Inference backend {backend_name} classifies face regions only, '
+            f'face detector is expected to be one of: {", ".join(FACE_BOX_DETECTORS)}.'
+        )
+    return (True, '')
+
+
+def default_face_detector(backend_name: str, detector_name: str = '') -> str:
+    """Face detector given or the one used with the backend by default."""
+    if detector_name != '':
+        return detector_name
+    if backend_name in FACE_REGION_BACKENDS:
+        return FACE_BOX_DETECTORS[0]
+    return DEFAULT_FACE_DETECTOR
+
+
+def validate_video_decoder(decoder_name: str, max_side: str) -> Tuple[bool, str]:
+    """Video decoder is either empty (default is used) or a known one, max side is positive."""
+    if decoder_name != '' and decoder_name not in VIDEO_DECODERS:
+        return (
+            False,
+            'Video decoder is expected to be one of: '
+            f'{", ".join(VIDEO_DECODERS)}.'
+        )
+    if max_side != '' and (not max_side.isdigit() or int(max_side) == 0):
+        return (
+            False,
+            'Maximal side of decoded frames is expected to be a positive integer.'
+        )
+    return (True, '')
 
 
 def validate_file_input(
         folder: str,
         threads_amount: str
 ) -> Tuple[bool, bool]:
-    if threads_amount != '' and (not threads_amount.isdigit()):
+    if threads_amount != '' and threads_amount != 'auto' and \
+            (not threads_amount.isdigit()):
         if threads_amount.startswith('-'):
             return (
                 False,
@@ -134,7 +190,8 @@ def validate_input(
             False,
             'File is of unexpected type. MP4 is supported.'
         )
-    if threads_amount != '' and (not threads_amount.isdigit()):
+    if threads_amount != '' and threads_amount != 'auto' and \
+            (not threads_amount.isdigit()):
         if threads_amount.startswith('-'):
             return (
                 False,
@@ -152,10 +209,150 @@ def validate_input(
     return (True, '')
 
 
+def init_shared_frames_worker(
+        ring_descriptor: Tuple[str, Tuple[int, ...], str, int],
+        task_queue: Queue,
+        free_queue: Queue,
+        trace: bool = False,
+        cpu_profile_path: Optional[str] = None,
+        backend_name: str = DEFAULT_INFERENCE_BACKEND,
+        detector_name: str = DEFAULT_FACE_DETECTOR,
+        annotate: bool = False,
+) -> None:
+    """
+    Initializer of the pool workers reading frames from shared memory.
+
+    Each worker attaches to the frame ring once and keeps
+    the queues for the whole lifetime of the process.
+    Tracing, CPU profiling, the inference backend, the face detector
+    and the annotation of the frames of the workers are set up here as well.
+    """
+    _shared_worker_state['ring'] = SharedFrameRing.attach(ring_descriptor)
+    _shared_worker_state['tasks'] = task_queue
+    _shared_worker_state['free'] = free_queue
+    _shared_worker_state['trace'] = trace
+    _shared_worker_state['cpu_profile_path'] = cpu_profile_path
+    _shared_worker_state['backend_name'] = backend_name
+    _shared_worker_state['detector_name'] = detector_name
+    _shared_worker_state['annotate'] = annotate
+
+
+def _read_shared_frames() -> Iterator[Tuple[int, np.ndarray]]:
+    """Take the frames of one part from the shared ring, see _read_shared_batch_frames."""
+    for _, frame_index, frame in _read_shared_batch_frames():
+        yield frame_index, frame
+
+
+def _read_shared_batch_frames() -> Iterator[Tuple[int, int, np.ndarray]]:
+    """
+    Take frames from the shared ring until the stop sentinel is received.
+
+    Each task carries the part of the round the frame belongs to
+    and the shape of the frame, as the videos of a batch may differ in size.
+    The slot is given back to the decoder once the frame was analyzed,
+    which happens when the next frame is requested from the generator.
+    """
+    ring: SharedFrameRing = _shared_worker_state['ring']
+    while True:
+        task = _shared_worker_state['tasks'].get()
+        if task is None:
+            return
+        slot, frame_index, part, frame_shape = task
+        try:
+            yield part, frame_index, ring.read(slot, frame_shape)
+        finally:
+            _shared_worker_state['free'].put(slot)
+
+
+def analyze_shared_batch(thread: int) -> list[Tuple[int, tuple]]:
+    """
+    Analyze frames of several videos passed through the shared frame ring.
+
+    The frames of the batch are sent part after part, a part being
+    a chunk of one of the videos, so each thread receives the frames
+    of a part one after another. A result of analyze_shared_frames
+    is returned for each part the thread received frames of,
+    paired with the number of the part.
+    """
+    return [
+        (
+            part,
+            _analyze_indexed_frames(
+                ((frame_index, frame) for _, frame_index, frame in frames),
+                thread,
+                _shared_worker_state.get('trace', False),
+                _shared_worker_state.get('backend_name', DEFAULT_INFERENCE_BACKEND),
+                _shared_worker_state.get('detector_name', DEFAULT_FACE_DETECTOR),
+                _shared_worker_state.get('annotate', False),
+                report_progress=False,
+            ),
+        )
+        for part, frames in groupby(
+            _read_shared_batch_frames(),
+            key=lambda task: task[0],
+        )
+    ]
+
+
+def analyze_shared_frames(
+        thread: int,
+) -> Tuple[
+    dict[Emotions, int],
+    int,
+    list[Tuple[int, float]],
+    BestFramesTracker,
+    StageTimings,
+    np.ndarray,
+    np.ndarray,
+]:
+    """
+    Analyze frames passed through the shared frame ring.
+
+    The result is the same as for analyze_several_frames,
+    but the coordinates contain absolute indexes of the frames in the video.
+    If CPU profiling is enabled, the profile of the worker is saved
+    next to the trace as <trace>.worker<thread>.prof.
+    """
+    cpu_profile_path = _shared_worker_state.get('cpu_profile_path')
+    if cpu_profile_path is None:
+        return _analyze_indexed_frames(
+            _read_shared_frames(),
+            thread,
+            _shared_worker_state.get('trace', False),
+            _shared_worker_state.get('backend_name', DEFAULT_INFERENCE_BACKEND),
+            _shared_worker_state.get('detector_name', DEFAULT_FACE_DETECTOR),
+            _shared_worker_state.get('annotate', False),
+        )
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return _analyze_indexed_frames(
+            _read_shared_frames(),
+            thread,
+            _shared_worker_state.get('trace', False),
+            _shared_worker_state.get('backend_name', DEFAULT_INFERENCE_BACKEND),
+            _shared_worker_state.get('detector_name', DEFAULT_FACE_DETECTOR),
+            _shared_worker_state.get('annotate', False),
+        )
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f'{cpu_profile_path}.worker{thread}.prof')
+
+
 def analyze_several_frames(
         frames: list,
-        thread: int
-) -> Tuple[dict[Emotions, int], int, list[Tuple[int, float]], dict]:
+        thread: int,
+        backend_name: str = DEFAULT_INFERENCE_BACKEND,
+        detector_name: str = DEFAULT_FACE_DETECTOR,
+) -> Tuple[
+    dict[Emotions, int],
+    int,
+    list[Tuple[int, float]],
+    BestFramesTracker,
+    StageTimings,
+    np.ndarray,
+    np.ndarray,
+]:
     """
     Analyze frames for emotions.
     
@@ -163,92 +360,144 @@ def analyze_several_frames(
     1. The method is created for threads to work with.
     2. It creates the classifier and goes frame by frame through the list.
     3. Each 100 frames, a message is being written for tracking.
-    4. The reports are being validated by BaseModel and the report is passed back.
+    4. The reports are read into lightweight records and the report is passed back.
+    5. Only thumbnails of the most confident frames are kept per emotion.
+    6. Indexes of the analyzed frames and their emotion scores are
+    returned as arrays, one row in EMOTION_LABELS order per frame.
+    """
+    return _analyze_indexed_frames(
+        enumerate(frames),
+        thread,
+        backend_name=backend_name,
+        detector_name=detector_name,
+    )
+
+
+def _analyze_indexed_frames(
+        indexed_frames: Iterable[Tuple[int, np.ndarray]],
+        thread: int,
+        trace: bool = False,
+        backend_name: str = DEFAULT_INFERENCE_BACKEND,
+        detector_name: str = DEFAULT_FACE_DETECTOR,
+        annotate: bool = False,
+        report_progress: bool = True,
+) -> Tuple[
+    dict[Emotions, int],
+    int,
+    list[Tuple[int, float]],
+    BestFramesTracker,
+    StageTimings,
+    np.ndarray,
+    np.ndarray,
+]:
+    """
+    Analyze pairs of frame index and frame, see analyze_several_frames.
+
+    The detector, the backend and the preprocessing context are kept
+    in the process after the first call, so that the next chunks
+    of the video do not load the models or allocate the buffers again.
+    If annotation is on, detected features are drawn on the frames,
+    and so on the thumbnails of the best frames.
+    Unless report progress is set, nothing is printed.
     """
     coordinates: list[Tuple[int, float]] = list()
-    best_performance_frame = dict()
-    best_confidence = dict()
-    looked_away = 0
+    best_frames = BestFramesTracker()
+    timings = StageTimings(TraceRecorder(thread) if trace else None)
+    looked_away_indexes: list[int] = list()
     analysis_result: dict[Emotions, int] = dict()
-    brows_predictor = cv2.CascadeClassifier(
-        cv2.data.haarcascades + 'haarcascade_eye_tree_eyeglasses.xml'
+    frame_indexes: list[int] = list()
+    frame_scores: list[Tuple[float, ...]] = list()
+    models = _shared_worker_state.setdefault('models', dict())
+    if ('detector', detector_name) not in models:
+        models[('detector', detector_name)] = get_face_detector(detector_name)
+    if ('backend', backend_name) not in models:
+        models[('backend', backend_name)] = get_inference_backend(backend_name)
+    detector = models[('detector', detector_name)]
+    backend = models[('backend', backend_name)]
+    context = _shared_worker_state.setdefault('preprocessing', PreprocessingContext())
+    processed = 0
+    for i, frame in indexed_frames:
+        frame_start = perf_counter()
+        if timings.trace is not None:
+            timings.trace.frame = i
+        analysis = FrameAnalyzer.analyze_frame(
+            frame,
+            detector,
+            timings,
+            backend,
+            context,
+            annotate,
+        )
+        if analysis.status != FrameStatus.ANALYZED:
+            looked_away_indexes.append(i)
+            timings.increment(str(analysis.status))
+        timings.increment('frames')
+        if report_progress and processed % 100 == 0:
+            print(f'[INFO] Thread number {thread}: processed {processed} frames.')
+        processed += 1
+        start = perf_counter()
+        for result in analysis.results:
+            if result.dominant_emotion not in analysis_result.keys():
+                analysis_result[result.dominant_emotion] = 0
+            analysis_result[result.dominant_emotion] += 1
+            if result.face_confidence is not None:
+                best_frames.offer(
+                    result.dominant_emotion,
+                    result.face_confidence,
+                    i,
+                    frame,
+                )
+            coordinates.append(
+                (
+                    i,
+                    EMOTIONS_GRAPH_INTERPRETATION[result.dominant_emotion]
+                )
+            )
+        if analysis.results:
+            frame_indexes.append(i)
+            frame_scores.append(score_vector(analysis.results[0]))
+        timings.add('aggregation', perf_counter() - start)
+        if timings.trace is not None:
+            timings.trace.complete('frame', perf_counter() - frame_start, 'frame')
+    # Pages of the shared ring read by the worker count in its resident
+    # memory, but they are shared by all workers and planned separately.
+    ring: Optional[SharedFrameRing] = _shared_worker_state.get('ring')
+    timings.observe_max(
+        'worker_peak_rss_bytes',
+        max(0, (get_process_peak_rss_bytes() or 0) - (ring.nbytes if ring is not None else 0)),
     )
-    eye_predictor = cv2.CascadeClassifier(
-        cv2.data.haarcascades + 'haarcascade_eye_tree_eyeglasses.xml'
+    if report_progress:
+        print(
+            f'[INFO] Thread {thread} finished working. '
+            f'Validation errors encountered: {timings.counter("validation_errors")}, '
+            f'frames analyzed as a whole: {timings.counter("fallback")}.'
+        )
+    return (
+        analysis_result,
+        np.array(looked_away_indexes, dtype=np.int64),
+        coordinates,
+        best_frames,
+        timings,
+        np.array(frame_indexes, dtype=np.int64),
+        np.array(frame_scores, dtype=np.float32).reshape(-1, len(EMOTION_LABELS)),
     )
-    i = 0
-    validationErrorsEncountered = 0
-    for i in range(len(frames)):
-        emotions = list()
-        try:
-            emotions = FrameAnalyzer.analyze_frame(
-                frames[i],
-                brows_predictor,
-                eye_predictor
-            )
-        except Exception:
-            looked_away += 1
-        if i % 100 == 0:
-            print(f'[INFO] Thread number {thread}: processed {i} frames.')
-        for emotion in emotions:
-            try:
-                emotion_model = EmotionalReport.model_validate(emotion)
-                if Emotions(emotion_model.dominant_emotion) not in \
-                        analysis_result.keys():
-                    analysis_result[
-                        Emotions(emotion_model.dominant_emotion)
-                    ] = 0
-                    best_confidence[
-                        Emotions(emotion_model.dominant_emotion)
-                    ] = -1
-                if best_confidence[Emotions(emotion_model.dominant_emotion)] < \
-                        emotion_model.face_confidence:
-                    best_performance_frame[
-                        Emotions(emotion_model.dominant_emotion)
-                    ] = frames[i]
-                    best_confidence[
-                        Emotions(emotion_model.dominant_emotion)
-                    ] = emotion_model.face_confidence
-                analysis_result[Emotions(emotion_model.dominant_emotion)] += 1
-                coordinates.append(
-                    (
-                        i,
-                        EMOTIONS_GRAPH_INTERPRETATION[
-                            Emotions(emotion_model.dominant_emotion)
-                        ]
-                    )
-                )
-            except ValidationError:
-                validationErrorsEncountered += 1
-                try:
-                    dominant = emotion['dominant_emotion']
-                    if Emotions(dominant) not in \
-                            analysis_result.keys():
-                        analysis_result[Emotions(dominant)] = 0
-                        best_confidence[Emotions(dominant)] = -1
-                    analysis_result[Emotions(dominant)] += 1
-                    coordinates.append(
-                        (
-                            i,
-                            EMOTIONS_GRAPH_INTERPRETATION[
-                                Emotions(dominant)
-                            ]
-                        )
-                    )
-                except KeyError:
-                    continue
-        i += 1
-    print(
-        f'[INFO] Thread {thread} finished working. '
-        f'Validation errors encountered: {validationErrorsEncountered}'
+
+
+def score_vector(result: FrameResult) -> Tuple[float, ...]:
+    """Scores of the result, or all-in on the dominant emotion if unknown."""
+    if result.scores is not None:
+        return result.scores
+    return tuple(
+        100.0 if label == result.dominant_emotion else 0.0
+        for label in EMOTION_LABELS
     )
-    return analysis_result, looked_away, coordinates, best_performance_frame
 
 
 def generate_textual_report_from_result_dictionary(
         result: dict[Emotions, int],
         looked_away: int,
         overall_frames_amount: int,
+        thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
 ) -> None:
     """
     Following the gathered results, provide textual output on emotional state.
@@ -283,6 +532,13 @@ def generate_textual_report_from_result_dictionary(
         f'[INFO] Person also looked away {looked_away} times, which is '
         f'{looked_away_percentage}% of the time.'
     )
+    takeaways = get_textual_takeaways_on_emotional_state(
+        sorted_percentages,
+        looked_away_percentage,
+        thresholds,
+    )
+    if takeaways != '':
+        print(f'[INFO] Key takeaways: {takeaways}.')
     print('[INFO] For more detailed response go through the pdf report.')
 
 
@@ -291,8 +547,9 @@ def generate_latex_report_from_result_dictionary(
         looked_away: int,
         overall_frames_amount: int,
         coordinates: list[Tuple[int, float]],
-        best_performance_frames: dict,
+        best_performance_frames: dict[Emotions, list[bytes]],
         filedest: str = None,
+        thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
 ) -> None:
     """
     Following the gathered results, provide file output on emotional state.
@@ -338,6 +595,7 @@ def generate_latex_report_from_result_dictionary(
         takeaways = get_textual_takeaways_on_emotional_state(
             sorted_percentages,
             looked_away_percentage,
+            thresholds,
         )
         if takeaways == '':
             document.append('there were no outliars in the video.')
@@ -354,23 +612,272 @@ def generate_latex_report_from_result_dictionary(
             plot_options = 'height=25cm, width=20cm'
             with document.create(Axis(options=plot_options)) as plot:
                 plot.append(Plot(name='emotional report', coordinates=coordinates))
+    filepath = 'emotional_report' if filedest is None else filedest
     with document.create(Section('Frame examples with discovered emotions')):
         document.append('Below are the examples of emotions, discovered in the video.')
         document.append('Some emotions are not present - that occures when that emotion was not detected on any frame.')
         for emotion in best_performance_frames.keys():
             for i in range(len(best_performance_frames[emotion])):
                 with document.create(Figure()) as picture:
-                    cv2.imwrite(f'{emotion}-{i}.jpg', best_performance_frames[emotion][i])
-                    picture.add_image(f'{emotion}-{i}.jpg', width='500px')
+                    image_path = os.path.abspath(f'{filepath}-{emotion}-{i}.jpg')
+                    with open(image_path, 'wb') as thumbnail:
+                        thumbnail.write(best_performance_frames[emotion][i])
+                    picture.add_image(image_path, width='500px')
                     picture.add_caption(f'Discovered emotion: {emotion}')
 
     document.generate_pdf(
-        filepath='emotional_report' if filedest is None else filedest,
+        filepath=filepath,
         clean_tex=False,
         compiler='pdflatex',
     )
 
 
+def generate_html_report_from_result_dictionary(
+        result: dict[Emotions, int],
+        looked_away: int,
+        overall_frames_amount: int,
+        coordinates: list[Tuple[int, float]],
+        best_performance_frames: dict[Emotions, list[bytes]],
+        filedest: str = None,
+        thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
+) -> str:
+    """
+    Following the gathered results, provide html output on emotional state.
+
+    Unlike the latex report, the file is rendered without external tools:
+    1. The timeline is downsampled to a bounded amount of points.
+    2. The graph is drawn as an inline SVG polyline.
+    3. Frame examples are embedded as base64 encoded thumbnails.
+    """
+    overall_labeled_frames_amount = 0
+    for emotion in result.keys():
+        overall_labeled_frames_amount += result[emotion]
+    emotions_percentages: dict[Emotions, float] = dict()
+    for emotion in result.keys():
+        emotions_percentages[emotion] = result[emotion] / \
+            overall_labeled_frames_amount * 100
+    sorted_percentages = {
+        key: value for key, value in sorted(
+            emotions_percentages.items(),
+            key=lambda item: -item[1]
+        )
+    }
+    looked_away_percentage = round(
+        looked_away / overall_frames_amount * 100,
+        2
+    )
+    takeaways = get_textual_takeaways_on_emotional_state(
+        sorted_percentages,
+        looked_away_percentage,
+        thresholds,
+    )
+    timeline = downsample_min_max(coordinates, TIMELINE_MAX_POINTS)
+    width = max(overall_frames_amount, timeline[-1][0] + 1 if timeline else 1)
+    points = ' '.join(
+        f'{x / width * GRAPH_WIDTH:.1f},{(1.0 - y) / 2 * GRAPH_HEIGHT:.1f}'
+        for x, y in timeline
+    )
+    body = list()
+    body.append('<h1>Emotions recorded</h1>')
+    body.append(
+        '<p>Emotions encountered on the video '
+        '(from the most popular to the least popular):</p><ul>'
+    )
+    for emotion, percentage in sorted_percentages.items():
+        body.append(
+            f'<li>Emotion "{html.escape(emotion)}" was present on '
+            f'{round(percentage, 2)}% of labeled frames.</li>'
+        )
+    body.append('</ul>')
+    body.append('<h1>Looked away occurances</h1>')
+    body.append(
+        f'<p>Person looked away {looked_away} times, which is '
+        f'{looked_away_percentage}% of the time.</p>'
+    )
+    body.append('<h1>Key takeaways from the video</h1>')
+    body.append('<p>These are the main takeaways from the given parameters:</p>')
+    body.append(
+        '<p>there were no outliars in the video.</p>' if takeaways == '' else
+        f'<p>{html.escape(takeaways).replace(chr(10), "<br>")}</p>'
+    )
+    body.append('<h1>Graphical appearance</h1>')
+    body.append('<p>There are the following marks for each emotion:</p><ul>')
+    for emotion, value in EMOTIONS_GRAPH_INTERPRETATION.items():
+        body.append(f'<li>Emotion "{emotion}" level: {value}.</li>')
+    body.append('</ul>')
+    body.append(
+        f'<svg width="{GRAPH_WIDTH}" height="{GRAPH_HEIGHT}" '
+        f'viewBox="0 0 {GRAPH_WIDTH} {GRAPH_HEIGHT}" '
+        'style="border:1px solid #ccc">'
+        f'<line x1="0" y1="{GRAPH_HEIGHT / 2}" x2="{GRAPH_WIDTH}" '
+        f'y2="{GRAPH_HEIGHT / 2}" stroke="#ccc"/>'
+        f'<polyline fill="none" stroke="#1f77b4" points="{points}"/></svg>'
+    )
+    body.append('<h1>Frame examples with discovered emotions</h1>')
+    body.append(
+        '<p>Below are the examples of emotions, discovered in the video. '
+        'Some emotions are not present - that occures when that emotion '
+        'was not detected on any frame.</p>'
+    )
+    for emotion in best_performance_frames.keys():
+        for thumbnail in best_performance_frames[emotion]:
+            encoded = base64.b64encode(thumbnail).decode('ascii')
+            body.append(
+                f'<figure><img src="data:image/jpeg;base64,{encoded}"/>'
+                f'<figcaption>Discovered emotion: {emotion}</figcaption></figure>'
+            )
+    filepath = ('emotional_report' if filedest is None else filedest) + '.html'
+    with open(filepath, 'w', encoding='utf-8') as file:
+        file.write(
+            '<!DOCTYPE html><html><head><meta charset="utf-8">'
+            '<title>Emotional report</title></head><body>'
+            + '\n'.join(body) +
+            '</body></html>'
+        )
+    return filepath
+
+
+def generate_report_from_result_dictionary(
+        result: dict[Emotions, int],
+        looked_away: int,
+        overall_frames_amount: int,
+        coordinates: list[Tuple[int, float]],
+        best_performance_frames: dict[Emotions, list[bytes]],
+        filedest: str = None,
+        report_format: str = DEFAULT_REPORT_FORMAT,
+        thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
+) -> str:
+    """Generate the file report of the requested format, return its path."""
+    if report_format == 'html':
+        return generate_html_report_from_result_dictionary(
+            result,
+            looked_away,
+            overall_frames_amount,
+            coordinates,
+            best_performance_frames,
+            filedest,
+            thresholds,
+        )
+    generate_latex_report_from_result_dictionary(
+        result,
+        looked_away,
+        overall_frames_amount,
+        coordinates,
+        best_performance_frames,
+        filedest,
+        thresholds,
+    )
+    return ('emotional_report' if filedest is None else filedest) + '.pdf'
+
+
+def validate_smoothing(method: str, window: str) -> Tuple[bool, str]:
+    """Smoothing method is empty or a known one, window is a positive integer."""
+    if method != '' and method not in SMOOTHING_METHODS:
+        return (
+            False,
+            'Smoothing is expected to be one of: '
+            f'{", ".join(SMOOTHING_METHODS)}.'
+        )
+    if window != '' and (not window.isdigit() or int(window) == 0):
+        return (
+            False,
+            'Smoothing window is expected to be a positive integer.'
+        )
+    return (True, '')
+
+
+def validate_distributed_input(
+        local_workers: str,
+        chunk_frames: str,
+) -> Tuple[bool, str]:
+    """Amounts of local workers and of frames per chunk are empty or integers."""
+    if local_workers != '' and not local_workers.isdigit():
+        return (
+            False,
+            'Local workers amount is expected to be a non-negative integer.'
+        )
+    if chunk_frames != '' and (not chunk_frames.isdigit() or int(chunk_frames) == 0):
+        return (
+            False,
+            'Chunk size is expected to be a positive integer of frames.'
+        )
+    return (True, '')
+
+
+def validate_estimation(tolerance: str, confidence: str) -> Tuple[bool, str]:
+    """Tolerance is a positive amount of percentage points, confidence is within (0, 1)."""
+    try:
+        if tolerance != '' and float(tolerance) <= 0:
+            raise ValueError
+    except ValueError:
+        return (
+            False,
+            'Estimation tolerance is expected to be a positive amount of percentage points.'
+        )
+    try:
+        if confidence != '' and not 0 < float(confidence) < 1:
+            raise ValueError
+    except ValueError:
+        return (
+            False,
+            'Confidence level is expected to be a number between 0 and 1.'
+        )
+    return (True, '')
+
+
+def parse_segments(segments: str) -> list[Tuple[float, Optional[float]]]:
+    """
+    Parse comma separated segments of the video in seconds.
+
+    Each segment is "start-end", either of them may be omitted
+    for the start or the end of the video, e.g. "-30,95.5-120,600-".
+    Raises ValueError on malformed segments.
+    """
+    parsed: list[Tuple[float, Optional[float]]] = list()
+    for segment in segments.split(','):
+        start, separator, end = segment.strip().partition('-')
+        if separator == '':
+            raise ValueError(f'Segment "{segment}" is expected as start-end.')
+        parsed.append((
+            float(start) if start.strip() else 0.0,
+            float(end) if end.strip() else None,
+        ))
+    valid, message = validate_segments(parsed)
+    if not valid:
+        raise ValueError(message)
+    return parsed
+
+
+def validate_segments(
+        segments: list[Tuple[float, Optional[float]]],
+) -> Tuple[bool, str]:
+    """Segments start at non-negative seconds and end after they start."""
+    for start, end in segments:
+        if start < 0 or (end is not None and end <= start):
+            return (
+                False,
+                'Segments are expected to start at non-negative seconds '
+                'and end after they start.'
+            )
+    return (True, '')
+
+
+def read_report_thresholds(path: str) -> ReportThresholds:
+    """Read the thresholds from the JSON file, missing ones are default."""
+    with open(path, 'r') as file:
+        return ReportThresholds.model_validate_json(file.read())
+
+
+def validate_report_format(report_format: str) -> Tuple[bool, str]:
+    """Report format is either empty (default is used) or a known one."""
+    if report_format != '' and report_format not in REPORT_FORMATS:
+        return (
+            False,
+            f'Report format is expected to be one of: {", ".join(REPORT_FORMATS)}.'
+        )
+    return (True, '')
+
+
 def get_percentages_from_results(
         result: dict[Emotions, int],
         looked_away: int,
@@ -413,15 +920,39 @@ def get_percentages_from_results(
     return result_percentages
 
 
+def get_takeaways_from_results(
+        result: dict[Emotions, int],
+        looked_away: int,
+        overall_frames_amount: int,
+        thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
+) -> str:
+    """Get textual takeaways based on provided parameters."""
+    overall_labeled_frames_amount = sum(result.values())
+    emotions_percentages: dict[Emotions, float] = {
+        emotion: amount / overall_labeled_frames_amount * 100
+        for emotion, amount in result.items()
+    }
+    looked_away_percentage = round(
+        looked_away / max(overall_frames_amount, 1) * 100,
+        2
+    )
+    return get_textual_takeaways_on_emotional_state(
+        emotions_percentages,
+        looked_away_percentage,
+        thresholds,
+    )
+
+
 def get_textual_takeaways_on_emotional_state(
         emotions_percentages: dict[Emotions, float],
         looked_away_percentage: float,
+        thresholds: ReportThresholds = DEFAULT_REPORT_THRESHOLDS,
 ) -> str:
     takeaways = list()
-    if looked_away_percentage >= LOOKED_AWAY_THRESHOLD:
+    if looked_away_percentage >= thresholds.looked_away:
         takeaway = 'The person looked away quite often'
         if Emotions.FEAR in emotions_percentages.keys():
-            if emotions_percentages[Emotions.FEAR] >= FEAR_THRESHOLD:
+            if emotions_percentages[Emotions.FEAR] >= thresholds.fear:
                 takeaway += (
                     ', which combined with the fact, that fear emotion was displayed, may '
                     'signal that the person is worried or is feeling endangered. '
@@ -429,7 +960,7 @@ def get_textual_takeaways_on_emotional_state(
                     'and ensure ones safety'
                 )
         if Emotions.HAPPY in emotions_percentages.keys():
-            if emotions_percentages[Emotions.HAPPY] >= HAPPY_THRESHOLD:
+            if emotions_percentages[Emotions.HAPPY] >= thresholds.happy:
                 takeaway += (
                     ', at the same time, happiness emotion was seen a lot, '
                     'so a conclusion may be drawn, that the person is feeling '
@@ -444,7 +975,7 @@ def get_textual_takeaways_on_emotional_state(
     if Emotions.HAPPY in emotions_percentages.keys() \
             and Emotions.SAD in emotions_percentages.keys():
         if abs(emotions_percentages[Emotions.HAPPY] - emotions_percentages[Emotions.SAD]) < \
-                HAPPY_TO_SAD_DIFFERENCE_THRESHOLD:
+                thresholds.happy_to_sad_difference:
             takeaway = (
                 'Throughout the video, the person displayed mixed emotions, as '
                 'sadness is somewhat close to happiness in terms of occurances'
@@ -453,7 +984,7 @@ def get_textual_takeaways_on_emotional_state(
     if Emotions.HAPPY in emotions_percentages.keys() \
             and Emotions.ANGRY in emotions_percentages.keys():
         if abs(emotions_percentages[Emotions.HAPPY] - emotions_percentages[Emotions.ANGRY]) < \
-                HAPPY_TO_ANGRY_DIFFERENCE_THRESHOLD:
+                thresholds.happy_to_angry_difference:
             takeaway = (
                 'The person was showing mixed emotions in terms of the mood, '
                 'as anger was mixed with the happiness. That may be tied '
@@ -463,7 +994,7 @@ def get_textual_takeaways_on_emotional_state(
     if Emotions.NEUTRAL in emotions_percentages.keys() and \
             Emotions.SURPRISE in emotions_percentages.keys():
         if abs(emotions_percentages[Emotions.NEUTRAL] - emotions_percentages[Emotions.SURPRISE]) < \
-                NEUTRAL_TO_SURPRISED_THRESHOLD:
+                thresholds.neutral_to_surprised:
             takeaway = (
                 'In terms of neutral appearance, it was seldom mixed with '
                 'suprised state, which outlines that the person is either curious, '
@@ -471,14 +1002,14 @@ def get_textual_takeaways_on_emotional_state(
             )
             takeaways.append(takeaway)
     if emotions_percentages.get(Emotions.ANGRY, 0.0) + \
-            emotions_percentages.get(Emotions.DISGUST, 0.0) >= DISGUST_ANGRY_THRESHOLD:
+            emotions_percentages.get(Emotions.DISGUST, 0.0) >= thresholds.disgust_angry:
         takeaway = (
             'Anger and disgust emotions were recorded '
             'for a substantial amount of time, which might be a signal '
             'to person being heavily disstressed or irritated'
         )
         takeaways.append(takeaway)
-    if emotions_percentages.get(Emotions.SAD, 0.0) > SAD_THRESHOLD:
+    if emotions_percentages.get(Emotions.SAD, 0.0) > thresholds.sad:
         takeaway = (
             'Sadness was displayed on a big chunk of the video. '
             'With that being said, it is highly recomended to approach '
@@ -0,0 +1,12 @@
+import os
+import sys
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules are imported from the root of the repository, as by the
+# command line tools, and the API modules from their own directory,
+# as the service runs them.
+for path in (ROOT_DIRECTORY, os.path.join(ROOT_DIRECTORY, 'app', 'fast_api_addin')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,113 @@
+import os
+import time
+import numpy as np
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.best_frames import BestFramesTracker
+from app.utils.checkpoints import (
+    chunk_bounds,
+    remove_expired_checkpoints,
+    ChunkCheckpoints,
+    ChunkResult,
+)
+
+
+def worker_result(analyzed: list[int], looked_away: list[int]) -> tuple:
+    """Result of one thread, as analyze_shared_frames returns it."""
+    labels = [index % len(EMOTION_LABELS) for index in analyzed]
+    best_frames = BestFramesTracker()
+    for index, label in zip(analyzed, labels):
+        best_frames.add_candidate(EMOTION_LABELS[label], index / 100, index, bytes([index]))
+    occurances = dict()
+    for label in labels:
+        occurances[EMOTION_LABELS[label]] = occurances.get(EMOTION_LABELS[label], 0) + 1
+    return (
+        occurances,
+        np.array(looked_away, dtype=np.int64),
+        [(index, float(label)) for index, label in zip(analyzed, labels)],
+        best_frames,
+        None,
+        np.array(analyzed, dtype=np.int64),
+        np.eye(len(EMOTION_LABELS), dtype=np.float32)[labels] * 100,
+    )
+
+
+def chunk_result() -> ChunkResult:
+    return ChunkResult.from_worker_results([
+        worker_result([10, 12, 14], [11]),
+        worker_result([13, 15], [16, 17]),
+    ])
+
+
+def assert_same_chunks(loaded: ChunkResult, expected: ChunkResult) -> None:
+    assert loaded.emotions_occurances == expected.emotions_occurances
+    assert loaded.looked_away == expected.looked_away
+    np.testing.assert_array_equal(loaded.looked_away_indexes, expected.looked_away_indexes)
+    assert loaded.coordinates == expected.coordinates
+    assert sorted(loaded.best_frames.candidates()) == sorted(expected.best_frames.candidates())
+    np.testing.assert_array_equal(loaded.frame_indexes, expected.frame_indexes)
+    np.testing.assert_array_equal(loaded.scores, expected.scores)
+
+
+def test_chunk_bounds_cover_the_frames():
+    assert chunk_bounds(7, 3) == [(0, 3), (3, 6), (6, 7)]
+    assert chunk_bounds(0, 3) == []
+
+
+def test_worker_results_are_merged():
+    result = chunk_result()
+    assert result.looked_away == 3
+    assert sum(result.emotions_occurances.values()) == 5
+    assert [index for index, _ in result.coordinates] == [10, 12, 13, 14, 15]
+
+
+def test_chunk_is_saved_and_loaded(tmp_path):
+    result = chunk_result()
+    path = str(tmp_path / 'chunk.npz')
+    result.save(path)
+    assert_same_chunks(ChunkResult.load(path), result)
+    assert_same_chunks(ChunkResult.from_bytes(result.to_bytes()), result)
+
+
+def test_restricted_counts_only_the_frames_read_as_looked_away():
+    part = chunk_result().restricted(11, 20)
+    assert sorted(part.frame_indexes.tolist()) == [12, 13, 14, 15]
+    # Frames 18 and 19 were never read, they are not looked away.
+    assert part.looked_away_indexes.tolist() == [11, 16, 17]
+    assert sum(part.emotions_occurances.values()) == 4
+    assert {candidate[2] for candidate in part.best_frames.candidates()} <= {12, 13, 14, 15}
+
+
+def test_checkpoints_find_the_saved_chunks_and_ranges(tmp_path):
+    checkpoints = ChunkCheckpoints('key', str(tmp_path))
+    assert checkpoints.load(0) is None
+    checkpoints.save(0, chunk_result())
+    checkpoints.save((20, 35), chunk_result())
+    assert checkpoints.completed(0)
+    assert checkpoints.stored_ranges() == [(20, 35)]
+    assert_same_chunks(checkpoints.load((20, 35)), chunk_result())
+    checkpoints.clear()
+    assert not checkpoints.completed(0)
+
+
+def test_unreadable_chunk_is_analyzed_again(tmp_path):
+    checkpoints = ChunkCheckpoints('key', str(tmp_path))
+    checkpoints.save(1, chunk_result())
+    with open(os.path.join(tmp_path, 'key', 'chunk-000001.npz'), 'wb') as file:
+        file.write(b'broken')
+    assert checkpoints.load(1) is None
+
+
+def test_unused_checkpoints_expire(tmp_path):
+    old = ChunkCheckpoints('old', str(tmp_path))
+    old.save(0, chunk_result())
+    recent = ChunkCheckpoints('recent', str(tmp_path))
+    recent.save(0, chunk_result())
+    expired = time.time() - 3 * 24 * 60 * 60
+    for key in ('old', 'recent'):
+        os.utime(os.path.join(tmp_path, key), (expired, expired))
+    recent.touch()
+    (tmp_path / 'worker_footprints.json').write_text('{}')
+    assert remove_expired_checkpoints(str(tmp_path), retention_days=2) == 1
+    assert not old.completed(0)
+    assert recent.completed(0)
+    assert (tmp_path / 'worker_footprints.json').exists()
@@ -0,0 +1,86 @@
+from time import sleep
+import numpy as np
+import pytest
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.best_frames import BestFramesTracker
+from app.utils.checkpoints import ChunkResult
+from app.utils.chunk_queue import ChunkQueue, MAX_CHUNK_ATTEMPTS
+
+
+def empty_result(looked_away: list[int]) -> ChunkResult:
+    return ChunkResult(
+        dict(),
+        np.array(looked_away, dtype=np.int64),
+        list(),
+        BestFramesTracker(),
+        np.zeros(0, dtype=np.int64),
+        np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32),
+    )
+
+
+def make_queue(tmp_path, lease_seconds: float = 60.0) -> ChunkQueue:
+    return ChunkQueue(f'sqlite:///{tmp_path / "queue.db"}', lease_seconds)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.publish('job', '/videos/video.mp4', 25, 10, 'onnx', 'yunet', 'pyav', True, 640)
+    return queue
+
+
+def test_published_job_keeps_its_configuration(queue):
+    job = queue.job('job')
+    assert (job.frames_amount, job.chunk_frames) == (25, 10)
+    assert (job.inference_backend, job.face_detector) == ('onnx', 'yunet')
+    assert (job.video_decoder, job.decode_grayscale, job.decode_max_side) == ('pyav', True, 640)
+    assert queue.progress('job') == {'pending': 3}
+
+
+def test_chunks_are_leased_once_in_order(queue):
+    leases = [queue.lease(f'worker-{i}') for i in range(4)]
+    assert [lease.chunk for lease in leases[:3]] == [0, 1, 2]
+    assert [(lease.start, lease.end) for lease in leases[:3]] == [(0, 10), (10, 20), (20, 25)]
+    assert leases[3] is None
+    assert queue.progress('job') == {'leased': 3}
+
+
+def test_completed_chunks_are_read_once(queue):
+    lease = queue.lease('worker')
+    assert queue.complete(lease, empty_result([3, 4]))
+    results = queue.results('job')
+    assert list(results) == [0]
+    assert results[0].looked_away_indexes.tolist() == [3, 4]
+    assert queue.results('job', {0}) == dict()
+    assert queue.unfinished_amount() == 2
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.0)
+    queue.publish('job', '/videos/video.mp4', 5, 10)
+    stale = queue.lease('dead-worker')
+    sleep(0.01)
+    taken = queue.lease('live-worker')
+    assert taken.chunk == stale.chunk
+    assert not queue.renew(stale)
+    assert not queue.complete(stale, empty_result([]))
+    assert queue.complete(taken, empty_result([]))
+
+
+def test_released_chunk_fails_after_too_many_attempts(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.publish('job', '/videos/video.mp4', 5, 10)
+    for _ in range(MAX_CHUNK_ATTEMPTS):
+        queue.release(queue.lease('worker'))
+    assert queue.lease('worker') is None
+    assert queue.progress('job') == {'failed': 1}
+    queue.publish('job', '/videos/video.mp4', 5, 10)
+    assert queue.progress('job') == {'pending': 1}
+
+
+def test_removed_job_is_analyzed_again(queue):
+    queue.complete(queue.lease('worker'), empty_result([]))
+    queue.remove('job')
+    assert queue.job('job') is None
+    queue.publish('job', '/videos/video.mp4', 25, 10)
+    assert queue.progress('job') == {'pending': 3}
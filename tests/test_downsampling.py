@@ -0,0 +1,26 @@
+import numpy as np
+from app.utils.downsampling import downsample_min_max
+
+
+def test_short_timeline_is_kept():
+    coordinates = [(0, 1.0), (3, 2.0), (5, 0.5)]
+    assert downsample_min_max(coordinates, 10) == coordinates
+
+
+def test_timeline_is_reduced_to_the_maximum_points_in_order():
+    values = np.random.default_rng(0).random(10000)
+    coordinates = [(i * 2, float(value)) for i, value in enumerate(values)]
+    downsampled = downsample_min_max(coordinates, 500)
+    assert len(downsampled) <= 500
+    indexes = [index for index, _ in downsampled]
+    assert indexes == sorted(set(indexes))
+    assert set(downsampled) <= set(coordinates)
+
+
+def test_spikes_are_kept():
+    coordinates = [(i, 0.0) for i in range(1000)]
+    coordinates[123] = (123, 5.0)
+    coordinates[777] = (777, -5.0)
+    downsampled = downsample_min_max(coordinates, 20)
+    assert (123, 5.0) in downsampled
+    assert (777, -5.0) in downsampled
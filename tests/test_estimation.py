@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.estimation import (
+    estimate_percentages,
+    stratified_rounds,
+    LOOKED_AWAY_KEY,
+)
+
+
+def one_hot(labels: np.ndarray) -> np.ndarray:
+    return np.eye(len(EMOTION_LABELS), dtype=np.float32)[labels] * 100
+
+
+def test_rounds_cover_every_frame_once():
+    rounds = list(stratified_rounds(1003, 10, 100, seed=1))
+    frames = np.concatenate(rounds)
+    assert len(frames) == 1003
+    assert len(np.unique(frames)) == 1003
+    assert all((np.diff(frames_round) > 0).all() for frames_round in rounds)
+
+
+def test_every_round_samples_every_stratum():
+    first = next(stratified_rounds(1000, 10, 100, seed=2))
+    assert np.bincount(first // 100, minlength=10).tolist() == [10] * 10
+
+
+def test_full_sample_gives_the_exact_percentages():
+    frames_amount = 400
+    frame_indexes = np.arange(0, frames_amount, 2)
+    labels = np.where(frame_indexes < 100, 3, 6)
+    estimate = estimate_percentages(
+        np.arange(frames_amount),
+        frame_indexes,
+        one_hot(labels),
+        frames_amount,
+        strata_amount=4,
+    )
+    assert estimate.sampled_frames == frames_amount
+    assert estimate.percentages[LOOKED_AWAY_KEY] == pytest.approx(50.0)
+    assert estimate.percentages[str(EMOTION_LABELS[3])] == pytest.approx(25.0)
+    assert estimate.percentages[str(EMOTION_LABELS[6])] == pytest.approx(75.0)
+    assert estimate.max_error == pytest.approx(0.0)
+    assert estimate.within(0.0)
+
+
+def test_strata_are_weighted_by_their_share_of_the_video():
+    frames_amount = 1000
+    # The first stratum is sampled four times as densely as the second,
+    # its frames all show the same emotion.
+    sampled = np.concatenate([np.arange(0, 500, 5), np.arange(500, 1000, 20)])
+    labels = np.where(sampled < 500, 0, 1)
+    estimate = estimate_percentages(sampled, sampled, one_hot(labels), frames_amount, 2)
+    assert estimate.percentages[str(EMOTION_LABELS[0])] == pytest.approx(50.0)
+    assert estimate.percentages[str(EMOTION_LABELS[1])] == pytest.approx(50.0)
+    assert estimate.percentages[LOOKED_AWAY_KEY] == pytest.approx(0.0)
+
+
+def test_small_sample_is_not_within_the_tolerance():
+    sampled = np.arange(0, 10000, 500)
+    estimate = estimate_percentages(
+        sampled,
+        sampled,
+        one_hot(np.zeros(len(sampled), dtype=np.int64)),
+        10000,
+    )
+    assert estimate.errors[str(EMOTION_LABELS[0])] > 0
+    assert not estimate.within(5.0)
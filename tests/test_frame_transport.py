@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from app.emotions_measurer.frame_transport import SharedFrameRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing((4, 6, 3), np.uint8, 3)
+    yield ring
+    ring.close()
+
+
+def test_frame_is_read_back_from_its_slot(ring):
+    frame = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+    ring.write(1, frame)
+    np.testing.assert_array_equal(ring.read(1), frame)
+    assert not ring.read(0).any()
+
+
+def test_smaller_frame_is_read_back_with_its_shape(ring):
+    frame = np.full((2, 5), 7, dtype=np.uint8)
+    ring.write(2, frame)
+    np.testing.assert_array_equal(ring.read(2, frame.shape), frame)
+
+
+def test_larger_frame_does_not_fit(ring):
+    assert ring.fits((6, 4, 3))
+    assert not ring.fits((5, 6, 3))
+    with pytest.raises(ValueError):
+        ring.write(0, np.zeros((5, 6, 3), dtype=np.uint8))
+
+
+def test_attached_ring_shares_the_frames(ring):
+    attached = SharedFrameRing.attach(ring.descriptor)
+    try:
+        frame = np.full((4, 6, 3), 9, dtype=np.uint8)
+        ring.write(0, frame)
+        np.testing.assert_array_equal(attached.read(0), frame)
+        assert attached.nbytes == ring.nbytes == 3 * 4 * 6 * 3
+    finally:
+        attached.close()
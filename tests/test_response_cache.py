@@ -0,0 +1,82 @@
+import pytest
+from cache import content_etag, etag_matches, render_cache_metrics, ResponseCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('cache.monotonic', clock)
+    return clock
+
+
+def test_etag_depends_on_the_content():
+    assert content_etag(b'report') == content_etag(b'report')
+    assert content_etag(b'report') != content_etag(b'other report')
+    assert content_etag(b'report').startswith('"')
+
+
+def test_if_none_match_names_the_etag():
+    etag = content_etag(b'report')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_entry_expires_after_the_time_to_live(clock):
+    responses = ResponseCache(ttl_seconds=10.0)
+    responses.put('report', b'content', '"etag"')
+    clock.now += 9.0
+    assert responses.get('report') == (b'content', '"etag"')
+    clock.now += 2.0
+    assert responses.get('report') is None
+    assert len(responses) == 0
+    assert (responses.hits, responses.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_dropped_first(clock):
+    responses = ResponseCache(max_entries=2)
+    responses.put('first', b'1', '"1"')
+    responses.put('second', b'2', '"2"')
+    responses.get('first')
+    responses.put('third', b'3', '"3"')
+    assert responses.get('second') is None
+    assert responses.get('first') is not None
+    assert responses.get('third') is not None
+
+
+def test_entries_are_bounded_by_their_size(clock):
+    responses = ResponseCache(max_bytes=10)
+    responses.put('first', b'12345', '"1"')
+    responses.put('second', b'123456', '"2"')
+    responses.put('large', b'12345678901', '"3"')
+    assert responses.get('first') is None
+    assert responses.get('second') is not None
+    assert responses.get('large') is None
+
+
+def test_invalidated_entry_is_missing(clock):
+    responses = ResponseCache()
+    responses.put('report', b'content', '"etag"')
+    responses.invalidate('report')
+    assert responses.get('report') is None
+
+
+def test_metrics_show_hits_misses_and_entries(clock):
+    responses = ResponseCache()
+    responses.put('report', b'content', '"etag"')
+    responses.get('report')
+    responses.get('missing')
+    metrics = render_cache_metrics({'reports': responses})
+    assert 'emotion_analysis_cache_requests_total{cache="reports",result="hit"} 1' in metrics
+    assert 'emotion_analysis_cache_requests_total{cache="reports",result="miss"} 1' in metrics
+    assert 'emotion_analysis_cache_entries{cache="reports"} 1' in metrics
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from app.emotions_measurer.inference_backends import EMOTION_LABELS
+from app.utils.temporal_smoothing import (
+    emotion_occurances,
+    exponential_moving_average,
+    moving_average,
+    moving_median,
+    smooth_scores,
+    EMA_BLOCK_SIZE,
+)
+
+
+def random_scores(frames_amount: int, seed: int = 0) -> np.ndarray:
+    generator = np.random.default_rng(seed)
+    scores = generator.random((frames_amount, len(EMOTION_LABELS))).astype(np.float32) * 100
+    scores[generator.random(frames_amount) < 0.2] = np.nan
+    return scores
+
+
+def centered_windows(frames_amount: int, window: int):
+    for position in range(frames_amount):
+        yield position, slice(
+            max(0, position - window // 2),
+            min(frames_amount, position + window - window // 2),
+        )
+
+
+def test_moving_average_skips_frames_without_faces():
+    scores = random_scores(200)
+    expected = np.full_like(scores, np.nan)
+    for position, window in centered_windows(len(scores), 7):
+        if not np.isnan(scores[position]).any():
+            expected[position] = np.nanmean(scores[window], axis=0)
+    np.testing.assert_allclose(moving_average(scores, 7), expected, rtol=1e-5)
+
+
+def test_moving_median_skips_frames_without_faces():
+    scores = random_scores(200)
+    expected = np.full_like(scores, np.nan)
+    for position, window in centered_windows(len(scores), 5):
+        if not np.isnan(scores[position]).any():
+            expected[position] = np.nanmedian(scores[window], axis=0)
+    np.testing.assert_allclose(moving_median(scores, 5), expected, rtol=1e-5)
+
+
+def test_exponential_moving_average_matches_the_recursion_across_blocks():
+    scores = random_scores(EMA_BLOCK_SIZE * 2 + 17)
+    scores[0] = np.nan
+    window = 9
+    alpha = 2.0 / (window + 1.0)
+    valid = ~np.isnan(scores).any(axis=1)
+    previous = scores[np.argmax(valid)].astype(np.float64)
+    state = previous
+    expected = np.full_like(scores, np.nan)
+    for position, row in enumerate(scores):
+        if valid[position]:
+            previous = row.astype(np.float64)
+        state = alpha * previous + (1.0 - alpha) * state
+        if valid[position]:
+            expected[position] = state
+    np.testing.assert_allclose(exponential_moving_average(scores, window), expected, rtol=1e-4)
+
+
+def test_window_of_one_frame_keeps_the_scores():
+    scores = random_scores(20)
+    for method in ('none', 'mean', 'ema', 'median'):
+        np.testing.assert_array_equal(smooth_scores(scores, method, 1), scores)
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        smooth_scores(random_scores(5), 'gaussian')
+
+
+def test_occurances_count_the_dominant_emotion_of_analyzed_frames():
+    scores = np.full((4, len(EMOTION_LABELS)), np.nan, dtype=np.float32)
+    scores[0] = np.eye(len(EMOTION_LABELS))[0]
+    scores[1] = np.eye(len(EMOTION_LABELS))[0]
+    scores[3] = np.eye(len(EMOTION_LABELS))[3]
+    assert emotion_occurances(scores) == {EMOTION_LABELS[0]: 2, EMOTION_LABELS[3]: 1}